@@ -9,7 +9,7 @@ Performs various analyses including:
 """
 import logging
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 import os
 import argparse
 
@@ -27,6 +27,10 @@ import seaborn as sns
 from collections import Counter
 
 from config import PROCESSED_DATA_DIR, INTEGRATIONS_DATA
+from fingerprints import (
+    FINGERPRINT_COLUMN, fingerprint_rows, load_previous, log_reuse, previous_values, read_list_cell, row_keys,
+    unchanged_rows
+)
 from utils import setup_logging
 
 # Set up logging
@@ -97,12 +101,20 @@ def clean_integration_name(name: str) -> str:
     # If no mapping found, capitalize properly
     return name.title()
 
-def load_integration_data(csv_path: str) -> pd.DataFrame:
+def load_integration_data(csv_path: str, previous: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     Load and process integration data from CSV file.
+    
+    Rows whose content fingerprint matches their app's row in `previous` (the
+    last processed_apps.csv, see fingerprints.load_previous) keep its
+    integrations instead of being extracted again.
     """
     logger.info(f"Loading data from {csv_path}")
     df = pd.read_csv(csv_path)
+    df[FINGERPRINT_COLUMN] = fingerprint_rows(df)
+    unchanged = unchanged_rows(df, previous)
+    log_reuse("Integration analysis", unchanged)
+    changed = df[~unchanged].copy()
     
     def extract_integrations(details: str) -> List[str]:
         if not isinstance(details, str):
@@ -150,9 +162,6 @@ def load_integration_data(csv_path: str) -> pd.DataFrame:
         
         return list(integrations)
     
-    # Extract integrations from app details
-    df['extracted_integrations'] = df['app_details'].apply(extract_integrations)
-    
     # Parse existing integrations - handle string representation of lists
     def parse_integrations(integrations_str):
         if pd.isna(integrations_str):
@@ -165,23 +174,34 @@ def load_integration_data(csv_path: str) -> pd.DataFrame:
         except:
             return []
             
-    df['existing_integrations'] = df['integrations'].apply(parse_integrations)
-    
-    # Combine and clean integrations
-    df['all_integrations'] = df.apply(
-        lambda row: list(set(row['existing_integrations'] + row['extracted_integrations'])), 
-        axis=1
-    )
-    
-    # Clean integration names
-    df['cleaned_integrations'] = df['all_integrations'].apply(
-        lambda x: [clean_integration_name(i) for i in x if clean_integration_name(i)]
-    )
+    # Only rows changed since the last run go through extraction and cleaning
+    if len(changed):
+        # Extract integrations from app details
+        changed['extracted_integrations'] = changed['app_details'].apply(extract_integrations)
+        changed['existing_integrations'] = changed['integrations'].apply(parse_integrations)
+        
+        # Combine and clean integrations
+        changed['all_integrations'] = changed.apply(
+            lambda row: list(set(row['existing_integrations'] + row['extracted_integrations'])), 
+            axis=1
+        )
+        
+        # Clean integration names
+        changed['cleaned_integrations'] = changed['all_integrations'].apply(
+            lambda x: [clean_integration_name(i) for i in x if clean_integration_name(i)]
+        )
+        
+        # Remove duplicates and empty strings
+        changed['cleaned_integrations'] = changed['cleaned_integrations'].apply(
+            lambda x: list(set(i for i in x if i))
+        )
     
-    # Remove duplicates and empty strings
-    df['cleaned_integrations'] = df['cleaned_integrations'].apply(
-        lambda x: list(set(i for i in x if i))
-    )
+    # Unchanged rows keep the integrations of the last run
+    carried = previous_values(df, previous, unchanged, 'integrations')
+    df['cleaned_integrations'] = [
+        read_list_cell(carried[idx]) if unchanged[idx] else changed.at[idx, 'cleaned_integrations']
+        for idx in df.index
+    ]
     
     # Add integration count
     df['integration_count'] = df['cleaned_integrations'].apply(len)
@@ -189,7 +209,7 @@ def load_integration_data(csv_path: str) -> pd.DataFrame:
     # Create final processed DataFrame
     processed_df = df[[
         'api_key', 'app_name', 'app_store_url', 'app_details',
-        'app_submission_created_at', 'cleaned_integrations', 'integration_count'
+        'app_submission_created_at', 'cleaned_integrations', 'integration_count', FINGERPRINT_COLUMN
     ]].copy()
     
     # Rename column for clarity
@@ -587,16 +607,26 @@ def main():
                       help='Path to input CSV file')
     parser.add_argument('--output-dir', type=str, default='processed_data',
                       help='Directory for output files')
+    parser.add_argument('--full', action='store_true',
+                      help='Reprocess every app, not only those changed since the last run; needed after changing the rules')
     args = parser.parse_args()
     
     # Create output directory if it doesn't exist
     os.makedirs(args.output_dir, exist_ok=True)
     
-    # Load and process data
-    df = load_integration_data(args.input)
+    # Load and process data, reusing the last run's results for unchanged apps
+    processed_path = os.path.join(args.output_dir, 'processed_apps.csv')
+    previous = None if args.full else load_previous(processed_path)
+    df = load_integration_data(args.input, previous)
+    
+    # Nothing changed since the last run: its outputs are still current
+    plot_path = os.path.join(args.output_dir, 'integration_frequencies.png')
+    if (previous is not None and unchanged_rows(df, previous).all()
+            and previous.index.isin(row_keys(df)).all() and os.path.exists(plot_path)):
+        logger.info(f"No app changed since the last run; keeping the outputs in {args.output_dir}")
+        return
     
     # Save processed data
-    processed_path = os.path.join(args.output_dir, 'processed_apps.csv')
     df.to_csv(processed_path, index=False)
     logger.info(f"Saved processed data to {processed_path}")
     
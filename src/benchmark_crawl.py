@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Benchmark the crawlers offline against the mock app store.
+
+Starts mock_app_store.py in a subprocess, routes every apps.shopify.com
+request of scrape_sitemap.collect_apps and scrape_integrations.process_apps
+to it, and reports apps/min, fetch latency percentiles, retries and CPU time
+per page, so concurrency and backoff changes can be measured without
+touching the real store.
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, List
+
+import aiohttp
+import pandas as pd
+from yarl import URL
+
+import scrape_integrations
+import scrape_sitemap
+from csv_sink import CsvSink
+from extractors import LISTING_BODY_LIMIT
+from http_cache import ResponseCache
+from mock_app_store import MockConfig, config_arguments, config_from_args, config_to_argv, mock_name, mock_slug
+from negative_cache import NegativeCache
+from page_archive import PageArchive
+from rate_limit import AdaptiveRateController
+
+logger = logging.getLogger(__name__)
+
+APP_STORE_HOST = 'apps.shopify.com'
+MOCK_SERVER = os.path.join(os.path.dirname(__file__), 'mock_app_store.py')
+STARTUP_TIMEOUT = 10.0
+
+
+class FetchStats:
+    """Client-side request timings and statuses collected through an aiohttp TraceConfig."""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.requests_per_url: Counter = Counter()
+        self.errors = 0
+        self.bytes = 0
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_start(session, ctx, params):
+            ctx.started = time.perf_counter()
+            if params.method == 'GET':
+                self.requests_per_url[str(params.url)] += 1
+
+        async def on_end(session, ctx, params):
+            self.latencies.append(time.perf_counter() - ctx.started)
+            self.statuses[params.response.status] += 1
+            self.bytes += params.response.content_length or 0
+
+        async def on_exception(session, ctx, params):
+            self.errors += 1
+
+        trace.on_request_start.append(on_start)
+        trace.on_request_end.append(on_end)
+        trace.on_request_exception.append(on_exception)
+        return trace
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def retries(self) -> int:
+        """GETs repeated for a URL already requested."""
+        return sum(count - 1 for count in self.requests_per_url.values())
+
+
+def routed_request_class(origin: URL) -> type:
+    """ClientRequest subclass that sends app store requests to `origin` instead."""
+
+    class RoutedRequest(aiohttp.ClientRequest):
+        def __init__(self, method: str, url: URL, *args, **kwargs):
+            if url.host == APP_STORE_HOST:
+                url = url.with_scheme(origin.scheme).with_host(origin.host).with_port(origin.port)
+            super().__init__(method, url, *args, **kwargs)
+
+    return RoutedRequest
+
+
+@contextlib.contextmanager
+def route_to_mock(origin: URL, stats: FetchStats) -> Iterator[None]:
+    """Make every ClientSession created inside the block talk to the mock and report to `stats`."""
+    original_init = aiohttp.ClientSession.__init__
+    request_class = routed_request_class(origin)
+
+    def init(self, *args, **kwargs):
+        kwargs.setdefault('request_class', request_class)
+        kwargs['trace_configs'] = list(kwargs.get('trace_configs') or []) + [stats.trace_config()]
+        original_init(self, *args, **kwargs)
+
+    aiohttp.ClientSession.__init__ = init
+    try:
+        yield
+    finally:
+        aiohttp.ClientSession.__init__ = original_init
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def mock_server(config: MockConfig) -> Iterator[URL]:
+    """Run the mock app store in a subprocess for the duration of the block."""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, MOCK_SERVER, '--port', str(port)] + config_to_argv(config),
+        stdout=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("Mock app store did not start")
+                time.sleep(0.1)
+        yield URL(f'http://127.0.0.1:{port}')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def cpu_seconds() -> float:
+    """CPU time of this process plus finished children, such as parse pool workers."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def configure_crawler(module: Any, args: argparse.Namespace, cache_dir: str) -> None:
+    """Point a scraper module at a fresh cache and the benchmark's pacing settings."""
+    module.CONCURRENT_REQUESTS = args.concurrency
+    module.rate_controller = AdaptiveRateController(args.rate, burst=args.concurrency, max_rate=args.max_rate)
+    module.response_cache = ResponseCache(cache_dir)
+    module.negative_cache = NegativeCache(os.path.join(cache_dir, 'negative.sqlite'))
+    module.listing_body_limit = LISTING_BODY_LIMIT if args.stream_listings else None
+    module.page_archive = PageArchive(os.path.join(cache_dir, 'archive')) if args.archive else None
+
+
+async def run_sitemap_crawl(args: argparse.Namespace, output_dir: str) -> int:
+    configure_crawler(scrape_sitemap, args, os.path.join(output_dir, 'sitemap_cache'))
+    scrape_sitemap.TARGET_APPS_WITH_INTEGRATIONS = args.target
+    with CsvSink(os.path.join(output_dir, 'top_apps_raw.csv')) as sink:
+        return await scrape_sitemap.collect_apps(sink)
+
+
+async def run_integrations_crawl(args: argparse.Namespace, output_dir: str) -> int:
+    configure_crawler(scrape_integrations, args, os.path.join(output_dir, 'integrations_cache'))
+    scrape_integrations.RESOLVE_WORKERS = args.concurrency * 2
+    scrape_integrations.SLUG_MAP_FILE = os.path.join(output_dir, 'slug_map.json')
+    sample = random.Random(args.seed).sample(range(args.num_apps), min(args.sample, args.num_apps))
+    df = pd.DataFrame([{
+        'api_key': mock_slug(i),
+        'app_name': mock_name(i),
+        'app_store_url': f'https://{APP_STORE_HOST}/{mock_slug(i)}'
+    } for i in sample])
+    with CsvSink(os.path.join(output_dir, 'integrations.csv')) as sink:
+        await scrape_integrations.process_apps(df, sink, parallel_probe=args.parallel_probe)
+    found = pd.read_csv(sink.path, usecols=['scrape_success'])
+    return int(found['scrape_success'].sum())
+
+
+def report(name: str, apps: int, elapsed: float, cpu: float, stats: FetchStats, throttles: int) -> Dict[str, Any]:
+    pages = stats.statuses.get(200, 0)
+    result = {
+        'crawler': name,
+        'apps': apps,
+        'seconds': round(elapsed, 2),
+        'apps_per_min': round(apps / elapsed * 60, 1) if elapsed else 0.0,
+        'requests': sum(stats.statuses.values()) + stats.errors,
+        'status_counts': dict(stats.statuses),
+        'transport_errors': stats.errors,
+        'retries': stats.retries,
+        'throttle_events': throttles,
+        'p50_fetch_ms': round(stats.percentile(0.5) * 1000, 1),
+        'p99_fetch_ms': round(stats.percentile(0.99) * 1000, 1),
+        'cpu_ms_per_page': round(cpu / pages * 1000, 2) if pages else 0.0,
+    }
+    print(f"\n{name}:")
+    for key, value in result.items():
+        if key != 'crawler':
+            print(f"  {key:<18}{value}")
+    return result
+
+
+async def benchmark(crawler: str, args: argparse.Namespace, origin: URL, output_dir: str) -> Dict[str, Any]:
+    stats = FetchStats()
+    module, run = (
+        (scrape_sitemap, run_sitemap_crawl) if crawler == 'sitemap'
+        else (scrape_integrations, run_integrations_crawl)
+    )
+    cpu_before = cpu_seconds()
+    started = time.perf_counter()
+    with route_to_mock(origin, stats):
+        apps = await run(args, output_dir)
+    elapsed = time.perf_counter() - started
+    return report(crawler, apps, elapsed, cpu_seconds() - cpu_before, stats, module.rate_controller.throttle_count)
+
+
+async def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description='Benchmark the crawlers against a local mock app store')
+    parser.add_argument('--crawler', choices=['sitemap', 'integrations', 'both'], default='both')
+    parser.add_argument('--target', type=int, default=200, help='Apps with integrations collect_apps stops at')
+    parser.add_argument('--sample', type=int, default=200, help='Apps fed to process_apps')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent requests per crawler')
+    parser.add_argument('--rate', type=float, default=20.0, help='Starting requests per second')
+    parser.add_argument('--max-rate', type=float, default=100.0, help='Ceiling for the adaptive rate')
+    parser.add_argument('--parallel-probe', action='store_true', help='Use parallel probing in process_apps')
+    parser.add_argument('--stream-listings', action='store_true', help='Stop reading listing pages at the reviews section')
+    parser.add_argument('--archive', action='store_true', help='Also keep every fetched page in a WARC page archive')
+    parser.add_argument('--verbose', action='store_true', help='Keep the crawlers\' INFO logging')
+    config_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    config = config_from_args(args)
+    crawlers = ['sitemap', 'integrations'] if args.crawler == 'both' else [args.crawler]
+    print(f"Mock store: {config}")
+    with tempfile.TemporaryDirectory() as output_dir, mock_server(config) as origin:
+        for crawler in crawlers:
+            await benchmark(crawler, args, origin, output_dir)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark the app page parsers on a saved listing page.
+
+Checks that the BeautifulSoup and lxml paths produce the same record on the
+benchmark page and on the fixtures with a "Works with" section, well-formed
+and tag soup, then reports pages/sec and peak memory for each. Every parser
+runs in its own freshly spawned process so one path's peak RSS does not hide
+the other's.
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+from extractors import parse_app_info, parse_app_info_lxml
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_FIXTURE = os.path.join(ROOT_DIR, 'app_page.html')
+# Pages both parsers must agree on, including their integrations
+EQUIVALENCE_FIXTURES = sorted(glob.glob(os.path.join(ROOT_DIR, 'fixtures', '*.html')))
+
+PARSERS = {
+    'beautifulsoup': parse_app_info,
+    'lxml': parse_app_info_lxml,
+}
+
+# Clock-dependent fields that legitimately differ between two parses
+VOLATILE_FIELDS = ('app_submission_created_at',)
+
+
+def run_parser_benchmark(name: str, html: bytes, url: str, iterations: int) -> Dict[str, float]:
+    """Time one parser over `iterations` pages; meant to run in a fresh process."""
+    parse = PARSERS[name]
+    parse(html, url)  # Warm up imports and compiled patterns
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        parse(html, url)
+    elapsed = time.perf_counter() - start
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'pages_per_sec': iterations / elapsed,
+        'ms_per_page': elapsed / iterations * 1000,
+        'peak_rss_mb': rss_after / 1024,  # ru_maxrss is in KB on Linux
+        'parse_rss_mb': (rss_after - rss_before) / 1024,
+    }
+
+
+def check_identical(html: bytes, url: str) -> bool:
+    """Compare the records both parsers produce for one page."""
+    records = {}
+    for name, parse in PARSERS.items():
+        record = parse(html, url)
+        if record:
+            for field in VOLATILE_FIELDS:
+                record.pop(field, None)
+        records[name] = record
+
+    reference = records['beautifulsoup']
+    identical = True
+    for name, record in records.items():
+        if record != reference:
+            identical = False
+            print(f"MISMATCH {name}: {record}")
+    print(f"Reference record: {reference}")
+    return identical
+
+
+def check_fixtures(paths: List[str], url: str) -> bool:
+    """Compare both parsers on every page in `paths`."""
+    identical = True
+    for path in paths:
+        with open(path, 'rb') as f:
+            html = f.read()
+        print(f"Checking {os.path.relpath(path, ROOT_DIR)}")
+        identical = check_identical(html, url) and identical
+    return identical
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description='Benchmark app page parsers')
+    parser.add_argument('--fixture', default=DEFAULT_FIXTURE, help='Saved app page to parse')
+    parser.add_argument('--url', default='https://apps.shopify.com/linkpop', help='URL to attribute the page to')
+    parser.add_argument('--iterations', type=int, default=50, help='Pages to parse per parser')
+    args = parser.parse_args()
+
+    if not check_fixtures([args.fixture] + EQUIVALENCE_FIXTURES, args.url):
+        raise SystemExit("Parsers disagree on the fixtures")
+    print("Outputs identical")
+
+    with open(args.fixture, 'rb') as f:
+        html = f.read()
+    print(f"\nFixture: {args.fixture} ({len(html) / 1024:.0f} KB), {args.iterations} iterations")
+
+    # Spawned rather than forked, so a child does not start out with the
+    # memory this process used checking the fixtures
+    spawn = multiprocessing.get_context('spawn')
+    results = {}
+    for name in PARSERS:
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            results[name] = executor.submit(run_parser_benchmark, name, html, args.url, args.iterations).result()
+
+    print(f"\n{'parser':<15}{'pages/sec':>12}{'ms/page':>10}{'peak RSS MB':>14}{'parse RSS MB':>14}")
+    for name, result in results.items():
+        print(
+            f"{name:<15}{result['pages_per_sec']:>12.1f}{result['ms_per_page']:>10.2f}"
+            f"{result['peak_rss_mb']:>14.1f}{result['parse_rss_mb']:>14.1f}"
+        )
+    speedup = results['lxml']['pages_per_sec'] / results['beautifulsoup']['pages_per_sec']
+    print(f"\nlxml speedup: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Durable, shared work queue for sharded crawls.
+
+A SQLite database (on a shared filesystem if workers run on several
+machines) holds every listing URL to crawl. Workers lease URLs for a limited
+time and renew their leases while they are alive; a lease that is not renewed
+expires and its URL goes back to the queue, so a crashed worker's URLs are
+picked up by the others. Finished URLs keep their outcome and, for apps with
+integrations, the app record, which the coordinator merges at the end.
+"""
+import json
+import logging
+import random
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from crawl_journal import ERROR, SUCCESS
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 120.0  # How long a lease lasts without renewal
+MAX_ATTEMPTS = 3  # Leases a URL gets before an error becomes final
+BUSY_TIMEOUT = 30.0  # Seconds to wait for another process's write lock
+
+# URL states
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+
+
+class CrawlFrontier:
+    """SQLite-backed URL frontier handing out expiring leases."""
+
+    def __init__(self, path: str, lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        """
+        Args:
+            path: SQLite database shared by the coordinator and all workers
+            lease_seconds: Lifetime of a lease that is not renewed
+            max_attempts: Leases a URL gets before an error outcome is final
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                priority REAL NOT NULL,
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                outcome TEXT,
+                record TEXT,
+                finished_at REAL
+            )
+        ''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS urls_state ON urls (state, priority)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS urls_outcome ON urls (outcome)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+    def add(self, urls: Iterable[str]) -> int:
+        """
+        Queue URLs not already in the frontier.
+
+        Each URL gets a random priority, so leases sample the catalog in
+        random order like an unprioritized single-process crawl.
+
+        Returns:
+            Number of URLs newly queued
+        """
+        before = self._db.total_changes
+        with self._db:
+            self._db.execute('BEGIN IMMEDIATE')
+            self._db.executemany(
+                'INSERT OR IGNORE INTO urls (url, state, priority) VALUES (?, ?, ?)',
+                ((url, PENDING, random.random()) for url in urls)
+            )
+        return self._db.total_changes - before
+
+    def seal(self) -> None:
+        """Mark the frontier complete; workers stop once it drains."""
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES ('sealed', '1')")
+
+    @property
+    def sealed(self) -> bool:
+        return self._db.execute("SELECT 1 FROM meta WHERE key = 'sealed'").fetchone() is not None
+
+    def lease(self, worker: str, count: int = 1) -> List[str]:
+        """
+        Lease up to `count` URLs that are pending or whose lease has expired.
+
+        Args:
+            worker: Identifier of the leasing worker
+            count: Most URLs to lease
+
+        Returns:
+            Leased URLs, possibly none
+        """
+        now = time.time()
+        with self._db:
+            # IMMEDIATE takes the write lock up front so two workers can never
+            # select the same rows
+            self._db.execute('BEGIN IMMEDIATE')
+            urls = [row[0] for row in self._db.execute(
+                'SELECT url FROM urls WHERE state = ? OR (state = ? AND lease_expires < ?) '
+                'ORDER BY priority LIMIT ?',
+                (PENDING, LEASED, now, count)
+            )]
+            self._db.executemany(
+                'UPDATE urls SET state = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE url = ?',
+                ((LEASED, worker, now + self.lease_seconds, url) for url in urls)
+            )
+        return urls
+
+    def renew(self, worker: str) -> int:
+        """Extend every lease held by `worker`; returns how many were renewed."""
+        cursor = self._db.execute(
+            'UPDATE urls SET lease_expires = ? WHERE state = ? AND worker = ?',
+            (time.time() + self.lease_seconds, LEASED, worker)
+        )
+        return cursor.rowcount
+
+    def complete(self, url: str, worker: str, outcome: str, record: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Record the outcome of a leased URL.
+
+        Errors put the URL back in the queue until it has used up its
+        attempts. Nothing is recorded if the lease was lost to another worker
+        in the meantime, so each URL contributes at most one record.
+
+        Returns:
+            Whether the outcome was recorded
+        """
+        if outcome == ERROR:
+            cursor = self._db.execute(
+                'UPDATE urls SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, '
+                'outcome = ?, worker = NULL, lease_expires = NULL, finished_at = ? '
+                'WHERE url = ? AND state = ? AND worker = ?',
+                (self.max_attempts, DONE, PENDING, outcome, time.time(), url, LEASED, worker)
+            )
+        else:
+            cursor = self._db.execute(
+                'UPDATE urls SET state = ?, outcome = ?, record = ?, lease_expires = NULL, finished_at = ? '
+                'WHERE url = ? AND state = ? AND worker = ?',
+                (DONE, outcome, json.dumps(record, ensure_ascii=False) if record is not None else None,
+                 time.time(), url, LEASED, worker)
+            )
+        if not cursor.rowcount:
+            logger.warning(f"Lease on {url} was lost before it finished; dropping {worker}'s result")
+        return bool(cursor.rowcount)
+
+    def release(self, worker: str) -> int:
+        """Return every URL leased by `worker` to the queue, e.g. on shutdown."""
+        cursor = self._db.execute(
+            'UPDATE urls SET state = ?, worker = NULL, lease_expires = NULL, attempts = MAX(attempts - 1, 0) '
+            'WHERE state = ? AND worker = ?',
+            (PENDING, LEASED, worker)
+        )
+        return cursor.rowcount
+
+    def success_count(self) -> int:
+        """Apps with integrations found so far, across all workers."""
+        return self._db.execute('SELECT COUNT(*) FROM urls WHERE outcome = ?', (SUCCESS,)).fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        """URLs per state, plus per-outcome counts of finished ones."""
+        counts = {PENDING: 0, LEASED: 0, DONE: 0}
+        counts.update(self._db.execute('SELECT state, COUNT(*) FROM urls GROUP BY state').fetchall())
+        counts.update(self._db.execute(
+            'SELECT outcome, COUNT(*) FROM urls WHERE state = ? GROUP BY outcome', (DONE,)
+        ).fetchall())
+        return counts
+
+    def is_drained(self) -> bool:
+        """True once the frontier is sealed and no URL is pending or leased."""
+        return self.sealed and not self._db.execute(
+            'SELECT 1 FROM urls WHERE state != ? LIMIT 1', (DONE,)
+        ).fetchone()
+
+    def records(self, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """App records of successful URLs in the order they finished."""
+        query = 'SELECT record FROM urls WHERE outcome = ? AND record IS NOT NULL ORDER BY finished_at'
+        params: tuple = (SUCCESS,)
+        if limit is not None:
+            query += ' LIMIT ?'
+            params += (limit,)
+        for (record,) in self._db.execute(query, params):
+            yield json.loads(record)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> 'CrawlFrontier':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
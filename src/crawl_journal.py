@@ -0,0 +1,143 @@
+"""
+Append-only journal of per-URL crawl outcomes.
+
+Every processed URL is appended as one JSON line, so a crawl that dies hours
+in can be resumed from the journal instead of starting over. Writes are
+flushed to the OS immediately but fsynced in batches, trading at most one
+batch of outcomes on power loss for not syncing on every page.
+"""
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Outcomes recorded per URL
+SUCCESS = 'success'  # App with integrations; the record is journaled too
+NO_INTEGRATIONS = 'no_integrations'  # Parsed, but nothing worth keeping
+NOT_FOUND = 'not_found'  # 404
+NOT_AN_APP = 'not_an_app'  # Page exists but is not an app listing
+ERROR = 'error'  # Fetch or parse failure; retried on resume
+
+# Outcomes that do not need to be crawled again
+FINAL_OUTCOMES = {SUCCESS, NO_INTEGRATIONS, NOT_FOUND, NOT_AN_APP}
+
+FSYNC_EVERY = 50  # Entries between fsyncs
+FSYNC_INTERVAL = 5.0  # Seconds between fsyncs, whichever comes first
+
+
+class JournalState(NamedTuple):
+    """Crawl state rebuilt from a journal."""
+    done: Set[str]  # URLs that need no further work
+    records: List[Dict[str, Any]]  # Records of successful URLs, in crawl order
+    errors: int  # URLs whose last outcome was an error
+
+
+def read_outcomes(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Read the last journal entry for every URL.
+
+    A line cut short by a crash is skipped, and a URL's last outcome wins.
+
+    Args:
+        path: Journal file to read
+
+    Returns:
+        Journal entries keyed by URL; empty if there is no journal
+    """
+    outcomes: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(path):
+        return outcomes
+
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            try:
+                entry = json.loads(line)
+                outcomes[entry['url']] = entry
+            except (ValueError, KeyError):
+                logger.warning(f"Skipping unreadable journal line {line_no} in {path}")
+    return outcomes
+
+
+def load_journal(path: str) -> JournalState:
+    """
+    Rebuild crawl state from a journal.
+
+    An error later retried successfully counts as done, since a URL's last
+    outcome wins.
+
+    Args:
+        path: Journal file to read
+
+    Returns:
+        JournalState with finished URLs and successful records
+    """
+    outcomes = read_outcomes(path)
+    if not outcomes:
+        return JournalState(set(), [], 0)
+
+    done = {url for url, entry in outcomes.items() if entry['outcome'] in FINAL_OUTCOMES}
+    records = [entry['record'] for entry in outcomes.values() if entry['outcome'] == SUCCESS]
+    errors = sum(1 for entry in outcomes.values() if entry['outcome'] == ERROR)
+    logger.info(f"Loaded journal {path}: {len(done)} URLs done, {len(records)} apps, {errors} errors to retry")
+    return JournalState(done, records, errors)
+
+
+class CrawlJournal:
+    """Append-only JSON-lines journal with batched fsync."""
+
+    def __init__(self, path: str, resume: bool = False,
+                 fsync_every: int = FSYNC_EVERY, fsync_interval: float = FSYNC_INTERVAL):
+        """
+        Args:
+            path: Journal file
+            resume: Append to an existing journal instead of starting a new one
+            fsync_every: Entries written between fsyncs
+            fsync_interval: Longest time in seconds between fsyncs
+        """
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        # Terminate a line left half written by a crash so the next entry starts clean
+        if resume and self._file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._file.write('\n')
+
+    def record(self, url: str, outcome: str, record: Optional[Dict[str, Any]] = None) -> None:
+        """Append the outcome for one URL."""
+        entry = {'url': url, 'outcome': outcome, 'time': time.time()}
+        if record is not None:
+            entry['record'] = record
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        """Force journaled entries to disk."""
+        if self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        """Sync and close the journal."""
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def __enter__(self) -> 'CrawlJournal':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
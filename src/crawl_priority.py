@@ -0,0 +1,242 @@
+"""
+Yield-aware crawl ordering.
+
+Most listings have no "Works with" section, so fetching the sitemap in
+random order spends most requests on pages that are thrown away. The
+frontier here orders listings by their predicted chance of having
+integrations, learned from slug tokens of listings seen in earlier runs
+and updated as the crawl goes, while a fixed share of fetches still picks a
+uniformly random listing so the sample stays unbiased and the model keeps
+seeing the whole catalog.
+"""
+import asyncio
+import heapq
+import logging
+import math
+import random
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from crawl_journal import NO_INTEGRATIONS, SUCCESS, read_outcomes
+from negative_cache import NegativeCache
+from utils import app_slug, clean_url
+
+logger = logging.getLogger(__name__)
+
+EXPLORATION_SHARE = 0.2  # Share of fetches that pick a random listing instead of the best one
+PRIOR_WEIGHT = 5.0  # Pseudo-observations pulling a rare token's hit rate towards the overall rate
+DEFAULT_HIT_RATE = 0.3  # Assumed share of listings with integrations before any outcome is known
+RESCORE_EVERY = 100  # Outcomes between re-ranking the queued listings
+
+TOKEN_SPLIT = re.compile(r'[^a-z0-9]+')
+
+
+def slug_tokens(url: str) -> List[str]:
+    """Words of a listing's slug, e.g. 'klaviyo-email-marketing' -> ['klaviyo', 'email', 'marketing']."""
+    return [token for token in TOKEN_SPLIT.split(app_slug(url).lower()) if len(token) > 1 and not token.isdigit()]
+
+
+class YieldModel:
+    """Predicts whether a listing has integrations from its slug tokens and past outcomes."""
+
+    def __init__(self):
+        self.hits = 0
+        self.total = 0
+        self.token_hits: Dict[str, int] = defaultdict(int)
+        self.token_total: Dict[str, int] = defaultdict(int)
+        self.known: Dict[str, bool] = {}  # Canonical URL -> whether it had integrations last time
+
+    @classmethod
+    def from_history(
+        cls,
+        journal_path: Optional[str] = None,
+        dataset_path: Optional[str] = None,
+        negative_cache: Optional[NegativeCache] = None
+    ) -> 'YieldModel':
+        """
+        Train on earlier runs: journaled outcomes, apps in an existing
+        dataset (hits) and listings in the negative cache without integrations.
+        """
+        outcomes: Dict[str, bool] = {}
+        if negative_cache:
+            outcomes.update((url, False) for url in negative_cache.keys(NO_INTEGRATIONS))
+        if journal_path:
+            for url, entry in read_outcomes(journal_path).items():
+                if entry['outcome'] in (SUCCESS, NO_INTEGRATIONS):
+                    outcomes[clean_url(url)] = entry['outcome'] == SUCCESS
+        if dataset_path:
+            try:
+                urls = pd.read_csv(dataset_path, usecols=['app_store_url'], dtype=str)['app_store_url']
+                outcomes.update((clean_url(url), True) for url in urls.dropna())
+            except (OSError, ValueError, pd.errors.EmptyDataError) as e:
+                logger.warning(f"Could not read {dataset_path} for crawl prioritization: {str(e)}")
+
+        model = cls()
+        for url, hit in outcomes.items():
+            if url:
+                model.update(url, hit)
+        logger.info(
+            f"Yield model trained on {model.total} listings "
+            f"({model.hit_rate:.0%} with integrations, {len(model.token_total)} slug tokens)"
+        )
+        return model
+
+    @property
+    def hit_rate(self) -> float:
+        """Smoothed share of listings with integrations."""
+        return (self.hits + PRIOR_WEIGHT * DEFAULT_HIT_RATE) / (self.total + PRIOR_WEIGHT)
+
+    def update(self, url: str, hit: bool) -> None:
+        """Learn from one listing's outcome."""
+        url = clean_url(url)
+        self.known[url] = hit
+        self.hits += hit
+        self.total += 1
+        for token in set(slug_tokens(url)):
+            self.token_hits[token] += hit
+            self.token_total[token] += 1
+
+    def score(self, url: str) -> float:
+        """
+        Predicted probability that a listing has integrations.
+
+        Listings seen before are scored by their last outcome, ahead of (or
+        behind) every unseen one; others by the mean log-odds of their slug
+        tokens' smoothed hit rates.
+        """
+        url = clean_url(url)
+        if url in self.known:
+            return 1.0 if self.known[url] else 0.0
+        base = self.hit_rate
+        log_odds = [
+            math.log(rate / (1 - rate))
+            for rate in (
+                (self.token_hits[token] + PRIOR_WEIGHT * base) / (self.token_total[token] + PRIOR_WEIGHT)
+                for token in slug_tokens(url) if token in self.token_total
+            )
+        ]
+        if not log_odds:
+            return base
+        return 1 / (1 + math.exp(-sum(log_odds) / len(log_odds)))
+
+
+class PriorityFrontier:
+    """Listings waiting to be crawled, handed out best-first with a random exploration share."""
+
+    def __init__(self, model: Optional[YieldModel] = None, explore_share: float = EXPLORATION_SHARE):
+        """
+        Args:
+            model: Yield model scoring listings; an untrained one ranks them all equally
+            explore_share: Share of pops that take a uniformly random listing;
+                1.0 reproduces a plain random crawl order
+        """
+        self.model = model or YieldModel()
+        self.explore_share = explore_share
+        self._urls: List[str] = []  # Queued URLs, for uniform random picks
+        self._index: Dict[str, int] = {}
+        self._heap: List[Tuple[float, float, str]] = []  # (-score, random tie-break, url); stale entries skipped
+        self._explored: Set[str] = set()
+        self._available = asyncio.Event()
+        self._since_rescore = 0
+        # [fetches, hits] per selection mode
+        self._counts = {'prioritized': [0, 0], 'explored': [0, 0]}
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+    def add(self, url: str) -> None:
+        """Queue a listing."""
+        if url in self._index:
+            return
+        self._index[url] = len(self._urls)
+        self._urls.append(url)
+        heapq.heappush(self._heap, (-self.model.score(url), random.random(), url))
+        self._available.set()
+
+    def _remove(self, url: str) -> None:
+        idx = self._index.pop(url)
+        last = self._urls.pop()
+        if last != url:
+            self._urls[idx] = last
+            self._index[last] = idx
+
+    def pop(self) -> Optional[str]:
+        """Take the next listing to crawl, or None if none is queued."""
+        if not self._urls:
+            return None
+        if random.random() < self.explore_share:
+            url = random.choice(self._urls)
+            self._explored.add(url)
+        else:
+            while True:
+                _, _, url = heapq.heappop(self._heap)
+                if url in self._index:
+                    break
+        self._remove(url)
+        return url
+
+    async def wait(self) -> None:
+        """Wait until a listing is added (or notify() is called)."""
+        self._available.clear()
+        await self._available.wait()
+
+    def notify(self) -> None:
+        """Wake a waiter, e.g. once no more listings will be added."""
+        self._available.set()
+
+    def record(self, url: str, fetched: bool, hit: bool) -> None:
+        """
+        Account for a crawled listing and learn from it.
+
+        Args:
+            url: Listing URL as popped
+            fetched: Whether a request was spent on it (False for negative cache skips)
+            hit: Whether it had integrations
+        """
+        mode = 'explored' if url in self._explored else 'prioritized'
+        self._explored.discard(url)
+        if not fetched:
+            return
+        self._counts[mode][0] += 1
+        self._counts[mode][1] += hit
+        self.model.update(url, hit)
+        self._since_rescore += 1
+        if self._since_rescore >= RESCORE_EVERY:
+            self.rescore()
+
+    def rescore(self) -> None:
+        """Re-rank queued listings with what the model has learned since they were added."""
+        self._heap = [(-self.model.score(url), random.random(), url) for url in self._urls]
+        heapq.heapify(self._heap)
+        self._since_rescore = 0
+
+    def stats(self) -> Dict[str, object]:
+        """Fetches, hits and fetches per hit, overall and per selection mode."""
+        stats: Dict[str, object] = {}
+        for mode, (fetches, hits) in self._counts.items():
+            stats[mode] = {
+                'fetches': fetches,
+                'hits': hits,
+                'fetches_per_hit': round(fetches / hits, 2) if hits else None
+            }
+        fetches = sum(f for f, _ in self._counts.values())
+        hits = sum(h for _, h in self._counts.values())
+        stats['fetches'] = fetches
+        stats['hits'] = hits
+        stats['fetches_per_hit'] = round(fetches / hits, 2) if hits else None
+        return stats
+
+
+async def drain_into(frontier: PriorityFrontier, queue: asyncio.Queue, done: asyncio.Event) -> None:
+    """Move listings from the frontier into a (bounded) queue until `done` is set and it is empty."""
+    while True:
+        url = frontier.pop()
+        if url is None:
+            if done.is_set():
+                return
+            await frontier.wait()
+            continue
+        await queue.put(url)
@@ -0,0 +1,85 @@
+"""
+Streaming CSV output for the scrapers.
+
+Rows are written in batches to `<path>.partial` as results come in, so
+memory stays flat however large the crawl gets and partial results can be
+tailed while it runs. Committing fsyncs the file and renames it over `path`
+in one step, so readers only ever see a complete previous or new file.
+"""
+import csv
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100  # Rows buffered between writes
+
+
+class CsvSink:
+    """Batched CSV writer that publishes its file with an atomic rename."""
+
+    def __init__(self, path: str, fieldnames: Optional[List[str]] = None, batch_size: int = BATCH_SIZE):
+        """
+        Args:
+            path: Final CSV path, only replaced on commit()
+            fieldnames: Column order; taken from the first row if not given
+            batch_size: Rows buffered before they are written out
+        """
+        self.path = path
+        self.partial_path = f"{path}.partial"
+        self.fieldnames = fieldnames
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._writer: Optional[csv.DictWriter] = None
+        self._file = open(self.partial_path, 'w', newline='', encoding='utf-8')
+
+    def write(self, row: Dict[str, Any]) -> None:
+        """Queue one row, writing the batch out once it is full."""
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Queue several rows."""
+        for row in rows:
+            self.write(row)
+
+    def flush(self) -> None:
+        """Write buffered rows to the partial file."""
+        if not self._buffer:
+            return
+        if self._writer is None:
+            self.fieldnames = self.fieldnames or list(self._buffer[0])
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction='ignore')
+            self._writer.writeheader()
+        self._writer.writerows(self._buffer)
+        self.rows_written += len(self._buffer)
+        self._buffer.clear()
+        self._file.flush()
+
+    def commit(self) -> None:
+        """Write the remaining rows and atomically move the file into place."""
+        self.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.partial_path, self.path)
+        logger.info(f"Wrote {self.rows_written} rows to {self.path}")
+
+    def abort(self) -> None:
+        """Stop writing and leave `path` untouched; the partial file is kept for inspection."""
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+        logger.warning(f"Output not committed; {self.rows_written} rows left in {self.partial_path}")
+
+    def __enter__(self) -> 'CsvSink':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
@@ -0,0 +1,583 @@
+"""
+HTML parsing and extraction for app listing pages.
+
+Everything here is a pure function of the page bytes so it can run in a
+ProcessPoolExecutor, keeping BeautifulSoup and regex work off the asyncio
+event loop. Results are small dicts that are cheap to send back.
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from concurrent.futures import Executor
+from datetime import datetime
+from html import unescape
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from bs4 import BeautifulSoup, Tag, UnicodeDammit
+import lxml.html
+from lxml import etree
+
+from fingerprints import content_fingerprint
+from http_cache import BodyLimit
+from metrics import registry
+from utils import app_slug
+
+logger = logging.getLogger(__name__)
+
+# Common suffixes stripped from page titles to get the app name
+APP_NAME_SUFFIX = re.compile(r'\s*[-–—]\s*(?:Shopify App|Zipchat App|App).*$')
+
+WORKS_WITH_HEADING = re.compile(r'^\s*Works with\s*$', re.IGNORECASE)
+
+# Everything the parsers here read (meta tags, JSON-LD, the app details with
+# their "Works with" block) comes before the reviews section, which with the
+# footer after it is over half of a listing page
+LISTING_BODY_LIMIT = BodyLimit(max_bytes=512 * 1024, stop_marker=b'id="adp-reviews"')
+
+
+def _class_test(*names: str) -> str:
+    """XPath predicate matching elements with any of the given classes, like bs4's class filter."""
+    return ' or '.join(f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')" for name in names)
+
+
+# Precompiled lookups for the lxml parser, each mirroring one soup.find() in parse_app_info
+HEADING_CLASSES = ('heading--1', 'app-title', 'title')
+DESCRIPTION_CLASSES = ('app-description', 'app-details-description', 'description')
+XPATH_OG_TITLE = etree.XPath('(//meta[@property="og:title"])[1]')
+XPATH_TITLE = etree.XPath('(//title)[1]')
+XPATH_HEADINGS = [
+    etree.XPath(f'(//{tag}[{_class_test(*HEADING_CLASSES)}])[1]') for tag in ('h1', 'h2', 'div')
+]
+XPATH_OG_DESCRIPTION = etree.XPath('(//meta[@property="og:description"])[1]')
+XPATH_DESCRIPTION_DIV = etree.XPath(f'(//div[{_class_test(*DESCRIPTION_CLASSES)}])[1]')
+XPATH_META_DESCRIPTION = etree.XPath('(//meta[@name="description"])[1]')
+XPATH_PUBLISHED_TIME = etree.XPath('(//meta[@property="article:published_time"])[1]')
+# "Works with" items depend on how html.parser nests unclosed tags, so both
+# parsers read them from a BeautifulSoup tree; the lxml parser only builds
+# one for pages that can have the heading, and only as far as the section
+WORKS_WITH_TEXT = re.compile(r'works with', re.IGNORECASE)
+SECTION_WINDOW = 16 * 1024  # Characters parsed past the first "works with" before the section is checked
+
+
+async def run_parser(executor: Optional[Executor], func: Callable, *args) -> Any:
+    """
+    Run a parse function in `executor`, or inline when there is none.
+
+    Its wall time, including any wait for a free pool worker, is recorded
+    in the `parse_seconds` histogram.
+    """
+    started = time.monotonic()
+    try:
+        if executor is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+    finally:
+        registry.observe('parse_seconds', time.monotonic() - started, parser=func.__name__)
+
+
+def parse_app_info(html: bytes, url: str, encoding: Optional[str] = None) -> Optional[Dict]:
+    """Extract app information from the raw bytes of an app page."""
+    try:
+        soup = BeautifulSoup(html, 'html.parser', from_encoding=encoding)
+        
+        # Get app name - first try meta tags, then fallback to page title
+        app_name = None
+        
+        # Try meta og:title first
+        og_title = soup.find('meta', {'property': 'og:title'})
+        if og_title:
+            # Clean up the app name by removing common suffixes
+            app_name = og_title.get('content', '').split('|')[0].strip()
+            app_name = APP_NAME_SUFFIX.sub('', app_name)
+            logger.debug(f"Found app name from og:title: {app_name}")
+            
+        # If not found, try page title
+        if not app_name:
+            title_tag = soup.find('title')
+            if title_tag:
+                app_name = title_tag.text.split('|')[0].strip()
+                app_name = APP_NAME_SUFFIX.sub('', app_name)
+                logger.debug(f"Found app name from title tag: {app_name}")
+        
+        # If still not found, try heading tags
+        if not app_name:
+            heading = (
+                soup.find('h1', {'class': ['heading--1', 'app-title', 'title']}) or
+                soup.find('h2', {'class': ['heading--1', 'app-title', 'title']}) or
+                soup.find('div', {'class': ['heading--1', 'app-title', 'title']})
+            )
+            if heading:
+                app_name = heading.get_text().strip()
+                app_name = APP_NAME_SUFFIX.sub('', app_name)
+                logger.debug(f"Found app name from heading: {app_name}")
+        
+        if not app_name:
+            logger.warning(f"Could not find app name for {url}")
+            return None
+        
+        # Get description from meta tags first, then fallback to content
+        desc_elem = soup.find('meta', {'property': 'og:description'})
+        description = desc_elem.get('content', '').strip() if desc_elem else ''
+        
+        if not description:
+            desc_elem = (
+                soup.find('div', {'class': ['app-description', 'app-details-description', 'description']}) or
+                soup.find('meta', {'name': 'description'})
+            )
+            description = desc_elem.get_text().strip() if desc_elem else ''
+        
+        logger.debug(f"Description length: {len(description)} characters")
+        
+        # Get submission date from meta tags or use current time
+        date_elem = soup.find('meta', {'property': 'article:published_time'})
+        submission_date = (
+            date_elem.get('content', '') if date_elem 
+            else datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S+00:00')
+        )
+        logger.debug(f"Submission date: {submission_date}")
+
+        # Extract integrations from "Works with" section
+        integrations = works_with_items(soup.find(string=WORKS_WITH_HEADING))
+        
+        return build_app_record(url, app_name, description, submission_date, integrations)
+        
+    except Exception as e:
+        logger.error(f"Error parsing app page {url}: {str(e)}", exc_info=True)
+        return None
+
+
+def works_with_items(heading: Optional[Any]) -> List[str]:
+    """Integrations listed after a "Works with" heading string found in a BeautifulSoup tree."""
+    integrations = []
+    
+    # Find the "Works with" section - it's typically a heading followed by a list
+    if heading:
+        logger.debug("Found 'Works with' section")
+        # The integrations are typically listed right after the heading
+        parent = heading.parent
+        if parent:
+            # Look for list items or links after the heading
+            integration_elements = parent.find_next_siblings(['ul', 'div'])
+            for element in integration_elements:
+                # Look for links or list items
+                items = element.find_all(['a', 'li'])
+                for item in items:
+                    integration = item.get_text().strip()
+                    if integration and len(integration) > 1:
+                        integrations.append(integration)
+                        logger.debug(f"Found integration: {integration}")
+    return integrations
+
+
+def _followed(element: Any, soup: BeautifulSoup) -> bool:
+    """Whether anything parsed comes after `element` and its contents, i.e. html.parser closed it."""
+    last = soup
+    while isinstance(last, Tag) and last.contents:
+        last = last.contents[-1]
+    return last is not element and all(parent is not element for parent in last.parents)
+
+
+def _works_with_section(text: str) -> List[str]:
+    """
+    The "Works with" integrations exactly as parse_app_info reads them.
+    
+    html.parser builds its tree as it reads, so nothing after a closed
+    element changes it: a growing prefix of the page is parsed until the
+    section's container is followed by more markup, falling back to the
+    whole page. Pages where the phrase appears nowhere, even as character
+    references, are not parsed at all.
+    """
+    if not WORKS_WITH_TEXT.search(unescape(text) if '&' in text else text):
+        return []
+    
+    first = WORKS_WITH_TEXT.search(text)
+    end = (first.end() if first else 0) + SECTION_WINDOW
+    while end < len(text):
+        soup = BeautifulSoup(text[:end], 'html.parser')
+        heading = soup.find(string=WORKS_WITH_HEADING)
+        if heading is not None:
+            # The heading string has to be complete, and the element whose
+            # children hold the section has to be closed
+            parent = heading.parent
+            closing = heading if parent is soup else parent.parent
+            if closing is not soup and _followed(closing, soup):
+                return works_with_items(heading)
+        end *= 2
+    return works_with_items(BeautifulSoup(text, 'html.parser').find(string=WORKS_WITH_HEADING))
+
+
+def _first(xpath: etree.XPath, doc) -> Optional[Any]:
+    matches = xpath(doc)
+    return matches[0] if matches else None
+
+
+def _decode(html: bytes, encoding: Optional[str]) -> str:
+    """Decode a page the way BeautifulSoup would, without its sniffing cost in the common case."""
+    try:
+        return html.decode(encoding or 'utf-8')
+    except (UnicodeDecodeError, LookupError):
+        return UnicodeDammit(html, [encoding] if encoding else []).unicode_markup
+
+
+def parse_app_info_lxml(html: bytes, url: str, encoding: Optional[str] = None) -> Optional[Dict]:
+    """
+    Extract app information with lxml and precompiled XPath.
+    
+    Produces the same record as parse_app_info, but skips building a
+    BeautifulSoup tree and scanning every string in the page in Python.
+    Only the "Works with" section, whose items depend on how unclosed tags
+    nest, is read with BeautifulSoup from as much of the page as it needs.
+    """
+    if not html.strip():
+        logger.warning(f"Could not find app name for {url}")
+        return None
+    
+    try:
+        text = _decode(html, encoding)
+        doc = lxml.html.document_fromstring(text)
+        
+        app_name = None
+        og_title = _first(XPATH_OG_TITLE, doc)
+        if og_title is not None:
+            app_name = APP_NAME_SUFFIX.sub('', og_title.get('content', '').split('|')[0].strip())
+            logger.debug(f"Found app name from og:title: {app_name}")
+        
+        if not app_name:
+            title_tag = _first(XPATH_TITLE, doc)
+            if title_tag is not None:
+                app_name = APP_NAME_SUFFIX.sub('', title_tag.text_content().split('|')[0].strip())
+                logger.debug(f"Found app name from title tag: {app_name}")
+        
+        if not app_name:
+            for xpath in XPATH_HEADINGS:
+                heading = _first(xpath, doc)
+                if heading is not None:
+                    app_name = APP_NAME_SUFFIX.sub('', heading.text_content().strip())
+                    logger.debug(f"Found app name from heading: {app_name}")
+                    break
+        
+        if not app_name:
+            logger.warning(f"Could not find app name for {url}")
+            return None
+        
+        desc_elem = _first(XPATH_OG_DESCRIPTION, doc)
+        description = desc_elem.get('content', '').strip() if desc_elem is not None else ''
+        if not description:
+            desc_elem = _first(XPATH_DESCRIPTION_DIV, doc)
+            if desc_elem is None:
+                desc_elem = _first(XPATH_META_DESCRIPTION, doc)
+            description = desc_elem.text_content().strip() if desc_elem is not None else ''
+        
+        date_elem = _first(XPATH_PUBLISHED_TIME, doc)
+        submission_date = (
+            date_elem.get('content', '') if date_elem is not None
+            else datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S+00:00')
+        )
+        
+        integrations = _works_with_section(text)
+        
+        return build_app_record(url, app_name, description, submission_date, integrations)
+    
+    except Exception as e:
+        logger.error(f"Error parsing app page {url}: {str(e)}", exc_info=True)
+        return None
+
+
+def build_app_record(
+    url: str,
+    app_name: str,
+    description: str,
+    submission_date: str,
+    integrations: List[str]
+) -> Dict:
+    """
+    Clean up extracted fields into an app record.
+    
+    Shared by both parsers so they only differ in how they find the fields.
+    
+    Args:
+        url: App store URL of the page
+        app_name: App name with store suffixes removed
+        description: App description
+        submission_date: Submission date string
+        integrations: Entries found in the "Works with" section
+        
+    Returns:
+        App record dict as written to top_apps_raw.csv
+    """
+    integrations = list(integrations)
+    
+    # Also look for integration mentions in the description
+    integration_keywords = ['integrates with', 'works with', 'compatible with', 'connects to', 'sync with']
+    desc_text = description.lower()
+    for keyword in integration_keywords:
+        if keyword in desc_text:
+            logger.debug(f"Found keyword '{keyword}' in description")
+            # Find the sentence containing the keyword
+            sentences = re.split(r'[.!?]+', desc_text)
+            for sentence in sentences:
+                if keyword in sentence and 'isn\'t compatible' not in sentence and 'not compatible' not in sentence:
+                    # Extract potential integration names
+                    after_keyword = sentence.split(keyword)[1]
+                    # Split by common separators and clean up
+                    potential_integrations = re.split(r'[,;&]', after_keyword)
+                    for integration in potential_integrations:
+                        integration = integration.strip(' and\t\n')
+                        if integration and len(integration) > 1:
+                            integrations.append(integration)
+                            logger.debug(f"Found integration from description: {integration}")
+    
+    # Remove duplicates and standardize
+    integrations = list(set(integrations))
+    integrations = [i.strip(' ,.;') for i in integrations]
+    integrations = [i for i in integrations if len(i) > 1]  # Remove single characters
+    
+    # Additional cleaning of integrations
+    cleaned_integrations = []
+    for integration in integrations:
+        # Skip if it contains incompatible messages
+        if any(phrase in integration.lower() for phrase in [
+            "isn't compatible", 
+            "not compatible", 
+            "only compatible with stores that",
+            "this app isn't"
+        ]):
+            continue
+        # Skip if it's too long (likely a sentence rather than an integration name)
+        if len(integration.split()) > 5:
+            continue
+        cleaned_integrations.append(integration)
+    
+    logger.info(f"Total unique integrations found: {len(cleaned_integrations)}")
+    
+    return {
+        'api_key': app_slug(url) or url,  # Stable across snapshots so runs can be joined
+        'app_name': app_name,
+        'app_store_url': url,
+        'app_details': description,
+        'app_submission_created_at': submission_date,
+        'integrations': ','.join(cleaned_integrations) if cleaned_integrations else '',
+        'content_fingerprint': content_fingerprint(app_name, description, cleaned_integrations)
+    }
+
+
+# Class names is_valid_app_page() accepts a listing by, also read by prefilter_listing_page()
+APP_CONTAINER_CLASSES = ['app-details', 'app-listing', 'app-block', 'app-listing-hero', 'app-listing__hero']
+APP_TITLE_CLASSES = ['heading--1', 'app-title', 'title', 'app-listing__heading']
+APP_DESCRIPTION_CLASSES = ['app-description', 'app-details-description', 'description', 'app-listing__description']
+APP_PRICING_CLASSES = ['app-pricing', 'pricing-section', 'pricing', 'app-listing__pricing']
+APP_DEVELOPER_CLASSES = ['app-developer', 'developer-info', 'developer', 'app-listing__developer']
+APP_REVIEWS_CLASSES = ['app-reviews', 'reviews-section', 'reviews', 'app-listing__reviews']
+
+
+def is_valid_app_page(soup: BeautifulSoup) -> bool:
+    """Check if the page is a valid app listing."""
+    # Check for various app page indicators
+    indicators = [
+        # Main app container
+        soup.find('div', {'class': APP_CONTAINER_CLASSES}),
+        
+        # App title
+        soup.find(['h1', 'h2'], {'class': APP_TITLE_CLASSES}),
+        
+        # App description
+        soup.find('div', {'class': APP_DESCRIPTION_CLASSES}),
+        
+        # Pricing section
+        soup.find('div', {'class': APP_PRICING_CLASSES}),
+        
+        # Developer info
+        soup.find('div', {'class': APP_DEVELOPER_CLASSES}),
+        
+        # Reviews section
+        soup.find('div', {'class': APP_REVIEWS_CLASSES})
+    ]
+    
+    # Check meta tags
+    meta_title = soup.find('meta', {'property': 'og:title'})
+    meta_type = soup.find('meta', {'property': 'og:type'})
+    meta_url = soup.find('meta', {'property': 'og:url'})
+    
+    # Check JSON-LD data
+    json_ld = None
+    for script in soup.find_all('script', {'type': 'application/ld+json'}):
+        try:
+            data = json.loads(script.string)
+            if data.get('@type') == 'SoftwareApplication':
+                json_ld = data
+                break
+        except:
+            continue
+    
+    return any(indicators) or (meta_title and meta_type and 'apps.shopify.com' in str(meta_url)) or json_ld is not None
+
+
+# Integration keywords to look for
+INTEGRATION_MENTION_KEYWORDS = [
+    'integrates with', 'integration', 'integrated with', 'connects with',
+    'connect to', 'connected to', 'works with', 'compatible with',
+    'sync with', 'syncs with', 'synchronize with', 'synchronizes with',
+    'import from', 'imports from', 'export to', 'exports to',
+    'api integration', 'api connection', 'api connector',
+    'plugin for', 'extension for', 'addon for', 'add-on for',
+    'integration with', 'connector for', 'connects to'
+]
+
+# Integration patterns to match, compiled once instead of per page
+INTEGRATION_PATTERNS = [
+    re.compile(rf'\b{re.escape(kw)}\b\s+([^.!?\n]+)', re.IGNORECASE)
+    for kw in INTEGRATION_MENTION_KEYWORDS
+]
+
+def extract_integrations(soup: BeautifulSoup, url: str) -> Tuple[List[str], bool]:
+    """Extract integrations from an already parsed app store page."""
+    integrations = set()
+    
+    # Check if this is a valid app page
+    if not soup.find('div', {'class': 'app-details'}) and not soup.find('main', {'role': 'main'}):
+        logger.warning(f"Not a valid app page: {url}")
+        return list(integrations), False
+    
+    # Extract text from relevant sections
+    text_sections = []
+    
+    # App description
+    description = soup.find('div', {'class': ['app-details__description', 'description']})
+    if description:
+        text_sections.append(description.get_text())
+    
+    # Features section
+    features = soup.find('div', {'class': ['app-details__features', 'features']})
+    if features:
+        text_sections.append(features.get_text())
+    
+    # Key benefits section
+    benefits = soup.find('div', {'class': ['app-details__benefits', 'benefits']})
+    if benefits:
+        text_sections.append(benefits.get_text())
+    
+    # Integration section (if exists)
+    integrations_section = soup.find('div', {'class': ['app-details__integrations', 'integrations']})
+    if integrations_section:
+        text_sections.append(integrations_section.get_text())
+    
+    # Process all text sections
+    for text in text_sections:
+        # Clean text
+        text = re.sub(r'\s+', ' ', text).strip()
+        
+        # Look for integration mentions
+        for pattern in INTEGRATION_PATTERNS:
+            matches = pattern.finditer(text)
+            for match in matches:
+                # Extract and clean integration name
+                integration = match.group(1).strip()
+                integration = re.sub(r'[,.!?].*$', '', integration)  # Remove everything after punctuation
+                integration = re.sub(r'\s+', ' ', integration).strip()
+                
+                # Basic validation
+                if (len(integration) > 2 and  # More than 2 chars
+                    len(integration) < 50 and  # Less than 50 chars
+                    not integration.lower().startswith('your') and  # Skip generic mentions
+                    not integration.lower().startswith('other')):
+                    integrations.add(integration)
+    
+    return list(integrations), True
+
+
+# Byte-level markers for prefilter_listing_page(), searched in the lower-cased page
+SOFTWARE_APPLICATION_MARKER = b'softwareapplication'  # schema.org type in the listing's JSON-LD
+OG_URL_MARKER = b'og:url'
+OG_TITLE_MARKER = b'og:title'
+OG_TYPE_MARKER = b'og:type'
+LISTING_HOST_MARKER = b'apps.shopify.com'
+LISTING_CLASS_MARKERS = frozenset(
+    name.lower().encode('ascii')
+    for names in (APP_CONTAINER_CLASSES, APP_TITLE_CLASSES, APP_DESCRIPTION_CLASSES,
+                  APP_PRICING_CLASSES, APP_DEVELOPER_CLASSES, APP_REVIEWS_CLASSES)
+    for name in names
+)
+CLASS_ATTRIBUTE = re.compile(rb'(?<![\w-])class\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))')
+ATTRIBUTE_QUOTES = bytes.maketrans(b'"\'', b'  ')
+# Encodings whose bytes cannot be searched for ASCII markers
+WIDE_ENCODING_BOMS = (b'\xff\xfe', b'\xfe\xff')
+
+
+def _tags_containing(html: bytes, marker: bytes) -> Iterator[Optional[bytes]]:
+    """
+    Every tag containing `marker`, as the bytes from its '<' to its '>'.
+    
+    Occurrences outside a tag are skipped. None stands for one whose tag
+    cannot be delimited by a plain search (e.g. a '>' inside an attribute
+    value), which callers must treat as a possible match.
+    """
+    pos = html.find(marker)
+    while pos != -1:
+        start = html.rfind(b'<', 0, pos + 1)
+        end = html.find(b'>', pos)
+        if start != -1 and end != -1:
+            if html.find(b'>', start, pos) == -1:
+                yield html[start:end + 1]
+            elif html.find(b'"', start, pos) != -1 or html.find(b"'", start, pos) != -1:
+                yield None
+        pos = html.find(marker, pos + len(marker))
+
+
+def _has_listing_class(html: bytes) -> bool:
+    # Every class attribute on the page counts, whatever its tag and even
+    # inside comments or scripts; one whose value holds a character
+    # reference might decode to a listing class, so it counts too
+    for match in CLASS_ATTRIBUTE.finditer(html):
+        value = next(group for group in match.groups() if group is not None)
+        if b'&' in value or not LISTING_CLASS_MARKERS.isdisjoint(value.translate(ATTRIBUTE_QUOTES).split()):
+            return True
+    return False
+
+
+def _has_listing_meta(html: bytes) -> bool:
+    return SOFTWARE_APPLICATION_MARKER in html or (
+        OG_TITLE_MARKER in html and OG_TYPE_MARKER in html and any(
+            tag is None or LISTING_HOST_MARKER in tag for tag in _tags_containing(html, OG_URL_MARKER)
+        )
+    )
+
+
+def prefilter_listing_page(html: bytes, encoding: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Reject a candidate page from its raw bytes when that settles it.
+    
+    A page is only rejected without a parse when it has none of the signals
+    is_valid_app_page accepts a listing by: no class attribute naming one of
+    its listing classes, no SoftwareApplication JSON-LD type and no
+    og:title/og:type meta with an og:url on the app store. Each test errs
+    towards finding a signal, and any page with one gets the full parse,
+    so the prefilter never changes a result. Every test is a byte search,
+    so this costs a fraction of a millisecond where the BeautifulSoup
+    parse costs tens.
+    
+    Returns:
+        The parse_listing_page() result for a page that is not an app
+        listing, or None if the page needs a full parse
+    """
+    if html.startswith(WIDE_ENCODING_BOMS) or (encoding and ('16' in encoding or '32' in encoding)):
+        return None
+    html = html.lower()
+    if _has_listing_class(html) or _has_listing_meta(html):
+        return None
+    return {'valid': False, 'page_found': False, 'integrations': []}
+
+
+def parse_listing_page(html: bytes, url: str, encoding: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Validate a candidate page and extract its integrations in one parse.
+    
+    Returns:
+        Dict with 'valid' (is an app listing), 'page_found' and 'integrations'
+    """
+    soup = BeautifulSoup(html, 'lxml', from_encoding=encoding)
+    if not is_valid_app_page(soup):
+        return {'valid': False, 'page_found': False, 'integrations': []}
+    integrations, page_found = extract_integrations(soup, url)
+    return {'valid': True, 'page_found': page_found, 'integrations': integrations}
@@ -0,0 +1,158 @@
+"""
+Content fingerprints of app records.
+
+The scrapers store a fingerprint of the fields later steps read (name,
+description and "Works with" list) with every record. The processing scripts
+compare it with the fingerprint of the same app in their previous output and
+carry that output over for unchanged apps, so a refresh that changes a few
+listings only reprocesses those.
+"""
+import ast
+import hashlib
+import logging
+import os
+import re
+from typing import Iterable, List, Optional, Union
+
+import pandas as pd
+
+from utils import clean_url
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_COLUMN = 'content_fingerprint'
+DESCRIPTION_COLUMNS = ('app_details', 'description')  # Description column of the scraper and BigQuery exports
+KEY_COLUMNS = ('app_store_url', 'api_key', 'app_name')  # First one present identifies an app across runs
+
+INTEGRATION_SEPARATOR = re.compile(r'[,|]')
+WHITESPACE = re.compile(r'\s+')
+
+
+def _normalize_text(value: object) -> str:
+    if not isinstance(value, str):
+        return ''
+    return WHITESPACE.sub(' ', value).strip()
+
+
+def _normalize_integrations(integrations: Union[str, Iterable[str], None]) -> List[str]:
+    if isinstance(integrations, str):
+        # Comma-separated as scraped, or a list written out by pandas
+        integrations = INTEGRATION_SEPARATOR.split(integrations.strip('[]'))
+    elif not isinstance(integrations, (list, tuple, set)):
+        return []
+    names = (_normalize_text(str(name)).strip('\'" ') for name in integrations)
+    return sorted({name for name in names if name})
+
+
+def content_fingerprint(app_name: object, description: object, integrations: Union[str, Iterable[str], None]) -> str:
+    """
+    Stable fingerprint of an app's extracted content.
+
+    Whitespace differences and the order of the integrations do not change it,
+    since the parsers do not keep either stable between runs.
+    """
+    content = '\x1f'.join([
+        _normalize_text(app_name),
+        _normalize_text(description),
+        '\x1e'.join(_normalize_integrations(integrations))
+    ])
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def fingerprint_rows(df: pd.DataFrame) -> pd.Series:
+    """
+    Fingerprint of every row: the stored one where the scraper wrote it,
+    otherwise computed from the row's name, description and integrations.
+    """
+    if FINGERPRINT_COLUMN in df.columns:
+        fingerprints = df[FINGERPRINT_COLUMN].astype(object)
+        missing = fingerprints.isna() | (fingerprints == '')
+    else:
+        fingerprints = pd.Series(None, index=df.index, dtype=object)
+        missing = pd.Series(True, index=df.index)
+    if not missing.any():
+        return fingerprints
+
+    rows = df[missing]
+    description_column = next((column for column in DESCRIPTION_COLUMNS if column in df.columns), None)
+    none = [None] * len(rows)
+    fingerprints[missing] = [
+        content_fingerprint(app_name, description, integrations)
+        for app_name, description, integrations in zip(
+            rows['app_name'] if 'app_name' in rows else none,
+            rows[description_column] if description_column else none,
+            rows['integrations'] if 'integrations' in rows else none
+        )
+    ]
+    return fingerprints
+
+
+def row_keys(df: pd.DataFrame) -> pd.Series:
+    """Identity of every row's app, used to match it with the previous output."""
+    column = next((column for column in KEY_COLUMNS if column in df.columns), None)
+    if column is None:
+        return pd.Series([str(idx) for idx in df.index], index=df.index, dtype=object)
+    keys = df[column].fillna('').astype(str).str.strip()
+    if column == 'app_store_url':
+        keys = keys.map(lambda url: clean_url(url) or url)
+    return keys
+
+
+def load_previous(path: str) -> Optional[pd.DataFrame]:
+    """
+    Previous output of a processing step, indexed by app key, or None if
+    there is none or it has no fingerprints to compare against.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        previous = pd.read_csv(path)
+    except (OSError, ValueError, pd.errors.EmptyDataError) as e:
+        logger.warning(f"Could not read previous output {path}, reprocessing every row: {str(e)}")
+        return None
+    if FINGERPRINT_COLUMN not in previous.columns:
+        logger.info(f"{path} has no content fingerprints, reprocessing every row")
+        return None
+    previous.index = row_keys(previous)
+    return previous[~previous.index.duplicated(keep='last')]
+
+
+def unchanged_rows(df: pd.DataFrame, previous: Optional[pd.DataFrame]) -> pd.Series:
+    """
+    Which rows of `df` have the same fingerprint as their app in `previous`.
+
+    `df` must already have its FINGERPRINT_COLUMN filled in.
+    """
+    if previous is None:
+        return pd.Series(False, index=df.index)
+    keys = row_keys(df)
+    last = keys.map(previous[FINGERPRINT_COLUMN])
+    return (last == df[FINGERPRINT_COLUMN]) & keys.ne('')
+
+
+def previous_values(df: pd.DataFrame, previous: Optional[pd.DataFrame], unchanged: pd.Series, column: str) -> pd.Series:
+    """`column` of the previous output for unchanged rows of `df`, aligned to its index; None elsewhere."""
+    values = pd.Series(None, index=df.index, dtype=object)
+    if previous is not None and unchanged.any():
+        values[unchanged] = previous.loc[row_keys(df)[unchanged], column].values
+    return values
+
+
+def read_list_cell(value: object) -> List[str]:
+    """A list column as pandas writes it to CSV ("['a', 'b']"), read back into a list."""
+    if isinstance(value, list):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        return []
+    try:
+        parsed = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return _normalize_integrations(value)
+    return [str(item) for item in parsed] if isinstance(parsed, (list, tuple)) else []
+
+
+def log_reuse(step: str, unchanged: pd.Series) -> None:
+    logger.info(
+        f"{step}: {int(unchanged.sum())} of {len(unchanged)} rows unchanged since the last run, "
+        f"reprocessing {int((~unchanged).sum())}"
+    )
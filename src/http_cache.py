@@ -0,0 +1,366 @@
+"""
+Persistent on-disk HTTP response cache shared by the scrapers.
+
+Bodies are stored as files next to a small SQLite index holding the ETag,
+Last-Modified and last access time of every entry. Cached entries are
+revalidated with If-None-Match/If-Modified-Since so unchanged pages come
+back as a 304, and the least recently used entries are evicted once the
+cache grows past its size cap.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+
+from metrics import registry
+from utils import clean_url
+
+logger = logging.getLogger(__name__)
+
+MAX_CACHE_BYTES = 500 * 1024 * 1024  # 500 MB
+STREAM_CHUNK_SIZE = 16 * 1024  # Bytes read per chunk when a body limit applies
+DRAIN_LIMIT = 64 * 1024  # Unread bytes still worth reading to keep the connection alive
+
+
+class CacheEntry(NamedTuple):
+    """Index row for a cached response."""
+    key: str
+    path: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    encoding: Optional[str]
+    size: int
+
+
+class BodyLimit(NamedTuple):
+    """Where a response body may be cut short because the rest is never used."""
+    max_bytes: Optional[int] = None  # Stop reading after this many bytes
+    stop_marker: Optional[bytes] = None  # Stop where this first appears; the body ends before it
+
+    def cut(self, body: bytes) -> bytes:
+        """Apply the limit to a complete body."""
+        if self.stop_marker:
+            end = body.find(self.stop_marker)
+            if end != -1:
+                body = body[:end]
+        if self.max_bytes is not None:
+            body = body[:self.max_bytes]
+        return body
+
+
+class CachedResponse(NamedTuple):
+    """Result of a cache-aware GET."""
+    status: int
+    body: bytes
+    encoding: Optional[str] = None
+    from_cache: bool = False
+    truncated: bool = False  # Body was cut short by a BodyLimit
+    bytes_saved: int = 0  # Bytes of the body left unread, when the length was known
+
+    @property
+    def text(self) -> str:
+        return self.body.decode(self.encoding or 'utf-8', errors='replace')
+
+
+def cache_key(url: str) -> str:
+    """
+    Canonical cache key for a URL.
+
+    Direct app listings are keyed by their clean_url form so tracking
+    parameters, fragments and trailing slashes all share one entry. Other
+    URLs (e.g. /app/<api_key>) keep their path, which clean_url would cut.
+    """
+    url = url.strip().split('#')[0]
+    path = urlparse(url).path.strip('/')
+    if '/' not in path:
+        canonical = clean_url(url)
+        if canonical:
+            return canonical
+    return url.split('?')[0].rstrip('/')
+
+
+class CacheWriter:
+    """Streams a response body into the cache, committing it atomically."""
+
+    def __init__(self, cache: 'ResponseCache', url: str):
+        self.cache = cache
+        self.url = url
+        self.path = cache._body_path(cache_key(url))
+        self._tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        self._file = open(self._tmp_path, 'wb')
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self, headers: Any, encoding: Optional[str] = None) -> None:
+        """Finish the body and record it with the response's validators."""
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        self.cache._record(
+            cache_key(self.url), self.path,
+            headers.get('ETag'), headers.get('Last-Modified'),
+            encoding, self.size
+        )
+
+    def abort(self) -> None:
+        """Discard a partially written body; does nothing after commit()."""
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+class ResponseCache:
+    """On-disk response cache with conditional revalidation and LRU eviction."""
+
+    def __init__(self, cache_dir: str, max_bytes: int = MAX_CACHE_BYTES, offline: bool = False):
+        """
+        Args:
+            cache_dir: Directory to keep the index and bodies in
+            max_bytes: Total body size above which least recently used entries are evicted
+            offline: Serve purely from the cache and never touch the network
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+        self._bodies_dir = os.path.join(cache_dir, 'bodies')
+        os.makedirs(self._bodies_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                encoding TEXT,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        ''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)')
+
+    def _body_path(self, key: str) -> str:
+        return os.path.join(self._bodies_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.body')
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """Look up a cached entry and mark it as recently used."""
+        key = cache_key(url)
+        row = self._db.execute(
+            'SELECT key, path, etag, last_modified, encoding, size FROM entries WHERE key = ?', (key,)
+        ).fetchone()
+        if not row:
+            return None
+        entry = CacheEntry(*row)
+        if not os.path.exists(entry.path):
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            return None
+        self._db.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return entry
+
+    def read(self, entry: CacheEntry) -> bytes:
+        """Read a cached body."""
+        with open(entry.path, 'rb') as f:
+            return f.read()
+
+    @staticmethod
+    def conditional_headers(entry: Optional[CacheEntry]) -> Dict[str, str]:
+        """Request headers that let the server answer 304 for an unchanged entry."""
+        headers = {}
+        if entry and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry and entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def put(self, url: str, body: bytes, headers: Any, encoding: Optional[str] = None) -> None:
+        """Store a complete response body."""
+        writer = self.open_writer(url)
+        writer.write(body)
+        writer.commit(headers, encoding)
+
+    def open_writer(self, url: str) -> CacheWriter:
+        """Start streaming a response body into the cache."""
+        return CacheWriter(self, url)
+
+    def _record(self, key: str, path: str, etag: Optional[str], last_modified: Optional[str],
+                encoding: Optional[str], size: int) -> None:
+        now = time.time()
+        self._db.execute(
+            'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, path, etag, last_modified, encoding, size, now, now)
+        )
+        self._evict()
+
+    def _evict(self) -> None:
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        for key, path, size in self._db.execute(
+            'SELECT key, path, size FROM entries ORDER BY accessed_at'
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            if os.path.exists(path):
+                os.remove(path)
+            total -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} least recently used cache entries")
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current cache size."""
+        count, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {
+            'entries': count,
+            'bytes': size,
+            'hits': self.hits,
+            'revalidated': self.revalidated,
+            'misses': self.misses
+        }
+
+
+async def read_limited(response: aiohttp.ClientResponse, limit: BodyLimit) -> Tuple[bytes, bool, int]:
+    """
+    Stream a response body until `limit` says the rest is not needed.
+
+    A connection with only a little left unread is drained so it can go back
+    to the pool; otherwise it is closed rather than reused mid-body.
+
+    Returns:
+        (body, truncated, bytes_saved); bytes_saved is 0 unless the response
+        declared an uncompressed Content-Length
+    """
+    body = bytearray()
+    truncated = False
+    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+        searched = max(0, len(body) - len(limit.stop_marker) + 1) if limit.stop_marker else 0
+        body.extend(chunk)
+        if limit.stop_marker:
+            end = body.find(limit.stop_marker, searched)
+            if end != -1:
+                del body[end:]
+                truncated = True
+                break
+        if limit.max_bytes is not None and len(body) > limit.max_bytes:
+            del body[limit.max_bytes:]
+            truncated = True
+            break
+    if not truncated:
+        return bytes(body), False, 0
+
+    length = response.content_length if 'Content-Encoding' not in response.headers else None
+    unread = length - response.content.total_bytes if length is not None else None
+    if unread is not None and unread <= DRAIN_LIMIT:
+        await response.content.read()
+        return bytes(body), True, 0
+    response.close()
+    return bytes(body), True, max(0, unread or 0)
+
+
+async def cached_get(
+    session: aiohttp.ClientSession,
+    url: str,
+    cache: ResponseCache,
+    rate_controller=None,
+    headers: Optional[Dict[str, str]] = None,
+    body_limit: Optional[BodyLimit] = None,
+    **request_kwargs
+) -> CachedResponse:
+    """
+    GET a URL through the response cache.
+
+    Cached entries are revalidated with a conditional request; a 304 is
+    served from disk as a 200. In offline mode a cache miss is reported as
+    a 404 so callers treat it like a page that does not exist.
+
+    With a body limit the body is streamed and reading stops as soon as the
+    limit is reached; cached bodies are cut the same way, so callers see the
+    same page either way. Bodies cut short are not cached, since other
+    callers may need the whole page.
+
+    Args:
+        session: aiohttp session to fetch with
+        url: URL to fetch
+        cache: Response cache to read from and write to
+        rate_controller: Optional AdaptiveRateController to pace the request through
+        headers: Optional request headers
+        body_limit: Optional point after which the body is not needed
+        **request_kwargs: Passed through to session.get (timeout, allow_redirects, ...)
+
+    Returns:
+        CachedResponse with the status, body and whether it came from the cache
+    """
+    entry = cache.get(url)
+    cut = body_limit.cut if body_limit else (lambda body: body)
+
+    if cache.offline:
+        if entry:
+            cache.hits += 1
+            registry.inc('cache_lookups_total', result='hit')
+            return CachedResponse(200, cut(cache.read(entry)), entry.encoding, True)
+        cache.misses += 1
+        registry.inc('cache_lookups_total', result='miss')
+        logger.warning(f"Not in cache (offline): {url}")
+        return CachedResponse(404, b'')
+
+    request_headers = dict(headers or {})
+    request_headers.update(ResponseCache.conditional_headers(entry))
+
+    if rate_controller:
+        waited = time.monotonic()
+        await rate_controller.acquire(url)
+        registry.inc('rate_limit_wait_seconds_total', time.monotonic() - waited)
+    started = time.monotonic()
+    try:
+        async with session.get(url, headers=request_headers, **request_kwargs) as response:
+            if rate_controller:
+                rate_controller.record(url, response.status, response.headers.get('Retry-After'))
+            registry.inc('http_requests_total', method='GET', status=response.status)
+
+            if response.status == 304 and entry:
+                cache.revalidated += 1
+                registry.inc('cache_lookups_total', result='revalidated')
+                registry.observe('fetch_seconds', time.monotonic() - started)
+                return CachedResponse(200, cut(cache.read(entry)), entry.encoding, True)
+
+            if body_limit and response.status == 200:
+                body, truncated, bytes_saved = await read_limited(response, body_limit)
+            else:
+                body, truncated, bytes_saved = await response.read(), False, 0
+            registry.inc('http_response_bytes_total', len(body))
+            registry.observe('fetch_seconds', time.monotonic() - started)
+            if response.status != 200:
+                return CachedResponse(response.status, body, response.get_encoding() if body else None)
+
+            # Sniffing an encoding needs the whole body; a cut body goes by its header alone
+            encoding = response.charset if truncated else response.get_encoding()
+            cache.misses += 1
+            registry.inc('cache_lookups_total', result='miss')
+            if truncated:
+                registry.inc('truncated_bodies_total')
+                registry.inc('http_bytes_saved_total', bytes_saved)
+                logger.debug(f"Stopped reading {url} after {len(body)} bytes, {bytes_saved} left unread")
+            else:
+                cache.put(url, body, response.headers, encoding)
+            return CachedResponse(200, body, encoding, truncated=truncated, bytes_saved=bytes_saved)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        if rate_controller:
+            rate_controller.record(url, None)
+        registry.inc('http_requests_total', method='GET', status='error')
+        raise
@@ -0,0 +1,208 @@
+"""
+Shared pooled HTTP client for the synchronous tooling.
+
+utils.safe_request and safe_request_many go through one requests.Session
+whose adapter keeps a pool of keep-alive connections per host, retries
+429s and 5xx responses with exponential backoff (honouring Retry-After),
+and resolves host names through a small TTL cache so new connections to a
+known host skip the DNS lookup. The async scrapers use aiohttp and are not
+affected.
+"""
+import logging
+import socket
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+POOL_CONNECTIONS = 20  # Hosts whose connection pools are kept
+POOL_MAXSIZE = 10  # Keep-alive connections per host; also the most requests in flight to one host
+MAX_RETRIES = 3  # Retries after the first attempt
+BACKOFF_FACTOR = 0.5  # Retry n waits BACKOFF_FACTOR * 2 ** (n - 1) seconds unless Retry-After says otherwise
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DNS_CACHE_TTL = 300.0  # Seconds a resolved address is reused; 0 disables the cache
+
+
+class DnsCache:
+    """Thread-safe TTL cache of resolved host addresses."""
+
+    def __init__(self, ttl: float = DNS_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[Tuple[str, int], Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int) -> str:
+        """
+        Address to connect to for `host`, looked up at most once per TTL.
+
+        Raises:
+            socket.gaierror: If the host does not resolve
+        """
+        key = (host, port)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+        address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0][4][0]
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (address, now + self.ttl)
+        return address
+
+    def forget(self, host: str, port: int) -> None:
+        """Drop a cached address, e.g. after connecting to it failed."""
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+dns_cache = DnsCache()
+
+
+class _CachedDnsConnectionMixin:
+    """Connects to the cached address of the host; TLS still verifies the host name."""
+
+    def _new_conn(self):
+        host = self._dns_host
+        if dns_cache.ttl <= 0:
+            return super()._new_conn()
+        try:
+            self._dns_host = dns_cache.resolve(host, self.port)
+        except socket.gaierror:
+            # Let urllib3 resolve it again and raise its own error
+            return super()._new_conn()
+        try:
+            return super()._new_conn()
+        except Exception:
+            # The address may have moved; look it up afresh on the next attempt
+            dns_cache.forget(host, self.port)
+            raise
+        finally:
+            self._dns_host = host
+
+
+class CachedDnsHTTPConnection(_CachedDnsConnectionMixin, HTTPConnection):
+    pass
+
+
+class CachedDnsHTTPSConnection(_CachedDnsConnectionMixin, HTTPSConnection):
+    pass
+
+
+class CachedDnsHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = CachedDnsHTTPConnection
+
+
+class CachedDnsHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CachedDnsHTTPSConnection
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools resolve hosts through the DNS cache."""
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CachedDnsHTTPConnectionPool,
+            'https': CachedDnsHTTPSConnectionPool,
+        }
+
+
+def create_session(
+    pool_size: int = POOL_MAXSIZE,
+    max_retries: int = MAX_RETRIES,
+    backoff_factor: float = BACKOFF_FACTOR
+) -> requests.Session:
+    """
+    Build a session with pooled, retrying connections.
+
+    Args:
+        pool_size: Keep-alive connections kept per host; further concurrent
+            requests to that host wait for a free connection
+        max_retries: Retries on connection errors, 429s and 5xx responses
+        backoff_factor: Base of the exponential backoff between retries
+
+    Returns:
+        A requests.Session; once every retry is used up the last response is
+        returned rather than raised
+    """
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = PooledAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+        pool_block=True
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_pool_size = POOL_MAXSIZE
+
+
+def get_session() -> requests.Session:
+    """The shared session, created on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def current_pool_size() -> int:
+    """Keep-alive connections the shared session keeps per host."""
+    return _pool_size
+
+
+def configure(
+    pool_size: Optional[int] = None,
+    max_retries: Optional[int] = None,
+    backoff_factor: Optional[float] = None,
+    dns_cache_ttl: Optional[float] = None
+) -> None:
+    """
+    Replace the shared session with one built from the given settings.
+
+    Settings left as None use the module defaults. Call it before sending
+    requests; the old session's idle connections are closed.
+    """
+    global _session, _pool_size
+    if dns_cache_ttl is not None:
+        dns_cache.ttl = dns_cache_ttl
+    pool_size = pool_size if pool_size is not None else POOL_MAXSIZE
+    max_retries = max_retries if max_retries is not None else MAX_RETRIES
+    backoff_factor = backoff_factor if backoff_factor is not None else BACKOFF_FACTOR
+    session = create_session(pool_size, max_retries, backoff_factor)
+    with _session_lock:
+        old, _session, _pool_size = _session, session, pool_size
+    if old is not None:
+        old.close()
+    logger.info(
+        f"HTTP client: {pool_size} connections per host, {max_retries} retries, "
+        f"DNS cache TTL {dns_cache.ttl:.0f}s"
+    )
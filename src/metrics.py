@@ -0,0 +1,235 @@
+"""
+In-process crawl metrics.
+
+A small registry of counters, gauges and histograms that the fetch and parse
+paths update. Metrics are written to a JSON or Prometheus text file every
+few seconds and can be served over HTTP, so a slow crawl can be diagnosed
+while it runs.
+"""
+import asyncio
+import bisect
+import json
+import logging
+import math
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DUMP_INTERVAL = 10.0  # Seconds between metric file dumps
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+class Histogram:
+    """Fixed-bucket histogram of observed values."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + [math.inf], self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms keyed by name and labels."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """Add to a counter."""
+        series = self.counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """Set a gauge."""
+        self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Record a value in a histogram."""
+        series = self.histograms.setdefault(name, {})
+        key = _label_key(labels)
+        if key not in series:
+            series[key] = Histogram()
+        series[key].observe(value)
+
+    def value(self, name: str, **labels) -> float:
+        """Current value of a counter or gauge, 0 if unset."""
+        key = _label_key(labels)
+        return self.counters.get(name, {}).get(key, self.gauges.get(name, {}).get(key, 0))
+
+    def reset(self) -> None:
+        self.__init__()
+
+    def to_dict(self) -> Dict[str, object]:
+        """JSON-friendly snapshot, with p50/p90/p99 estimates for histograms."""
+        def series(values: Dict[LabelKey, object]) -> List[Dict[str, object]]:
+            return [{'labels': dict(key), 'value': value} for key, value in values.items()]
+
+        return {
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'counters': {name: series(values) for name, values in self.counters.items()},
+            'gauges': {name: series(values) for name, values in self.gauges.items()},
+            'histograms': {
+                name: [{
+                    'labels': dict(key),
+                    'count': hist.count,
+                    'sum': round(hist.sum, 6),
+                    'p50': hist.quantile(0.5),
+                    'p90': hist.quantile(0.9),
+                    'p99': hist.quantile(0.99),
+                } for key, hist in values.items()]
+                for name, values in self.histograms.items()
+            },
+        }
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        for name, values in self.counters.items():
+            lines.append(f'# TYPE {name} counter')
+            lines.extend(f'{name}{_format_labels(key)} {value}' for key, value in values.items())
+        for name, values in self.gauges.items():
+            lines.append(f'# TYPE {name} gauge')
+            lines.extend(f'{name}{_format_labels(key)} {value}' for key, value in values.items())
+        for name, values in self.histograms.items():
+            lines.append(f'# TYPE {name} histogram')
+            for key, hist in values.items():
+                cumulative = 0
+                for bound, count in zip(hist.buckets + [math.inf], hist.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else repr(bound)
+                    lines.append(f'{name}_bucket{_format_labels(key, ("le", le))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(key)} {hist.sum}')
+                lines.append(f'{name}_count{_format_labels(key)} {hist.count}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path: str) -> None:
+        """Atomically write the metrics; .prom/.txt files get Prometheus text, anything else JSON."""
+        if path.endswith(('.prom', '.txt')):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), indent=2)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+# Shared by every module in the process
+registry = MetricsRegistry()
+
+
+def record_integration_result(found: bool) -> None:
+    """Count one app page checked for integrations and update the hit rate."""
+    registry.inc('apps_checked_total')
+    if found:
+        registry.inc('apps_with_integrations_total')
+    registry.set(
+        'integration_hit_rate',
+        registry.value('apps_with_integrations_total') / registry.value('apps_checked_total')
+    )
+
+
+class MetricsReporter:
+    """Dumps a registry to a file periodically and optionally serves it over HTTP."""
+
+    def __init__(self, metrics: MetricsRegistry, path: Optional[str] = None,
+                 interval: float = DUMP_INTERVAL, port: Optional[int] = None):
+        """
+        Args:
+            metrics: Registry to report
+            path: File to dump to every `interval` seconds, if any
+            interval: Seconds between dumps
+            port: Local port to serve /metrics (Prometheus) and /metrics.json on, if any
+        """
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.port = port
+        self._task: Optional[asyncio.Task] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _dump_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self._dump()
+
+    def _dump(self) -> None:
+        try:
+            self.metrics.dump(self.path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {self.path}: {str(e)}")
+
+    async def _prometheus(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.metrics.to_prometheus(), content_type='text/plain')
+
+    async def _json(self, request: web.Request) -> web.Response:
+        return web.json_response(self.metrics.to_dict())
+
+    async def start(self) -> None:
+        if self.path:
+            self._task = asyncio.ensure_future(self._dump_loop())
+        if self.port:
+            app = web.Application()
+            app.router.add_get('/metrics', self._prometheus)
+            app.router.add_get('/metrics.json', self._json)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, '127.0.0.1', self.port).start()
+            logger.info(f"Serving metrics on http://127.0.0.1:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        """Stop reporting, writing the final metrics."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self.path:
+            self._dump()
+            logger.info(f"Wrote metrics to {self.path}")
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def __aenter__(self) -> 'MetricsReporter':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the app store, for benchmarking and tuning the crawlers.
+
+Serves a generated sitemap index and listing pages templated from
+app_page.html, with configurable latency, 404s, 429 bursts carrying
+Retry-After, and slow or truncated bodies. Run it standalone with
+`python src/mock_app_store.py --port 8080`, or let benchmark_crawl.py start it.
+"""
+import argparse
+import asyncio
+import html
+import logging
+import math
+import os
+import random
+import time
+import zlib
+from typing import List, NamedTuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_PAGE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'app_page.html')
+TEMPLATE_SLUG = 'linkpop'
+TEMPLATE_NAME = 'Linkpop'
+SITEMAP_PAGE_SIZE = 1000  # Listings per child sitemap
+BODY_CHUNK_SIZE = 16 * 1024
+# Real listings show their app details, including "Works with", ahead of the reviews
+REVIEWS_SECTION = '<section id="adp-reviews"'
+
+INTEGRATION_NAMES = [
+    'Klaviyo', 'Mailchimp', 'Gorgias', 'Zendesk', 'HubSpot', 'Slack', 'Google Analytics',
+    'Facebook', 'Instagram', 'TikTok', 'Salesforce', 'QuickBooks', 'Xero', 'Stripe',
+    'PayPal', 'Zapier', 'Yotpo', 'Judge.me', 'Recharge', 'ShipStation'
+]
+
+
+class MockConfig(NamedTuple):
+    """Behaviour of the mock app store."""
+    num_apps: int = 2000
+    integration_rate: float = 0.5  # Share of listings that mention integrations
+    not_found_rate: float = 0.05  # Share of sitemap listings that answer 404
+    latency: str = 'lognormal'  # constant, uniform, exponential or lognormal
+    latency_mean: float = 0.05  # Mean response latency in seconds
+    latency_sigma: float = 0.5  # Spread of the lognormal distribution
+    burst_every: float = 0.0  # Seconds between 429 bursts; 0 disables them
+    burst_length: float = 2.0  # Seconds each 429 burst lasts
+    retry_after: int = 1  # Retry-After sent with 429s
+    slow_rate: float = 0.0  # Share of pages whose body trickles out
+    slow_chunk_delay: float = 0.05  # Delay between body chunks of a slow page
+    truncate_rate: float = 0.0  # Share of pages whose body is cut off mid-way
+    seed: int = 0
+
+
+def mock_slug(i: int) -> str:
+    return f'mock-app-{i}'
+
+
+def mock_name(i: int) -> str:
+    return f'Mock App {i}'
+
+
+class MockAppStore:
+    """aiohttp application serving a synthetic app catalog."""
+
+    def __init__(self, config: MockConfig, template_path: str = TEMPLATE_PAGE):
+        self.config = config
+        self.started = time.monotonic()
+        self.requests = 0
+        rng = random.Random(config.seed)
+
+        with open(template_path, encoding='utf-8') as f:
+            self.template = f.read()
+
+        # Fix each listing's fate up front so repeated runs see the same catalog
+        self.missing = {i for i in range(config.num_apps) if rng.random() < config.not_found_rate}
+        self.integrations = {
+            i: rng.sample(INTEGRATION_NAMES, rng.randint(1, 4))
+            for i in range(config.num_apps) if rng.random() < config.integration_rate
+        }
+        self._rng = random.Random(config.seed + 1)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/sitemap.xml', self.sitemap_index)
+        app.router.add_get('/sitemap-apps-{page:\\d+}.xml', self.sitemap_page)
+        app.router.add_get('/{slug}', self.listing)
+        return app
+
+    async def _delay(self) -> None:
+        config = self.config
+        if config.latency == 'constant':
+            delay = config.latency_mean
+        elif config.latency == 'uniform':
+            delay = self._rng.uniform(0, 2 * config.latency_mean)
+        elif config.latency == 'exponential':
+            delay = self._rng.expovariate(1 / config.latency_mean) if config.latency_mean else 0
+        else:
+            # Lognormal with the requested mean
+            delay = 0.0
+            if config.latency_mean:
+                mu = math.log(config.latency_mean) - config.latency_sigma ** 2 / 2
+                delay = self._rng.lognormvariate(mu, config.latency_sigma)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _in_burst(self) -> bool:
+        if not self.config.burst_every:
+            return False
+        return (time.monotonic() - self.started) % self.config.burst_every < self.config.burst_length
+
+    def _throttled(self) -> web.Response:
+        return web.Response(status=429, headers={'Retry-After': str(self.config.retry_after)})
+
+    async def sitemap_index(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        pages = (self.config.num_apps + SITEMAP_PAGE_SIZE - 1) // SITEMAP_PAGE_SIZE
+        base = 'https://apps.shopify.com'
+        body = ''.join(f'<sitemap><loc>{base}/sitemap-apps-{p}.xml</loc></sitemap>' for p in range(pages))
+        return web.Response(
+            text=f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{body}</sitemapindex>',
+            content_type='application/xml'
+        )
+
+    async def sitemap_page(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await self._delay()
+        page = int(request.match_info['page'])
+        start = page * SITEMAP_PAGE_SIZE
+        entries = ''.join(
+            f'<url><loc>https://apps.shopify.com/{mock_slug(i)}</loc><lastmod>2024-01-01</lastmod></url>'
+            for i in range(start, min(start + SITEMAP_PAGE_SIZE, self.config.num_apps))
+        )
+        xml = f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'
+        return web.Response(body=zlib.compress(xml.encode('utf-8'), wbits=16 + zlib.MAX_WBITS),
+                            content_type='application/x-gzip')
+
+    def render(self, i: int) -> bytes:
+        """Listing page for app `i`, built from the template page."""
+        page = self.template.replace(TEMPLATE_SLUG, mock_slug(i)).replace(TEMPLATE_NAME, mock_name(i))
+        names = self.integrations.get(i)
+        if names:
+            items = ''.join(f'<li><a href="#">{html.escape(n)}</a></li>' for n in names)
+            block = (
+                f'<div class="app-details"><section><h2>Works with</h2><ul>{items}</ul></section>'
+                f'<div class="description">This app integrates with {html.escape(names[0])}. '
+                f'Syncs with {html.escape(", ".join(names))}.</div></div>'
+            )
+            anchor = REVIEWS_SECTION if REVIEWS_SECTION in page else '</body>'
+            page = page.replace(anchor, block + anchor, 1)
+        return page.encode('utf-8')
+
+    async def listing(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        await self._delay()
+        if self._in_burst():
+            return self._throttled()
+
+        slug = request.match_info['slug']
+        prefix = 'mock-app-'
+        if not slug.startswith(prefix) or not slug[len(prefix):].isdigit():
+            return web.Response(status=404)
+        i = int(slug[len(prefix):])
+        if i >= self.config.num_apps or i in self.missing:
+            return web.Response(status=404)
+
+        body = self.render(i)
+        if request.method == 'HEAD':
+            return web.Response(headers={'Content-Type': 'text/html', 'Content-Length': str(len(body))})
+
+        slow = self._rng.random() < self.config.slow_rate
+        truncated = self._rng.random() < self.config.truncate_rate
+        if not slow and not truncated:
+            return web.Response(body=body, content_type='text/html')
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/html; charset=utf-8'})
+        response.content_length = len(body)
+        await response.prepare(request)
+        end = len(body) // 2 if truncated else len(body)
+        try:
+            for offset in range(0, end, BODY_CHUNK_SIZE):
+                await response.write(body[offset:min(offset + BODY_CHUNK_SIZE, end)])
+                if slow:
+                    await asyncio.sleep(self.config.slow_chunk_delay)
+        except ConnectionResetError:
+            # The client stopped reading once it had what it needed
+            return response
+        if truncated:
+            # Drop the connection short of Content-Length
+            request.transport.close()
+            return response
+        await response.write_eof()
+        return response
+
+
+def config_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add one command-line option per MockConfig field."""
+    for field, default in MockConfig._field_defaults.items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(default), default=default)
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(**{field: getattr(args, field) for field in MockConfig._fields})
+
+
+def config_to_argv(config: MockConfig) -> List[str]:
+    """Command-line options reproducing `config`."""
+    argv = []
+    for field in MockConfig._fields:
+        argv += [f"--{field.replace('_', '-')}", str(getattr(config, field))]
+    return argv
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description='Serve a mock app store for crawler benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    config_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    store = MockAppStore(config_from_args(args))
+    logger.info(
+        f"Serving {store.config.num_apps} mock apps on http://{args.host}:{args.port} "
+        f"({len(store.integrations)} with integrations, {len(store.missing)} missing)"
+    )
+    web.run_app(store.app(), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Persistent store of URLs that led nowhere.
+
+Listings that 404, pages that are not app listings and apps without
+integrations are remembered across runs with the time they were checked, so
+the scrapers skip them until their entry expires. Whether a listing has
+integrations depends on the extractor, so each scraper keeps its own file.
+An in-memory Bloom filter
+answers the common "never seen" case without touching SQLite; only its
+(rare) positives are confirmed against the exact on-disk table.
+"""
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, Iterator, Optional
+
+from crawl_journal import NO_INTEGRATIONS, NOT_AN_APP, NOT_FOUND
+from http_cache import cache_key
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+# How long each kind of dead end is trusted before the URL is checked again;
+# listings gain integrations more often than missing pages reappear
+TTLS = {
+    NOT_FOUND: 30 * DAY,
+    NOT_AN_APP: 30 * DAY,
+    NO_INTEGRATIONS: 7 * DAY,
+}
+MIN_CAPACITY = 100_000  # Smallest number of URLs the Bloom filter is sized for
+FALSE_POSITIVE_RATE = 0.01
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings."""
+
+    def __init__(self, capacity: int, error_rate: float = FALSE_POSITIVE_RATE):
+        """
+        Args:
+            capacity: Number of items the filter is sized for
+            error_rate: False positive rate at that capacity
+        """
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        # Double hashing: k positions from two independent 64-bit hashes
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class NegativeCache:
+    """Dead-end URLs with per-outcome TTLs, fronted by a Bloom filter."""
+
+    def __init__(self, path: str, ttls: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            path: SQLite database holding the exact entries
+            ttls: Seconds each outcome stays valid; defaults to TTLS
+        """
+        self.path = path
+        self.ttls = dict(TTLS if ttls is None else ttls)
+        self.consult = True  # When False, lookups always miss but outcomes are still recorded
+        self.skips = 0
+        self.false_positives = 0
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30.0, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS negatives (
+                key TEXT PRIMARY KEY,
+                outcome TEXT NOT NULL,
+                checked_at REAL NOT NULL
+            )
+        ''')
+        self._prune()
+        self._rebuild_filter()
+
+    def _prune(self) -> None:
+        """Drop expired entries."""
+        now = time.time()
+        removed = 0
+        for outcome, ttl in self.ttls.items():
+            removed += self._db.execute(
+                'DELETE FROM negatives WHERE outcome = ? AND checked_at < ?', (outcome, now - ttl)
+            ).rowcount
+        if removed:
+            logger.info(f"Expired {removed} negative cache entries")
+
+    def _rebuild_filter(self) -> None:
+        count = self._db.execute('SELECT COUNT(*) FROM negatives').fetchone()[0]
+        self._bloom = BloomFilter(max(MIN_CAPACITY, count * 2))
+        for (key,) in self._db.execute('SELECT key FROM negatives'):
+            self._bloom.add(key)
+        logger.info(f"Loaded {count} known dead-end URLs from {self.path}")
+
+    def check(self, url: str) -> Optional[str]:
+        """
+        Look up a URL.
+
+        Returns:
+            The outcome remembered for the URL if it is still fresh, else None
+        """
+        if not self.consult:
+            return None
+        key = cache_key(url)
+        if key not in self._bloom:
+            return None
+        row = self._db.execute('SELECT outcome, checked_at FROM negatives WHERE key = ?', (key,)).fetchone()
+        if not row:
+            self.false_positives += 1
+            return None
+        outcome, checked_at = row
+        if time.time() - checked_at > self.ttls.get(outcome, 0):
+            return None
+        self.skips += 1
+        return outcome
+
+    def record(self, url: str, outcome: str) -> None:
+        """Remember that a URL led to `outcome`."""
+        key = cache_key(url)
+        self._db.execute('INSERT OR REPLACE INTO negatives VALUES (?, ?, ?)', (key, outcome, time.time()))
+        self._bloom.add(key)
+        if self._bloom.count > self._bloom.capacity:
+            self._rebuild_filter()
+
+    def forget(self, url: str) -> None:
+        """Drop a URL that turned out to be useful after all."""
+        key = cache_key(url)
+        if key in self._bloom:
+            self._db.execute('DELETE FROM negatives WHERE key = ?', (key,))
+
+    def keys(self, outcome: str) -> Iterator[str]:
+        """Canonical URLs currently remembered with `outcome`."""
+        cutoff = time.time() - self.ttls.get(outcome, 0)
+        for (key,) in self._db.execute(
+            'SELECT key FROM negatives WHERE outcome = ? AND checked_at >= ?', (outcome, cutoff)
+        ).fetchall():
+            yield key
+
+    def stats(self) -> Dict[str, int]:
+        """Entry count per outcome and lookup counters."""
+        stats = dict(self._db.execute('SELECT outcome, COUNT(*) FROM negatives GROUP BY outcome').fetchall())
+        stats.update(skips=self.skips, false_positives=self.false_positives)
+        return stats
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,240 @@
+"""
+Raw page archive in WARC format.
+
+Fetched listing pages are appended as WARC/1.1 response records to
+gzip-compressed WARC files, one gzip member per record, so any record can be
+decompressed on its own. A SQLite index maps each page's canonical URL to
+the file, offset and length of its latest record, which lets
+reextract_pages.py re-run extraction over thousands of pages without
+fetching anything. The files are standard .warc.gz and also open in other
+WARC tools.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import socket
+import sqlite3
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, Iterator, NamedTuple, Optional, Tuple
+
+from http_cache import CachedResponse, cache_key
+
+logger = logging.getLogger(__name__)
+
+MAX_FILE_BYTES = 1024 * 1024 * 1024  # Compressed size at which a new WARC file is started
+COMPRESS_LEVEL = 6
+INDEX_FILE = 'index.sqlite'
+BUSY_TIMEOUT = 30.0  # Seconds to wait for another crawler process's index lock
+
+HTTP_REASONS = {200: 'OK', 404: 'Not Found'}
+
+
+class ArchivedPage(NamedTuple):
+    """A page read back from the archive."""
+    url: str
+    status: int
+    body: bytes
+    encoding: Optional[str]
+    fetched_at: str
+    truncated: bool
+
+
+class IndexEntry(NamedTuple):
+    """Where a page's latest record sits."""
+    url: str
+    path: str
+    offset: int
+    length: int
+
+
+def _gzip_member(data: bytes) -> bytes:
+    """Compress `data` as one self-contained gzip member."""
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _warc_record(warc_type: str, block: bytes, headers: Dict[str, str]) -> bytes:
+    """Serialize one WARC/1.1 record with the given type-specific headers."""
+    fields = {
+        'WARC-Type': warc_type,
+        'WARC-Record-ID': f'<urn:uuid:{uuid.uuid4()}>',
+        'WARC-Date': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        **headers,
+        'WARC-Block-Digest': 'sha1:' + hashlib.sha1(block).hexdigest(),
+        'Content-Length': str(len(block)),
+    }
+    head = 'WARC/1.1\r\n' + ''.join(f'{name}: {value}\r\n' for name, value in fields.items()) + '\r\n'
+    return head.encode('utf-8') + block + b'\r\n\r\n'
+
+
+def _http_block(response: CachedResponse) -> bytes:
+    """Reconstruct the HTTP response message a WARC response record holds."""
+    content_type = 'text/html' + (f'; charset={response.encoding}' if response.encoding else '')
+    head = (
+        f'HTTP/1.1 {response.status} {HTTP_REASONS.get(response.status, "")}\r\n'
+        f'Content-Type: {content_type}\r\n'
+        f'Content-Length: {len(response.body)}\r\n\r\n'
+    )
+    return head.encode('latin-1') + response.body
+
+
+def _parse_headers(lines: bytes) -> Dict[str, str]:
+    headers = {}
+    for line in lines.split(b'\r\n')[1:]:
+        name, _, value = line.decode('utf-8', errors='replace').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def parse_record(data: bytes) -> ArchivedPage:
+    """Parse a decompressed WARC response record back into the page it holds."""
+    warc_head, _, rest = data.partition(b'\r\n\r\n')
+    warc = _parse_headers(warc_head)
+    block = rest[:int(warc['content-length'])]
+    http_head, _, body = block.partition(b'\r\n\r\n')
+    status = int(http_head.split(b'\r\n', 1)[0].split()[1])
+    content_type = _parse_headers(http_head).get('content-type', '')
+    encoding = content_type.split('charset=', 1)[1].strip() if 'charset=' in content_type else None
+    return ArchivedPage(
+        warc['warc-target-uri'], status, body, encoding,
+        warc.get('warc-date', ''), 'warc-truncated' in warc
+    )
+
+
+class PageArchive:
+    """Appends fetched pages to rotating .warc.gz files and indexes them by URL."""
+
+    def __init__(self, directory: str, max_file_bytes: int = MAX_FILE_BYTES):
+        """
+        Args:
+            directory: Directory holding the WARC files and their index
+            max_file_bytes: Size at which the current file is closed and a new one started
+        """
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.written = 0
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, INDEX_FILE), timeout=BUSY_TIMEOUT, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS records (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                file TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                archived_at REAL NOT NULL
+            )
+        ''')
+        self._file = None
+        self._path: Optional[str] = None
+        self._files_opened = 0
+
+    def _open_file(self) -> None:
+        # Every process writes its own files, so sharded workers never interleave records
+        self._files_opened += 1
+        name = (
+            f"pages-{time.strftime('%Y%m%d%H%M%S')}-{socket.gethostname()}-{os.getpid()}"
+            f"-{self._files_opened:05d}.warc.gz"
+        )
+        self._path = os.path.join(self.directory, name)
+        self._file = open(self._path, 'ab')
+        logger.info(f"Archiving pages to {self._path}")
+        info = b'software: app-listing-integrations-analysis\r\nformat: WARC File Format 1.1\r\n'
+        self._file.write(_gzip_member(_warc_record('warcinfo', info, {
+            'WARC-Filename': name,
+            'Content-Type': 'application/warc-fields',
+        })))
+
+    def has(self, url: str) -> bool:
+        """Whether a record of the page is archived."""
+        return self._db.execute('SELECT 1 FROM records WHERE key = ?', (cache_key(url),)).fetchone() is not None
+
+    def add(self, url: str, response: CachedResponse) -> None:
+        """
+        Archive a fetched page.
+
+        Pages served from the response cache are only archived if the
+        archive has no record of them yet, so unchanged pages are not
+        stored again on every run.
+        """
+        if response.from_cache and self.has(url):
+            return
+        if self._file is None or self._file.tell() >= self.max_file_bytes:
+            self.close_file()
+            self._open_file()
+
+        headers = {
+            'WARC-Target-URI': url,
+            'Content-Type': 'application/http; msgtype=response',
+        }
+        if response.truncated:
+            headers['WARC-Truncated'] = 'length'
+        member = _gzip_member(_warc_record('response', _http_block(response), headers))
+        offset = self._file.tell()
+        self._file.write(member)
+        self._file.flush()
+        self._db.execute(
+            'INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?)',
+            (cache_key(url), url, os.path.basename(self._path), offset, len(member), time.time())
+        )
+        self.written += 1
+
+    def entries(self) -> Iterator[IndexEntry]:
+        """Latest record of every archived page, grouped by file and in file order."""
+        for url, name, offset, length in self._db.execute(
+            'SELECT url, file, offset, length FROM records ORDER BY file, offset'
+        ).fetchall():
+            yield IndexEntry(url, os.path.join(self.directory, name), offset, length)
+
+    def get(self, url: str) -> Optional[ArchivedPage]:
+        """Read the latest archived copy of a page."""
+        row = self._db.execute('SELECT url, file, offset, length FROM records WHERE key = ?', (cache_key(url),)).fetchone()
+        if not row:
+            return None
+        if self._file is not None:
+            self._file.flush()
+        return read_entry(IndexEntry(row[0], os.path.join(self.directory, row[1]), row[2], row[3]))
+
+    def stats(self) -> Dict[str, int]:
+        """Pages indexed, WARC files on disk and records written by this process."""
+        count = self._db.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+        files = sum(1 for name in os.listdir(self.directory) if name.endswith('.warc.gz'))
+        return {'pages': count, 'files': files, 'written': self.written}
+
+    def close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self) -> None:
+        self.close_file()
+        self._db.close()
+
+    def __enter__(self) -> 'PageArchive':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+# Memory maps of the WARC files opened by this process, reused across reads
+_maps: Dict[str, Tuple[BinaryIO, mmap.mmap]] = {}
+
+
+def read_entry(entry: IndexEntry) -> ArchivedPage:
+    """Read one indexed record through a memory map of its file."""
+    if entry.path not in _maps:
+        handle = open(entry.path, 'rb')
+        _maps[entry.path] = (handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ))
+    _, mapped = _maps[entry.path]
+    if entry.offset + entry.length > len(mapped):
+        # The file grew since it was mapped
+        _maps.pop(entry.path)[1].close()
+        return read_entry(entry)
+    data = zlib.decompress(mapped[entry.offset:entry.offset + entry.length], 16 + zlib.MAX_WBITS)
+    return parse_record(data)
@@ -0,0 +1,175 @@
+"""
+Staged async pipeline with bounded queues.
+
+Each stage runs its own number of workers and hands results to the next
+stage through a bounded queue, so a slow stage makes the stages before it
+wait instead of letting work pile up in memory. Every stage tracks how much
+of its workers' time went into processing, into waiting on a full
+downstream queue, and into waiting for input, which shows the bottleneck.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+REPORT_INTERVAL = 30.0  # Seconds between utilization reports
+
+END = None  # Sentinel closing a stage's input; one per worker
+
+
+class Stage:
+    """One pipeline step: `concurrency` workers applying `handler` to items from a bounded queue."""
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[Any]],
+        concurrency: int = 1,
+        queue_size: Optional[int] = None,
+        batch_size: int = 1
+    ):
+        """
+        Args:
+            name: Stage name used in reports and metrics
+            handler: Coroutine function turning an item into the item for the
+                next stage; returning None drops it
+            concurrency: Number of workers
+            queue_size: Capacity of the input queue; twice `concurrency` by default
+            batch_size: If above 1, the handler receives lists of up to this
+                many items already waiting in the queue
+        """
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size or 2 * concurrency)
+        self.next: Optional['Stage'] = None
+        self.processed = 0
+        self.busy = 0.0  # Worker-seconds spent in the handler
+        self.blocked = 0.0  # Worker-seconds spent waiting on a full downstream queue
+
+    def _take_batch(self, first: Any) -> Tuple[List[Any], bool]:
+        """Collect up to batch_size items without waiting; also reports whether END was seen."""
+        items = [first]
+        while len(items) < self.batch_size:
+            try:
+                item = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if item is END:
+                return items, True
+            items.append(item)
+        return items, False
+
+    async def _work(self) -> None:
+        while True:
+            item = await self.queue.get()
+            if item is END:
+                return
+            ended = False
+            if self.batch_size > 1:
+                item, ended = self._take_batch(item)
+
+            started = time.monotonic()
+            result = await self.handler(item)
+            self.busy += time.monotonic() - started
+            self.processed += len(item) if self.batch_size > 1 else 1
+
+            if result is not None and self.next is not None:
+                started = time.monotonic()
+                await self.next.queue.put(result)
+                self.blocked += time.monotonic() - started
+            if ended:
+                return
+
+    async def run(self) -> None:
+        """Run the workers until their input is closed, then close the next stage's input."""
+        workers = [asyncio.ensure_future(self._work()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        if self.next is not None:
+            for _ in range(self.next.concurrency):
+                await self.next.queue.put(END)
+
+
+class Pipeline:
+    """Stages connected in order by bounded queues."""
+
+    def __init__(self, stages: List[Stage], report_interval: float = REPORT_INTERVAL):
+        """
+        Args:
+            stages: Stages in processing order
+            report_interval: Seconds between utilization log lines
+        """
+        self.stages = stages
+        self.report_interval = report_interval
+        for stage, following in zip(stages, stages[1:]):
+            stage.next = following
+        self._started: Optional[float] = None
+
+    @property
+    def input(self) -> asyncio.Queue:
+        """Queue feeding the first stage; close it with one END per first-stage worker."""
+        return self.stages[0].queue
+
+    async def _monitor(self) -> None:
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.report()
+
+    async def run(self) -> None:
+        """Run every stage until the input is closed and all items have passed through."""
+        self._started = time.monotonic()
+        monitor = asyncio.ensure_future(self._monitor())
+        stages = [asyncio.ensure_future(stage.run()) for stage in self.stages]
+        try:
+            await asyncio.gather(*stages)
+        finally:
+            # A failed stage stops the others rather than leaving them blocked on its queue
+            for task in stages:
+                task.cancel()
+            monitor.cancel()
+            await asyncio.gather(*stages, monitor, return_exceptions=True)
+            self.report()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-stage throughput and shares of worker time busy, blocked downstream and idle."""
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        stats = []
+        for stage in self.stages:
+            capacity = elapsed * stage.concurrency
+            busy = stage.busy / capacity if capacity else 0.0
+            blocked = stage.blocked / capacity if capacity else 0.0
+            stats.append({
+                'stage': stage.name,
+                'workers': stage.concurrency,
+                'processed': stage.processed,
+                'queued': stage.queue.qsize(),
+                'busy': round(busy, 3),
+                'blocked': round(blocked, 3),
+                'idle': round(max(0.0, 1 - busy - blocked), 3),
+            })
+        return stats
+
+    def report(self) -> None:
+        """Log stage utilization, name the busiest stage, and publish the figures as metrics."""
+        stats = self.stats()
+        for stage in stats:
+            registry.set('stage_utilization', stage['busy'], stage=stage['stage'])
+            registry.set('stage_blocked', stage['blocked'], stage=stage['stage'])
+            registry.set('queue_depth', stage['queued'], queue=stage['stage'])
+        logger.info("Pipeline: " + ', '.join(
+            f"{s['stage']} x{s['workers']} {s['processed']} done, {s['queued']} queued, "
+            f"{s['busy']:.0%} busy/{s['blocked']:.0%} blocked" for s in stats
+        ))
+        if stats:
+            bottleneck = max(stats, key=lambda s: s['busy'])
+            logger.info(f"Pipeline bottleneck: {bottleneck['stage']} ({bottleneck['busy']:.0%} busy)")
@@ -2,10 +2,13 @@
 """
 Script to process and standardize integration data from scraped app information.
 """
+import argparse
 import os
 import logging
 import pandas as pd
-from typing import List, Dict, Set
+from typing import List, Dict, Optional, Set
+
+from fingerprints import FINGERPRINT_COLUMN, fingerprint_rows, load_previous, log_reuse, previous_values, unchanged_rows
 
 # Configuration
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
@@ -73,21 +76,32 @@ def standardize_integration_name(name: str) -> str:
     
     return name
 
-def process_integrations(df: pd.DataFrame) -> pd.DataFrame:
+def process_integrations(df: pd.DataFrame, previous: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     Process and standardize integration data from the DataFrame.
+    
+    Rows whose content fingerprint matches their app's row in `previous` (the
+    last processed output, see fingerprints.load_previous) keep its results
+    instead of being processed again.
     """
     logger.info("Starting integration processing")
     
     # Create new DataFrame for processed data
     processed_df = df.copy()
+    processed_df[FINGERPRINT_COLUMN] = fingerprint_rows(df)
+    unchanged = unchanged_rows(processed_df, previous)
+    log_reuse("Integration processing", unchanged)
     
-    # Initialize new columns
-    processed_df['processed_integrations'] = ''
-    processed_df['integration_count'] = 0
+    # Initialize new columns, carrying over the results of unchanged rows
+    processed_df['processed_integrations'] = previous_values(
+        processed_df, previous, unchanged, 'processed_integrations'
+    ).fillna('')
+    processed_df['integration_count'] = previous_values(
+        processed_df, previous, unchanged, 'integration_count'
+    ).fillna(0).astype(int)
     
-    # Process each row
-    for idx, row in processed_df.iterrows():
+    # Process each changed row
+    for idx, row in processed_df[~unchanged].iterrows():
         if pd.isna(row['integrations']) or not row['integrations'].strip():
             continue
             
@@ -126,6 +140,11 @@ def process_integrations(df: pd.DataFrame) -> pd.DataFrame:
 
 def main():
     """Main entry point."""
+    parser = argparse.ArgumentParser(description='Standardize the integrations of scraped apps')
+    parser.add_argument('--full', action='store_true',
+                      help=f'Reprocess every row, not only those changed since the last {PROCESSED_FILE}; needed after changing the rules')
+    args = parser.parse_args()
+    
     try:
         # Create data directory if it doesn't exist
         os.makedirs(DATA_DIR, exist_ok=True)
@@ -134,8 +153,9 @@ def main():
         logger.info(f"Reading raw data from {RAW_FILE}")
         df = pd.read_csv(RAW_FILE)
         
-        # Process integrations
-        processed_df = process_integrations(df)
+        # Process integrations, reusing the last output for unchanged apps
+        previous = None if args.full else load_previous(PROCESSED_FILE)
+        processed_df = process_integrations(df, previous)
         
         # Save processed data
         logger.info(f"Saving processed data to {PROCESSED_FILE}")
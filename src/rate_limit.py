@@ -0,0 +1,203 @@
+"""
+Request pacing for the async scrapers.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket that paces callers to `rate` requests per second."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        """
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum number of tokens that can accumulate (burst size)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for at least `seconds`."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    @property
+    def paused(self) -> bool:
+        """Whether callers are currently held back by a pause."""
+        return time.monotonic() < self._paused_until
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+        # The lock makes waiters queue up in arrival order instead of all
+        # waking at once and racing for the same token.
+        async with self._lock:
+            while True:
+                paused_for = self._paused_until - time.monotonic()
+                if paused_for > 0:
+                    await asyncio.sleep(paused_for)
+                    self._updated = time.monotonic()
+                    continue
+                self._refill()
+                if self._tokens >= 1:
+                    break
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+            self._tokens -= 1
+
+
+class HostRateLimiter:
+    """Keeps one token bucket per host so every host is paced independently."""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        """
+        Args:
+            rate: Requests per second allowed for each host
+            burst: Number of requests a host may receive back to back
+        """
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, url: str) -> TokenBucket:
+        """Get the token bucket for the host of `url`."""
+        host = urlparse(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return self._buckets[host]
+
+    async def acquire(self, url: str) -> None:
+        """Wait for permission to send a request to the host of `url`."""
+        await self.bucket(url).acquire()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class AdaptiveRateController(HostRateLimiter):
+    """
+    Per-host rate limiter that adapts to how the server responds.
+    
+    Healthy responses raise a host's rate additively, 429 and 5xx responses
+    cut it multiplicatively, and a Retry-After header pauses every caller
+    for that host rather than only the request that received it; a 429 always
+    pauses the host for at least one request interval. Throttled
+    responses arriving while the host is paused, or within one request
+    interval of the last cut, belong to the same throttle episode and do not
+    cut the rate again.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float = 1.0,
+        min_rate: float = 0.05,
+        max_rate: float = 5.0,
+        increase: float = 0.05,
+        decrease: float = 0.5,
+        default_retry_after: float = 60.0
+    ):
+        """
+        Args:
+            rate: Starting requests per second for each host
+            burst: Number of requests a host may receive back to back
+            min_rate: Lowest rate a host can be cut to
+            max_rate: Highest rate a host can be raised to
+            increase: Requests per second added after each healthy response
+            decrease: Factor the rate is multiplied by when throttled
+            default_retry_after: Pause applied on 429 without a Retry-After header
+        """
+        super().__init__(rate, burst)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.default_retry_after = default_retry_after
+        self.throttle_count = 0
+        self.throttle_events: Deque[Dict[str, Any]] = deque(maxlen=100)
+        self._last_cut: Dict[str, float] = {}
+
+    def record(self, url: str, status: Optional[int], retry_after: Optional[str] = None) -> None:
+        """
+        Feed the outcome of a request back into the controller.
+        
+        Args:
+            url: URL that was requested
+            status: HTTP status code, or None if the request failed without a response
+            retry_after: Raw Retry-After header value, if any
+        """
+        bucket = self.bucket(url)
+        throttled = status is None or status == 429 or status >= 500
+        
+        if not throttled:
+            bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+            return
+        
+        host = urlparse(url).netloc
+        # Requests already in flight when the host pushed back report the
+        # same episode; cutting for each would compound the decrease
+        now = time.monotonic()
+        same_episode = bucket.paused or now - self._last_cut.get(host, float('-inf')) < 1 / bucket.rate
+        
+        pause = parse_retry_after(retry_after)
+        if status == 429:
+            # Callers retry a 429 straight away and rely on this pause, so
+            # "Retry-After: 0" or a date already past still waits one interval
+            pause = max(self.default_retry_after if pause is None else pause, 1 / bucket.rate)
+        if pause is not None:
+            bucket.pause(pause)
+        if same_episode:
+            logger.debug(f"Throttled by {host} (status {status}) within the current episode")
+            return
+        
+        bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+        self._last_cut[host] = now
+        self.throttle_count += 1
+        self.throttle_events.append({
+            'time': datetime.now(timezone.utc).isoformat(),
+            'host': host,
+            'status': status,
+            'pause': pause or 0.0,
+            'rate': bucket.rate
+        })
+        logger.warning(
+            f"Throttled by {host} (status {status}): "
+            f"rate now {bucket.rate:.2f} req/s, pausing {pause or 0:.1f}s"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Current per-host rates and throttle history, for tuning."""
+        return {
+            'rates': {host: bucket.rate for host, bucket in self._buckets.items()},
+            'throttle_count': self.throttle_count,
+            'recent_throttles': list(self.throttle_events)
+        }
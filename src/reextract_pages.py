@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Re-run extraction over pages kept in the WARC page archive.
+
+Crawls started with --archive keep every listing page they fetch (see
+page_archive.py). This replays those pages through the current parsers on
+every core, without touching the network, so a change to the extraction
+rules can be checked against thousands of real pages in minutes:
+
+    python src/scrape_sitemap.py --archive data/archive
+    python src/reextract_pages.py --parser app --output data/top_apps_reextracted.csv
+    python src/reextract_pages.py --parser listing --output data/listings_reextracted.csv
+
+Workers memory-map the archive files and decompress only the records they
+are handed, so nothing but the extracted rows passes between processes.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from csv_sink import CsvSink
+from extractors import parse_app_info_lxml, parse_listing_page, prefilter_listing_page
+from page_archive import INDEX_FILE, IndexEntry, PageArchive, read_entry
+from standardize_integrations import standardize_integration_name
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+ARCHIVE_DIR = os.path.join(DATA_DIR, 'archive')
+WORKERS = os.cpu_count() or 1
+CHUNK_SIZE = 64  # Records handed to a worker at a time
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+# The parsers log every page at INFO, which drowns out progress with many workers
+logging.getLogger('extractors').setLevel(logging.WARNING)
+
+
+def extract_app(entry: IndexEntry) -> Tuple[bool, Dict]:
+    """Run the scrape_sitemap extraction on one archived page."""
+    page = read_entry(entry)
+    app_info = parse_app_info_lxml(page.body, page.url, page.encoding)
+    if not app_info:
+        return False, {'app_store_url': page.url}
+    names = (standardize_integration_name(name) for name in app_info['integrations'].split(','))
+    return bool(app_info['integrations']), {
+        **app_info,
+        'standardized_integrations': ','.join(dict.fromkeys(name for name in names if name)),
+        'truncated': page.truncated
+    }
+
+
+def extract_listing(entry: IndexEntry) -> Tuple[bool, Dict]:
+    """Run the scrape_integrations validation and extraction on one archived page."""
+    page = read_entry(entry)
+    result = prefilter_listing_page(page.body, page.encoding)
+    if result is None:
+        result = parse_listing_page(page.body, page.url, page.encoding)
+    return bool(result['integrations']), {
+        'url': page.url,
+        'valid': result['valid'],
+        'page_found': result['page_found'],
+        'integrations': ','.join(result['integrations']),
+        'truncated': page.truncated
+    }
+
+
+EXTRACTORS = {
+    'app': extract_app,
+    'listing': extract_listing,
+}
+
+# Output columns per parser, so rows of pages that failed to parse line up
+FIELDNAMES = {
+    'app': [
+        'api_key', 'app_name', 'app_store_url', 'app_details', 'app_submission_created_at',
+        'integrations', 'content_fingerprint', 'standardized_integrations', 'truncated'
+    ],
+    'listing': ['url', 'valid', 'page_found', 'integrations', 'truncated'],
+}
+
+
+def extract_chunk(parser: str, entries: List[IndexEntry]) -> List[Tuple[bool, Dict]]:
+    """Extract a chunk of records; runs in a worker process."""
+    extract = EXTRACTORS[parser]
+    results = []
+    for entry in entries:
+        try:
+            results.append(extract(entry))
+        except Exception as e:
+            logger.error(f"Could not re-extract {entry.url} from {entry.path}: {str(e)}")
+    return results
+
+
+def chunked(entries: Iterable[IndexEntry], size: int) -> Iterator[List[IndexEntry]]:
+    """Consecutive chunks of index entries, which keeps each worker within few files."""
+    entries = iter(entries)
+    while True:
+        chunk = list(islice(entries, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def reextract(archive_dir: str, parser: str, sink: CsvSink, workers: int = WORKERS, keep_empty: bool = False) -> Dict[str, int]:
+    """
+    Re-extract every page in an archive into `sink`.
+
+    Args:
+        archive_dir: Directory of the page archive
+        parser: 'app' for the scrape_sitemap extraction, 'listing' for scrape_integrations'
+        sink: Output rows are written to
+        workers: Processes extracting in parallel; 1 runs inline
+        keep_empty: Also write pages without integrations
+
+    Returns:
+        Pages read, pages with integrations and rows written
+    """
+    with PageArchive(archive_dir) as archive:
+        entries = list(archive.entries())
+    logger.info(f"Re-extracting {len(entries)} archived pages with the {parser} parser on {workers} workers")
+
+    counts = {'pages': 0, 'with_integrations': 0, 'written': 0}
+    started = time.monotonic()
+    chunks = chunked(entries, CHUNK_SIZE)
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(extract_chunk, repeat(parser), chunks)
+    else:
+        executor = None
+        results = (extract_chunk(parser, chunk) for chunk in chunks)
+    try:
+        for chunk_results in results:
+            for has_integrations, row in chunk_results:
+                counts['pages'] += 1
+                counts['with_integrations'] += has_integrations
+                if has_integrations or keep_empty:
+                    sink.write(row)
+                    counts['written'] += 1
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"Re-extracted {counts['pages']} pages in {elapsed:.1f}s "
+        f"({counts['pages'] / elapsed if elapsed else 0:.0f} pages/s), "
+        f"{counts['with_integrations']} with integrations"
+    )
+    return counts
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description='Re-run extraction over archived listing pages without fetching them')
+    parser.add_argument('--archive', default=ARCHIVE_DIR,
+                      help='Page archive written by a crawl run with --archive')
+    parser.add_argument('--parser', choices=sorted(EXTRACTORS), default='app',
+                      help='app: the scrape_sitemap app records; listing: the scrape_integrations page checks')
+    parser.add_argument('--output', default=os.path.join(DATA_DIR, 'reextracted.csv'),
+                      help='CSV the re-extracted rows are written to')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                      help='Processes extracting in parallel')
+    parser.add_argument('--keep-empty', action='store_true',
+                      help='Also write pages without integrations')
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.archive, INDEX_FILE)):
+        logger.error(f"No page archive in {args.archive}")
+        sys.exit(1)
+
+    with CsvSink(args.output, fieldnames=FIELDNAMES[args.parser]) as sink:
+        counts = reextract(args.archive, args.parser, sink, max(1, args.workers), args.keep_empty)
+    print(f"Pages re-extracted: {counts['pages']}, with integrations: {counts['with_integrations']}, "
+          f"rows written to {args.output}: {counts['written']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Delay queue for scheduling retries without holding a worker while waiting.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, List, Tuple
+
+
+class DelayQueue:
+    """Async queue whose items only become available once their due time has passed."""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Any]] = []
+        self._seq = itertools.count()  # Keeps FIFO order among items due at the same time
+        self._changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def put(self, item: Any, delay: float = 0.0) -> None:
+        """Add an item that becomes available after `delay` seconds."""
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), item))
+        self._changed.set()
+
+    async def get(self) -> Any:
+        """Wait for the earliest item to come due and return it."""
+        while True:
+            timeout = None
+            if self._heap:
+                timeout = self._heap[0][0] - time.monotonic()
+                if timeout <= 0:
+                    return heapq.heappop(self._heap)[2]
+
+            # Sleep until the head item is due or something new is put
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -3,25 +3,43 @@
 Script to scrape integration information from Shopify app store pages.
 Uses async requests with rate limiting and retry logic.
 """
+import argparse
 import asyncio
 import logging
 import random
 import re
 from datetime import datetime
-from typing import Dict, List, Optional, Set, Tuple, Any
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Set, Tuple, Any
 import json
 import os
+from collections import Counter, defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor
 
 import aiohttp
 import pandas as pd
-from bs4 import BeautifulSoup
 from tqdm.asyncio import tqdm
 
+from crawl_journal import NO_INTEGRATIONS, NOT_AN_APP, NOT_FOUND
+from csv_sink import CsvSink
+from extractors import LISTING_BODY_LIMIT, parse_listing_page, prefilter_listing_page, run_parser
+from fingerprints import content_fingerprint
+from http_cache import BodyLimit, ResponseCache, cache_key, cached_get
+from metrics import MetricsReporter, record_integration_result, registry
+from negative_cache import NegativeCache
+from page_archive import PageArchive
+from rate_limit import AdaptiveRateController
+from retry_queue import DelayQueue
+from single_flight import SingleFlight
+from slug_index import SlugIndex, build_slug_index
+from utils import clean_url
+
 # Configuration
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
 TOP_APPS_RAW = os.path.join(DATA_DIR, 'top_apps_raw.csv')
 INTEGRATIONS_DATA = os.path.join(DATA_DIR, 'integrations.csv')
+METRICS_FILE = os.path.join(DATA_DIR, 'integrations_metrics.json')
 REQUEST_TIMEOUT = 30
+SITEMAP_URL = 'https://apps.shopify.com/sitemap.xml'
 
 # Set up logging
 logging.basicConfig(
@@ -32,14 +50,55 @@ logger = logging.getLogger(__name__)
 
 # Scraping settings
 MAX_RETRIES = 5
-MIN_DELAY = 5
-MAX_DELAY = 10
+MAX_TOTAL_RETRY_DELAY = 600  # Give up on an app after 10 minutes of backoff
 CONCURRENT_REQUESTS = 2  # Keep low to avoid rate limiting
+RESOLVE_WORKERS = CONCURRENT_REQUESTS * 2  # Extra workers parse while others wait on the network
+PARSE_WORKERS = max(1, min(RESOLVE_WORKERS, (os.cpu_count() or 1) - 1))  # Processes parsing pages off the event loop
+REQUESTS_PER_SECOND = 0.15  # Starting per-host rate, roughly one request per 5-10 s
+MAX_REQUESTS_PER_SECOND = 1.0  # Politeness ceiling the adaptive rate can climb to
+
+# Every request in this script goes through this controller, so a 429 seen by
+# one app slows down and pauses all of them
+rate_controller = AdaptiveRateController(
+    REQUESTS_PER_SECOND,
+    burst=CONCURRENT_REQUESTS,
+    max_rate=MAX_REQUESTS_PER_SECOND
+)
 
 # Cache settings
 CACHE_DIR = os.path.join(DATA_DIR, 'cache')
 os.makedirs(CACHE_DIR, exist_ok=True)  # Ensure cache directory exists
 
+# Listing pages are revalidated instead of re-downloaded on every run; opened
+# by main() like negative_cache
+response_cache: Optional[ResponseCache] = None
+
+# Set by --stream-listings: listing bodies are read only up to the reviews section
+listing_body_limit: Optional[BodyLimit] = None
+
+# Set by --archive: every candidate page fetched is kept for reextract_pages.py
+page_archive: Optional[PageArchive] = None
+
+# Slug guesses that 404ed, pages that are not listings and listings without
+# integrations, skipped until their entry expires. Kept apart from
+# scrape_sitemap's, whose extractor judges integrations differently; opened
+# by main() so importing this module creates no files
+NEGATIVE_CACHE_FILE = os.path.join(CACHE_DIR, 'negative_integrations.sqlite')
+negative_cache: Optional[NegativeCache] = None
+
+# Resolved app name -> listing URL mappings, kept across runs
+SLUG_MAP_FILE = os.path.join(CACHE_DIR, 'slug_map.json')
+
+# GETs issued per URL, to confirm each resolved app page is fetched only once
+fetch_counts: Counter = Counter()
+
+# Fetched pages fully parsed vs. classified from their bytes alone
+parse_counts: Counter = Counter()
+
+# Candidate fetches in progress, keyed by canonical URL; concurrent requests
+# for one listing share a single fetch and parse
+in_flight = SingleFlight()
+
 # User agent rotation
 USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -82,31 +141,6 @@ def get_random_headers() -> Dict[str, str]:
         'DNT': '1'
     }
 
-def clean_url(url: str) -> str:
-    """Clean and normalize a Shopify app store URL."""
-    if not url:
-        return ''
-    
-    # Remove query parameters and hash fragments
-    url = re.sub(r'[?#].*$', '', url.strip())
-    
-    # Remove trailing slash
-    url = url.rstrip('/')
-    
-    # Extract app name/slug from URL
-    match = re.search(r'apps\.shopify\.com/([^/]+)', url)
-    if not match:
-        return ''
-    
-    app_slug = match.group(1)
-    
-    # Basic validation
-    if not app_slug or len(app_slug) < 2:
-        return ''
-    
-    # Construct clean URL
-    return f'https://apps.shopify.com/{app_slug}'
-
 def generate_app_urls(app_name: str, api_key: str, app_store_url: str) -> List[str]:
     """Generate possible app store URLs for an app."""
     urls = set()
@@ -164,277 +198,495 @@ def generate_app_urls(app_name: str, api_key: str, app_store_url: str) -> List[s
     
     return list(urls)
 
-async def is_valid_app_page(soup: BeautifulSoup) -> bool:
-    """Check if the page is a valid app listing."""
-    # Check for various app page indicators
-    indicators = [
-        # Main app container
-        soup.find('div', {'class': ['app-details', 'app-listing', 'app-block', 'app-listing-hero', 'app-listing__hero']}),
+class RetryState(NamedTuple):
+    """Where an app's URL resolution stands between attempts."""
+    key: Any
+    urls: List[str]
+    url_index: int = 0
+    attempt: int = 0
+    total_delay: float = 0.0
+    fallback: Optional[List[str]] = None  # Candidates to fall back to if a remembered URL fails
+
+def slug_map_key(app_name: str) -> str:
+    """Key an app name for the resolved slug map."""
+    return re.sub(r'\s+', ' ', str(app_name)).strip().lower()
+
+def load_slug_map(path: Optional[str] = None) -> Dict[str, str]:
+    """Load the app name -> listing URL mappings resolved by earlier runs."""
+    path = path or SLUG_MAP_FILE
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read slug map {path}: {str(e)}")
+        return {}
+
+def save_slug_map(slug_map: Dict[str, str], path: Optional[str] = None) -> None:
+    """Atomically write the resolved slug map."""
+    path = path or SLUG_MAP_FILE
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(slug_map, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def failed_result(error: str) -> Dict[str, Any]:
+    """Result record for an app that could not be resolved."""
+    return {
+        'success': False,
+        'error': error,
+        'integrations': []
+    }
+
+async def fetch_candidate(
+    session: aiohttp.ClientSession,
+    url: str,
+    semaphore: asyncio.Semaphore,
+    executor: Optional[Executor] = None
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Make a single attempt at one candidate URL, parsing it in `executor` if given.
+    
+    Returns:
+        ('found', result) for an app page with integrations, ('next', None) if
+        the candidate should be skipped, or ('retry', None) on a transient failure
+    """
+    known = negative_cache.check(url)
+    if known:
+        registry.inc('negative_cache_skips_total', outcome=known)
+        logger.debug(f"Skipping known dead end ({known}): {url}")
+        return 'next', None
+    
+    key = cache_key(url)
+    if key in in_flight:
+        registry.inc('coalesced_fetches_total')
+    return await in_flight.run(key, lambda: fetch_and_parse(session, url, semaphore, executor))
+
+async def fetch_and_parse(
+    session: aiohttp.ClientSession,
+    url: str,
+    semaphore: asyncio.Semaphore,
+    executor: Optional[Executor] = None
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Fetch one candidate URL and parse it; the uncoalesced body of fetch_candidate."""
+    try:
+        # Pacing between requests comes from the shared rate controller; the
+        # semaphore only covers the request itself
+        headers = get_random_headers()
+        fetch_counts[url] += 1
+        async with semaphore:
+            response = await cached_get(
+                session, url, response_cache, rate_controller,
+                headers=headers, timeout=REQUEST_TIMEOUT, allow_redirects=True,
+                body_limit=listing_body_limit
+            )
         
-        # App title
-        soup.find(['h1', 'h2'], {'class': ['heading--1', 'app-title', 'title', 'app-listing__heading']}),
+        if response.status == 429:
+            logger.warning(f"Rate limited on {url}")
+            return 'retry', None
         
-        # App description
-        soup.find('div', {'class': ['app-description', 'app-details-description', 'description', 'app-listing__description']}),
+        if response.status == 404:
+            logger.warning(f"URL not found: {url}")
+            if not response_cache.offline:  # Offline, 404 only means not cached
+                negative_cache.record(url, NOT_FOUND)
+            return 'next', None
         
-        # Pricing section
-        soup.find('div', {'class': ['app-pricing', 'pricing-section', 'pricing', 'app-listing__pricing']}),
+        if response.status != 200:
+            logger.warning(f"Status {response.status} for {url}")
+            return 'retry', None
+        if page_archive:
+            page_archive.add(url, response)
         
-        # Developer info
-        soup.find('div', {'class': ['app-developer', 'developer-info', 'developer', 'app-listing__developer']}),
+        # Pages without any listing signal are rejected from their bytes;
+        # the rest are parsed once, validation and extraction sharing the tree
+        page = prefilter_listing_page(response.body, response.encoding)
+        if page is None:
+            parse_counts['parsed'] += 1
+            page = await run_parser(executor, parse_listing_page, response.body, url, response.encoding)
+        else:
+            parse_counts['skipped'] += 1
+            registry.inc('parses_skipped_total')
         
-        # Reviews section
-        soup.find('div', {'class': ['app-reviews', 'reviews-section', 'reviews', 'app-listing__reviews']})
-    ]
-    
-    # Check meta tags
-    meta_title = soup.find('meta', {'property': 'og:title'})
-    meta_type = soup.find('meta', {'property': 'og:type'})
-    meta_url = soup.find('meta', {'property': 'og:url'})
-    
-    # Check JSON-LD data
-    json_ld = None
-    for script in soup.find_all('script', {'type': 'application/ld+json'}):
-        try:
-            data = json.loads(script.string)
-            if data.get('@type') == 'SoftwareApplication':
-                json_ld = data
-                break
-        except:
-            continue
-    
-    return any(indicators) or (meta_title and meta_type and 'apps.shopify.com' in str(meta_url)) or json_ld is not None
-
-async def extract_integrations(session: aiohttp.ClientSession, url: str, retries: int = 3) -> Tuple[List[str], bool]:
-    """Extract integrations from app store page."""
-    integrations = set()
-    page_found = False
-    
-    # Integration keywords to look for
-    integration_keywords = [
-        'integrates with', 'integration', 'integrated with', 'connects with',
-        'connect to', 'connected to', 'works with', 'compatible with',
-        'sync with', 'syncs with', 'synchronize with', 'synchronizes with',
-        'import from', 'imports from', 'export to', 'exports to',
-        'api integration', 'api connection', 'api connector',
-        'plugin for', 'extension for', 'addon for', 'add-on for',
-        'integration with', 'connector for', 'connects to'
-    ]
-    
-    # Integration patterns to match
-    integration_patterns = [
-        re.compile(rf'\b{re.escape(kw)}\b\s+([^.!?\n]+)', re.IGNORECASE)
-        for kw in integration_keywords
-    ]
-    
-    for attempt in range(retries):
-        try:
-            async with session.get(url, timeout=30) as response:
-                if response.status == 404:
-                    logging.warning(f"URL not found: {url}")
-                    return list(integrations), False
-                
-                if response.status != 200:
-                    logging.warning(f"Got status {response.status} for {url}")
-                    if attempt < retries - 1:
-                        await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                        continue
-                    return list(integrations), False
-                
-                html = await response.text()
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                # Check if this is a valid app page
-                if not soup.find('div', {'class': 'app-details'}) and not soup.find('main', {'role': 'main'}):
-                    logging.warning(f"Not a valid app page: {url}")
-                    return list(integrations), False
-                
-                page_found = True
-                
-                # Extract text from relevant sections
-                text_sections = []
-                
-                # App description
-                description = soup.find('div', {'class': ['app-details__description', 'description']})
-                if description:
-                    text_sections.append(description.get_text())
-                
-                # Features section
-                features = soup.find('div', {'class': ['app-details__features', 'features']})
-                if features:
-                    text_sections.append(features.get_text())
-                
-                # Key benefits section
-                benefits = soup.find('div', {'class': ['app-details__benefits', 'benefits']})
-                if benefits:
-                    text_sections.append(benefits.get_text())
-                
-                # Integration section (if exists)
-                integrations_section = soup.find('div', {'class': ['app-details__integrations', 'integrations']})
-                if integrations_section:
-                    text_sections.append(integrations_section.get_text())
-                
-                # Process all text sections
-                for text in text_sections:
-                    # Clean text
-                    text = re.sub(r'\s+', ' ', text).strip()
-                    
-                    # Look for integration mentions
-                    for pattern in integration_patterns:
-                        matches = pattern.finditer(text)
-                        for match in matches:
-                            # Extract and clean integration name
-                            integration = match.group(1).strip()
-                            integration = re.sub(r'[,.!?].*$', '', integration)  # Remove everything after punctuation
-                            integration = re.sub(r'\s+', ' ', integration).strip()
-                            
-                            # Basic validation
-                            if (len(integration) > 2 and  # More than 2 chars
-                                len(integration) < 50 and  # Less than 50 chars
-                                not integration.lower().startswith('your') and  # Skip generic mentions
-                                not integration.lower().startswith('other')):
-                                integrations.add(integration)
-                
-                break  # Success, exit retry loop
-                
-        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-            logging.warning(f"Error fetching {url}: {str(e)}")
-            if attempt < retries - 1:
-                await asyncio.sleep(2 ** attempt)  # Exponential backoff
+        if page['valid']:
+            if page['integrations']:
+                negative_cache.forget(url)
+                return 'found', {
+                    'success': True,
+                    'integrations': page['integrations'],
+                    'page_found': page['page_found'],
+                    'error': None
+                }
             else:
-                return list(integrations), False
-        
-        except Exception as e:
-            logging.error(f"Unexpected error processing {url}: {str(e)}")
-            return list(integrations), False
+                logger.warning(f"No integrations found on valid page: {url}")
+                negative_cache.record(url, NO_INTEGRATIONS)
+        else:
+            logger.warning(f"Not a valid app page: {url}")
+            negative_cache.record(url, NOT_AN_APP)
+        return 'next', None
+    
+    except asyncio.TimeoutError:
+        logger.warning(f"Timeout on {url}")
+        return 'retry', None
+    except aiohttp.ClientError as e:
+        logger.warning(f"Client error on {url}: {str(e)}")
+        return 'retry', None
+    except Exception as e:
+        logger.error(f"Error scraping {url}: {str(e)}", exc_info=True)
+        return 'retry', None
+
+async def head_exists(session: aiohttp.ClientSession, url: str, semaphore: asyncio.Semaphore) -> Optional[bool]:
+    """
+    Cheaply check whether a candidate URL exists with a HEAD request.
     
-    return list(integrations), page_found
+    Returns:
+        True if it exists (or the server does not support HEAD), False if it
+        is a 404/410, None on a transient failure
+    """
+    try:
+        await rate_controller.acquire(url)
+        async with semaphore:
+            async with session.head(url, headers=get_random_headers(), timeout=REQUEST_TIMEOUT, allow_redirects=True) as response:
+                rate_controller.record(url, response.status, response.headers.get('Retry-After'))
+                registry.inc('http_requests_total', method='HEAD', status=response.status)
+                if response.status in (404, 410):
+                    return False
+                if response.status == 429 or response.status >= 500:
+                    return None
+                return True
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        rate_controller.record(url, None)
+        registry.inc('http_requests_total', method='HEAD', status='error')
+        logger.warning(f"HEAD failed for {url}: {str(e)}")
+        return None
 
-async def try_urls(
+async def probe_candidate(
+    session: aiohttp.ClientSession,
+    url: str,
+    semaphore: asyncio.Semaphore,
+    executor: Optional[Executor] = None
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """HEAD a candidate before paying for its body, then fetch it if it exists."""
+    # Cached pages are revalidated by a conditional GET anyway, and offline
+    # mode has nothing to HEAD
+    if not response_cache.offline and not response_cache.get(url):
+        exists = await head_exists(session, url, semaphore)
+        if exists is None:
+            return 'retry', None
+        if not exists:
+            logger.warning(f"URL not found: {url}")
+            negative_cache.record(url, NOT_FOUND)
+            return 'next', None
+    return await fetch_candidate(session, url, semaphore, executor)
+
+async def probe_candidates(
     session: aiohttp.ClientSession,
     urls: List[str],
-    retry_count: int = 0,
-    total_delay: float = 0
-) -> Tuple[Optional[str], Dict[str, Any]]:
-    """Try multiple URLs until one works."""
-    if not urls:
-        return None, {
-            'success': False,
-            'error': 'No URLs provided',
-            'integrations': []
-        }
-    
-    # Exponential backoff with jitter
-    if retry_count > 0:
-        delay = min(300, (2 ** retry_count) + random.uniform(0, retry_count * 2))
-        total_delay += delay
-        if total_delay > 600:  # Max 10 minutes total delay
-            return None, {
-                'success': False,
-                'error': 'Max retry time exceeded',
-                'integrations': []
-            }
-        await asyncio.sleep(delay)
-    
-    for url in urls:
-        try:
-            # Random delay between requests
-            delay = random.uniform(MIN_DELAY, MAX_DELAY)
-            await asyncio.sleep(delay)
-            
-            headers = get_random_headers()
-            async with session.get(url, headers=headers, timeout=REQUEST_TIMEOUT, allow_redirects=True) as response:
-                if response.status == 429 and retry_count < MAX_RETRIES:
-                    logger.warning(f"Rate limited on {url}, attempt {retry_count + 1}/{MAX_RETRIES}")
-                    return await try_urls(session, urls, retry_count + 1, total_delay)
-                
-                if response.status == 404:
-                    logger.warning(f"URL not found: {url}")
-                    continue
-                
-                if response.status != 200:
-                    logger.warning(f"Status {response.status} for {url}")
-                    if retry_count < MAX_RETRIES:
-                        return await try_urls(session, urls, retry_count + 1, total_delay)
-                    continue
-                
-                html = await response.text()
-                soup = BeautifulSoup(html, 'lxml')
-                
-                if await is_valid_app_page(soup):
-                    integrations, page_found = await extract_integrations(session, url)
-                    if integrations:
-                        return url, {
-                            'success': True,
-                            'integrations': integrations,
-                            'page_found': page_found,
-                            'error': None
-                        }
-                    else:
-                        logger.warning(f"No integrations found on valid page: {url}")
-                else:
-                    logger.warning(f"Not a valid app page: {url}")
-            
-        except asyncio.TimeoutError:
-            logger.warning(f"Timeout on {url}")
-            if retry_count < MAX_RETRIES:
-                return await try_urls(session, urls, retry_count + 1, total_delay)
-            continue
-        except aiohttp.ClientError as e:
-            logger.warning(f"Client error on {url}: {str(e)}")
-            if retry_count < MAX_RETRIES:
-                return await try_urls(session, urls, retry_count + 1, total_delay)
-            continue
-        except Exception as e:
-            logger.error(f"Error scraping {url}: {str(e)}", exc_info=True)
-            if retry_count < MAX_RETRIES:
-                return await try_urls(session, urls, retry_count + 1, total_delay)
-            continue
-    
-    return None, {
-        'success': False,
-        'error': 'No valid URL found',
-        'integrations': []
-    }
+    semaphore: asyncio.Semaphore,
+    executor: Optional[Executor] = None
+) -> Tuple[str, Optional[str], Optional[Dict[str, Any]], List[str]]:
+    """
+    Probe all candidate URLs concurrently and stop at the first valid app page.
+    
+    Returns:
+        (outcome, working_url, result, retry_urls) where outcome is 'found',
+        'next' if every candidate failed for good, or 'retry' with the
+        candidates that hit a transient failure
+    """
+    probes = {asyncio.ensure_future(probe_candidate(session, url, semaphore, executor)): url for url in urls}
+    pending = set(probes)
+    retry_urls = []
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for probe in done:
+                outcome, result = probe.result()
+                if outcome == 'found':
+                    return 'found', probes[probe], result, []
+                if outcome == 'retry':
+                    retry_urls.append(probes[probe])
+    finally:
+        # Cancel the probes still in flight once one has succeeded
+        for probe in pending:
+            probe.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    
+    return ('retry' if retry_urls else 'next'), None, None, retry_urls
 
-async def process_apps(df: pd.DataFrame) -> pd.DataFrame:
-    """Process a DataFrame of apps asynchronously to extract integration information."""
-    results = []
+async def resolve_apps(
+    session: aiohttp.ClientSession,
+    candidates: Dict[Any, List[str]],
+    parallel_probe: bool = False,
+    fallbacks: Optional[Dict[Any, List[str]]] = None,
+    executor: Optional[Executor] = None
+) -> AsyncIterator[Tuple[Any, Optional[str], Dict[str, Any]]]:
+    """
+    Resolve each app's candidate URLs, yielding results as apps finish.
+    
+    Failed attempts go back on a delay queue with their due time instead of
+    sleeping in place, so a worker is free for other apps during backoff.
+    
+    Args:
+        session: aiohttp session to fetch with
+        candidates: Candidate URLs keyed by an app identifier
+        parallel_probe: Probe all of an app's candidates at once instead of one by one
+        fallbacks: Candidates to try for an app if all of its `candidates` fail
+        executor: Optional process pool to parse pages in, off the event loop
+        
+    Yields:
+        (key, working_url, result) for every app
+    """
+    retry_queue = DelayQueue()
+    finished: asyncio.Queue = asyncio.Queue()
     semaphore = asyncio.Semaphore(CONCURRENT_REQUESTS)
+    fallbacks = fallbacks or {}
+    
+    for key, urls in candidates.items():
+        retry_queue.put(RetryState(key, urls, fallback=fallbacks.get(key)))
+    
+    async def resolve(state: RetryState) -> None:
+        """Make one attempt for an app and either finish it or queue its next attempt."""
+        if state.url_index >= len(state.urls) and state.fallback:
+            retry_queue.put(RetryState(state.key, state.fallback))
+            return
+        if not state.urls:
+            finished.put_nowait((state.key, None, failed_result('No URLs provided')))
+            return
+        if state.url_index >= len(state.urls):
+            finished.put_nowait((state.key, None, failed_result('No valid URL found')))
+            return
+        
+        if parallel_probe:
+            outcome, url, result, retry_urls = await probe_candidates(
+                session, state.urls[state.url_index:], semaphore, executor
+            )
+            if outcome == 'found':
+                finished.put_nowait((state.key, url, result))
+                return
+            if outcome == 'next' or state.attempt >= MAX_RETRIES:
+                retry_queue.put(state._replace(url_index=len(state.urls)))
+                return
+            # Only the candidates that failed transiently are probed again
+            state = state._replace(urls=retry_urls, url_index=0)
+        else:
+            url = state.urls[state.url_index]
+            outcome, result = await fetch_candidate(session, url, semaphore, executor)
+            if outcome == 'found':
+                finished.put_nowait((state.key, url, result))
+                return
+            if outcome == 'next' or state.attempt >= MAX_RETRIES:
+                retry_queue.put(state._replace(url_index=state.url_index + 1))
+                return
+        
+        # Exponential backoff with jitter
+        attempt = state.attempt + 1
+        delay = min(300, (2 ** attempt) + random.uniform(0, attempt * 2))
+        if state.total_delay + delay > MAX_TOTAL_RETRY_DELAY:
+            finished.put_nowait((state.key, None, failed_result('Max retry time exceeded')))
+            return
+        logger.info(f"Retrying {state.urls[state.url_index]} in {delay:.1f}s (attempt {attempt}/{MAX_RETRIES})")
+        registry.inc('retries_total', reason='backoff')
+        registry.inc('backoff_seconds_total', delay)
+        retry_queue.put(state._replace(attempt=attempt, total_delay=state.total_delay + delay), delay)
+    
+    async def worker():
+        while True:
+            state = await retry_queue.get()
+            registry.set('queue_depth', len(retry_queue), queue='apps')
+            try:
+                await resolve(state)
+            except Exception as e:
+                # A dead worker would leave its app unfinished and resolve_apps waiting forever
+                logger.error(f"Error resolving {state.key}: {str(e)}", exc_info=True)
+                finished.put_nowait((state.key, None, failed_result(str(e))))
     
-    async def process_app(row):
-        async with semaphore:
-            urls = generate_app_urls(row['app_name'], row.get('api_key', ''), row['app_store_url'])
-            working_url, result = await try_urls(session, urls)
-            return row, working_url, result
+    workers = [asyncio.create_task(worker()) for _ in range(RESOLVE_WORKERS)]
+    try:
+        for _ in range(len(candidates)):
+            yield await finished.get()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+async def try_urls(session: aiohttp.ClientSession, urls: List[str]) -> Tuple[Optional[str], Dict[str, Any]]:
+    """Try multiple URLs until one works."""
+    results = [result async for result in resolve_apps(session, {0: urls})]
+    _, working_url, result = results[0]
+    return working_url, result
+
+def app_candidate_urls(row: pd.Series, slug_index: Optional[SlugIndex] = None) -> List[str]:
+    """
+    Candidate listing URLs for an app.
+    
+    With a slug index only URLs known from the sitemap are returned, so no
+    request is spent on guesses that do not exist. They are led by the row's
+    own listing URL when the index knows it; only rows without one are led
+    by the index's best match for the app name, which can be another app's
+    listing.
+    """
+    urls = generate_app_urls(row['app_name'], row.get('api_key', ''), row['app_store_url'])
+    if slug_index is None:
+        return urls
+    
+    app_store_url = row['app_store_url'] if isinstance(row['app_store_url'], str) else ''
+    recorded = clean_url(app_store_url) if app_store_url else None
+    first = recorded if recorded and recorded in slug_index else slug_index.lookup(row['app_name'])
+    known = [url for url in slug_index.filter_existing(urls) if url != first]
+    return ([first] if first else []) + known
+
+def app_dedupe_key(row: pd.Series) -> Tuple[str, str, str]:
+    """
+    Identity of an input row for deduplication.
+    
+    Rows with the same canonical listing URL, app name and API key produce
+    the same candidate URLs, so they are resolved once.
+    """
+    app_store_url = row['app_store_url'] if isinstance(row['app_store_url'], str) else ''
+    api_key = row.get('api_key', '')
+    return (
+        clean_url(app_store_url) or app_store_url.strip(),
+        slug_map_key(row['app_name']),
+        api_key if isinstance(api_key, str) else ''
+    )
+
+async def process_apps(
+    df: pd.DataFrame,
+    sink: CsvSink,
+    parallel_probe: bool = False,
+    use_slug_index: bool = True
+) -> int:
+    """
+    Process a DataFrame of apps asynchronously to extract integration information.
+    
+    Result rows are written to `sink` as apps finish instead of being collected.
+    Duplicate input rows (see app_dedupe_key) are resolved once and the
+    result is written for each of them.
+    
+    Args:
+        df: Apps to process
+        sink: Output one result row per app is written to
+        parallel_probe: Probe each app's candidate URLs concurrently
+        use_slug_index: Resolve app names against the sitemap instead of guessing URLs blindly
+        
+    Returns:
+        Number of result rows written
+    """
+    written = 0
+    successes = 0
+    gets_for_successes = 0
+    max_gets = 0
+    rows = {idx: row for idx, row in df.iterrows()}
+    
+    # Input row index of each unique app -> indexes of every row it stands for
+    duplicates: Dict[Any, List[Any]] = defaultdict(list)
+    first_rows: Dict[Tuple[str, str, str], Any] = {}
+    for idx, row in rows.items():
+        duplicates[first_rows.setdefault(app_dedupe_key(row), idx)].append(idx)
+    if len(duplicates) < len(rows):
+        logger.info(f"Collapsed {len(rows)} input rows into {len(duplicates)} unique apps")
     
     conn = aiohttp.TCPConnector(limit_per_host=CONCURRENT_REQUESTS, ssl=False)
     timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT * 2)
     
-    async with aiohttp.ClientSession(connector=conn, timeout=timeout) as session:
-        tasks = [process_app(row) for _, row in df.iterrows()]
+    # Pages are parsed in worker processes so the event loop keeps fetching
+    # while BeautifulSoup runs
+    with ProcessPoolExecutor(max_workers=PARSE_WORKERS) as executor:
+        async with aiohttp.ClientSession(connector=conn, timeout=timeout) as session:
+            slug_index = None
+            if use_slug_index:
+                slug_index = await build_slug_index(
+                    session, SITEMAP_URL,
+                    headers=get_random_headers(),
+                    rate_controller=rate_controller,
+                    cache=response_cache
+                )
+                if not slug_index:
+                    logger.warning("Sitemap slug index is empty, falling back to unverified URL guesses")
+                    slug_index = None
         
-        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Scraping apps"):
-            try:
-                row, working_url, result = await task
+            # Apps resolved by an earlier run go straight to their known URL and only
+            # fall back to guessing if that URL stopped working
+            slug_map = load_slug_map()
+            candidates = {}
+            fallbacks = {}
+            for idx in duplicates:
+                row = rows[idx]
+                urls = app_candidate_urls(row, slug_index)
+                known_url = slug_map.get(slug_map_key(row['app_name']))
+                if known_url:
+                    candidates[idx] = [known_url]
+                    fallbacks[idx] = [url for url in urls if url != known_url]
+                else:
+                    candidates[idx] = urls
+            logger.info(f"{len(fallbacks)} of {len(candidates)} apps have a remembered listing URL")
+        
+            resolved = resolve_apps(
+                session, candidates,
+                parallel_probe=parallel_probe, fallbacks=fallbacks, executor=executor
+            )
+            async for idx, working_url, result in tqdm(resolved, total=len(candidates), desc="Scraping apps"):
+                try:
+                    row = rows[idx]
+                    record_integration_result(result['success'])
+                    if working_url:
+                        slug_map[slug_map_key(row['app_name'])] = working_url
+                    elif result['error'] == 'No valid URL found':
+                        slug_map.pop(slug_map_key(row['app_name']), None)
                 
-                results.append({
-                    'api_key': row.get('api_key', ''),
-                    'app_name': row['app_name'],
-                    'app_store_url': working_url or row['app_store_url'],
-                    'integrations': ','.join(result['integrations']) if result['success'] else '',
-                    'integration_count': len(result['integrations']) if result['success'] else 0,
-                    'scrape_success': result['success'],
-                    'scrape_error': result['error'],
-                    'page_found': result['page_found'],
-                    'processed_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S+00:00')
-                })
+                    processed_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S+00:00')
+                    integrations = result['integrations'] if result['success'] else []
+                    for row_idx in duplicates[idx]:
+                        row = rows[row_idx]
+                        sink.write({
+                            'api_key': row.get('api_key', ''),
+                            'app_name': row['app_name'],
+                            'app_store_url': working_url or row['app_store_url'],
+                            'integrations': ','.join(integrations),
+                            'integration_count': len(integrations),
+                            'scrape_success': result['success'],
+                            'scrape_error': result['error'],
+                            'page_found': result.get('page_found', False),
+                            'processed_at': processed_at,
+                            'content_fingerprint': content_fingerprint(
+                                row['app_name'], row.get('description', row.get('app_details')), integrations
+                            )
+                        })
+                        written += 1
+                    if working_url:
+                        successes += 1
+                        gets_for_successes += fetch_counts[working_url]
+                        max_gets = max(max_gets, fetch_counts[working_url])
                 
-            except Exception as e:
-                logger.error(f"Error processing task: {str(e)}", exc_info=True)
-                continue
+                except Exception as e:
+                    logger.error(f"Error processing task: {str(e)}", exc_info=True)
+                    continue
     
-    return pd.DataFrame(results)
+    save_slug_map(slug_map)
+    
+    stats = rate_controller.stats()
+    logger.info(f"Final request rates: {stats['rates']}, throttle events: {stats['throttle_count']}")
+    logger.info(f"Response cache: {response_cache.stats()}")
+    logger.info(f"Negative cache: {negative_cache.stats()}")
+    logger.info(f"Coalesced fetches: {in_flight.stats()}")
+    if listing_body_limit:
+        logger.info(
+            f"Streamed listings: {registry.value('truncated_bodies_total'):.0f} cut short, "
+            f"{registry.value('http_bytes_saved_total'):.0f} bytes left unread"
+        )
+    if page_archive:
+        logger.info(f"Page archive: {page_archive.stats()}")
+    logger.info(
+        f"Prefilter saved {parse_counts['skipped']} of "
+        f"{parse_counts['skipped'] + parse_counts['parsed']} page parses"
+    )
+    
+    if successes:
+        logger.info(
+            f"Sent {sum(fetch_counts.values())} GETs in total; "
+            f"{gets_for_successes / successes:.2f} per successful app (max {max_gets})"
+        )
+    return written
 
 def load_apps_from_csv(csv_path: str) -> pd.DataFrame:
     """
@@ -461,24 +713,59 @@ def load_apps_from_csv(csv_path: str) -> pd.DataFrame:
 
 async def main():
     """Main entry point for the script."""
+    global listing_body_limit, page_archive, negative_cache, response_cache
+    parser = argparse.ArgumentParser(description='Scrape integration information from app store pages')
+    parser.add_argument('--offline', action='store_true',
+                      help='Serve every request from the response cache without touching the network')
+    parser.add_argument('--parallel-probe', action='store_true',
+                      help="Probe each app's candidate URLs concurrently and keep the first valid one")
+    parser.add_argument('--no-slug-index', action='store_true',
+                      help='Do not check URL guesses against the sitemap before fetching them')
+    parser.add_argument('--recheck', action='store_true',
+                      help='Refetch candidate URLs remembered as missing, not listings or without integrations')
+    parser.add_argument('--stream-listings', action='store_true',
+                      help='Stop reading candidate pages at the reviews section; pages cut short are not cached')
+    parser.add_argument('--archive', metavar='DIR',
+                      help='Keep every candidate page fetched in WARC files under DIR for reextract_pages.py')
+    parser.add_argument('--metrics-file', default=METRICS_FILE,
+                      help='File scrape metrics are written to periodically; .prom for Prometheus text, otherwise JSON')
+    parser.add_argument('--metrics-port', type=int,
+                      help='Also serve metrics on http://127.0.0.1:PORT/metrics while scraping')
+    args = parser.parse_args()
+    response_cache = ResponseCache(CACHE_DIR, offline=args.offline)
+    negative_cache = NegativeCache(NEGATIVE_CACHE_FILE)
+    negative_cache.consult = not args.recheck
+    listing_body_limit = LISTING_BODY_LIMIT if args.stream_listings else None
+    page_archive = PageArchive(args.archive) if args.archive else None
+    
     logger.info("Starting integration scraping")
+    if args.offline:
+        logger.info(f"Offline mode: serving from {CACHE_DIR}")
     
     try:
         # Load apps from CSV
         apps_df = load_apps_from_csv(TOP_APPS_RAW)
         logger.info(f"Loaded {len(apps_df)} apps from CSV")
         
-        # Process apps and extract integrations
-        results_df = await process_apps(apps_df)
-        logger.info(f"Successfully processed {len(results_df)} apps")
-        
-        # Save results
-        results_df.to_csv(INTEGRATIONS_DATA, index=False)
+        # Process apps and extract integrations, streaming rows into
+        # INTEGRATIONS_DATA.partial until the run completes
+        with CsvSink(INTEGRATIONS_DATA) as sink:
+            async with MetricsReporter(registry, args.metrics_file, port=args.metrics_port):
+                processed = await process_apps(
+                    apps_df,
+                    sink,
+                    parallel_probe=args.parallel_probe,
+                    use_slug_index=not args.no_slug_index
+                )
+        logger.info(f"Successfully processed {processed} apps")
         logger.info(f"Saved integration data to {INTEGRATIONS_DATA}")
         
     except Exception as e:
         logger.error(f"Error in main: {str(e)}", exc_info=True)
         raise
+    finally:
+        if page_archive:
+            page_archive.close()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
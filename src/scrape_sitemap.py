@@ -2,32 +2,54 @@
 """
 Script to scrape apps from Shopify app store sitemap.
 """
+import argparse
 import asyncio
 import logging
 import random
-import re
-from datetime import datetime
-from typing import Dict, List, Set
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
 import os
 import sys
-from urllib.parse import urlparse
 
 import aiohttp
-from bs4 import BeautifulSoup
 import pandas as pd
 from tqdm.asyncio import tqdm
 
+from crawl_priority import EXPLORATION_SHARE, PriorityFrontier, YieldModel, drain_into
+from csv_sink import CsvSink
+from crawl_journal import ERROR, NO_INTEGRATIONS, NOT_FOUND, SUCCESS, CrawlJournal, JournalState, load_journal
+from extractors import LISTING_BODY_LIMIT, parse_app_info_lxml, run_parser
+from http_cache import BodyLimit, CachedResponse, ResponseCache, cached_get
+from metrics import MetricsReporter, record_integration_result, registry
+from negative_cache import NegativeCache
+from page_archive import PageArchive
+from pipeline import Pipeline, Stage
+from rate_limit import AdaptiveRateController
+from sitemap_snapshot import SitemapSnapshot, copy_unchanged_apps
+from sitemap_stream import SitemapEntry, stream_sitemap
+from standardize_integrations import standardize_integration_name
+from utils import clean_url, is_direct_app_url
+
 # Configuration
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
 TOP_APPS_RAW = os.path.join(DATA_DIR, 'top_apps_raw.csv')
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+JOURNAL_FILE = os.path.join(DATA_DIR, 'crawl_journal.jsonl')
+SNAPSHOT_FILE = os.path.join(DATA_DIR, 'sitemap_snapshot.json')  # Last-seen <lastmod> per listing
+METRICS_FILE = os.path.join(DATA_DIR, 'sitemap_metrics.json')
+NEGATIVE_CACHE_FILE = os.path.join(CACHE_DIR, 'negative_sitemap.sqlite')  # Dead-end URLs found by this crawler
 REQUEST_TIMEOUT = 30
-CONCURRENT_REQUESTS = 3  # Reduced to avoid rate limiting
-MIN_DELAY = 5  # Increased from 2
-MAX_DELAY = 10  # Increased from 5
+CONCURRENT_REQUESTS = 3  # Number of crawl workers, kept low to avoid rate limiting
+PARSE_WORKERS = max(1, min(CONCURRENT_REQUESTS, (os.cpu_count() or 1) - 1))  # Processes parsing pages off the event loop
+REQUESTS_PER_SECOND = 0.5  # Starting per-host rate shared by all workers
+MAX_REQUESTS_PER_SECOND = 2.0  # Politeness ceiling the adaptive rate can climb to
 TARGET_APPS_WITH_INTEGRATIONS = 1000  # Updated target: minimum apps with integrations
 
+WRITE_BATCH_SIZE = 50  # Finished pages journaled and written per batch
+
 # Base URL
 BASE_URL = 'https://apps.shopify.com'
+SITEMAP_URL = f'{BASE_URL}/sitemap.xml'
 
 # Set up logging
 logging.basicConfig(
@@ -40,6 +62,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Shared by every fetch so all workers together stay under the politeness limit
+# and back off together when the app store pushes back
+rate_controller = AdaptiveRateController(
+    REQUESTS_PER_SECOND,
+    burst=CONCURRENT_REQUESTS,
+    max_rate=MAX_REQUESTS_PER_SECOND
+)
+
+# Listing pages and sitemaps are revalidated instead of re-downloaded; shares
+# its directory with scrape_integrations. Opened by main() like negative_cache
+response_cache: Optional[ResponseCache] = None
+
+# Set by --stream-listings: listing bodies are read only up to the reviews section
+listing_body_limit: Optional[BodyLimit] = None
+
+# Set by --archive: every listing page fetched is kept for reextract_pages.py
+page_archive: Optional[PageArchive] = None
+
+# Listings that 404 or have no integrations are skipped until their entry
+# expires; opened by main() so importing this module creates no files
+negative_cache: Optional[NegativeCache] = None
+
 # User agent rotation
 USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -61,40 +105,55 @@ def get_random_headers() -> Dict[str, str]:
         'Pragma': 'no-cache'
     }
 
-async def fetch_with_retry(session: aiohttp.ClientSession, url: str, max_retries: int = 3) -> str:
-    """Fetch URL with retry logic."""
+async def fetch_with_retry(session: aiohttp.ClientSession, url: str, max_retries: int = 3) -> Optional[CachedResponse]:
+    """
+    Fetch URL with retry logic.
+    
+    Returns:
+        The 200 response, the 404 response for a page that does not exist,
+        or None if every attempt failed
+    """
     for attempt in range(max_retries):
         try:
             headers = get_random_headers()
             logger.info(f"Fetching {url} (attempt {attempt + 1}/{max_retries})")
-            async with session.get(url, headers=headers, timeout=REQUEST_TIMEOUT) as response:
-                if response.status == 429:  # Rate limited
-                    wait_time = int(response.headers.get('Retry-After', 60))
-                    logger.warning(f"Rate limited on {url}, waiting {wait_time}s (attempt {attempt + 1}/{max_retries})")
+            response = await cached_get(
+                session, url, response_cache, rate_controller,
+                headers=headers, timeout=REQUEST_TIMEOUT, body_limit=listing_body_limit
+            )
+            
+            if response.status == 429:  # Rate limited
+                # The controller pauses every worker for Retry-After, so the
+                # next acquire() waits it out
+                logger.warning(f"Rate limited on {url} (attempt {attempt + 1}/{max_retries})")
+                registry.inc('retries_total', reason='429')
+                continue
+                
+            if response.status == 404:
+                logger.warning(f"URL not found: {url}")
+                return response
+                
+            if response.status != 200:
+                logger.warning(f"Got status {response.status} for {url} (attempt {attempt + 1}/{max_retries})")
+                if attempt < max_retries - 1:
+                    wait_time = 2 ** attempt
+                    logger.info(f"Waiting {wait_time}s before retry")
+                    registry.inc('retries_total', reason='status')
+                    registry.inc('backoff_seconds_total', wait_time)
                     await asyncio.sleep(wait_time)
                     continue
-                    
-                if response.status == 404:
-                    logger.warning(f"URL not found: {url}")
-                    return ''
-                    
-                if response.status != 200:
-                    logger.warning(f"Got status {response.status} for {url} (attempt {attempt + 1}/{max_retries})")
-                    if attempt < max_retries - 1:
-                        wait_time = 2 ** attempt
-                        logger.info(f"Waiting {wait_time}s before retry")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    return ''
-                    
-                logger.info(f"Successfully fetched {url}")
-                return await response.text()
+                return None
+                
+            logger.info(f"Successfully fetched {url}{' (cached)' if response.from_cache else ''}")
+            return response
                 
         except asyncio.TimeoutError:
             logger.warning(f"Timeout on {url}, attempt {attempt + 1}/{max_retries}")
             if attempt < max_retries - 1:
                 wait_time = 2 ** attempt
                 logger.info(f"Waiting {wait_time}s before retry")
+                registry.inc('retries_total', reason='timeout')
+                registry.inc('backoff_seconds_total', wait_time)
                 await asyncio.sleep(wait_time)
             continue
             
@@ -103,259 +162,424 @@ async def fetch_with_retry(session: aiohttp.ClientSession, url: str, max_retries
             if attempt < max_retries - 1:
                 wait_time = 2 ** attempt
                 logger.info(f"Waiting {wait_time}s before retry")
+                registry.inc('retries_total', reason='error')
+                registry.inc('backoff_seconds_total', wait_time)
                 await asyncio.sleep(wait_time)
             continue
             
-    return ''
-
-def is_direct_app_url(url: str) -> bool:
-    """Check if URL is a direct app listing (no subdirectories)."""
-    parsed = urlparse(url)
-    path = parsed.path.strip('/')
-    return (
-        parsed.netloc == 'apps.shopify.com' and
-        path and  # Not empty
-        '/' not in path and  # No subdirectories
-        path not in {'categories', 'collections', 'stories', 'partners', 'built-in-features'} and
-        not path.startswith(('categories/', 'collections/', 'stories/', 'partners/', 'built-in-features/'))
-    )
+    return None
 
 async def get_app_urls(session: aiohttp.ClientSession) -> List[str]:
     """Get list of direct app URLs from the sitemap."""
     logger.info("Fetching sitemap")
-    content = await fetch_with_retry(session, f"{BASE_URL}/sitemap.xml")
-    if not content:
-        return []
-        
-    soup = BeautifulSoup(content, 'xml')
     app_urls = []
     
-    # Get all direct app URLs
-    for loc in soup.find_all('loc'):
-        url = loc.text
-        if is_direct_app_url(url):
-            app_urls.append(url)
-            
+    async def add_url(entry: SitemapEntry) -> None:
+        app_urls.append(entry.loc)
+    
+    await stream_sitemap(
+        session, SITEMAP_URL, add_url,
+        url_filter=is_direct_app_url,
+        headers=get_random_headers(),
+        rate_controller=rate_controller,
+        cache=response_cache
+    )
+    
     logger.info(f"Found {len(app_urls)} direct app URLs")
     return app_urls
 
-async def extract_app_info(session: aiohttp.ClientSession, url: str) -> Dict:
-    """Extract app information from an app page."""
-    logger.info(f"Processing app: {url}")
-    content = await fetch_with_retry(session, url)
-    if not content:
-        return None
-        
-    soup = BeautifulSoup(content, 'html.parser')
+async def feed_app_urls(
+    session: aiohttp.ClientSession,
+    url_queue: asyncio.Queue,
+    num_workers: int,
+    snapshot: Optional[SitemapSnapshot] = None,
+    frontier: Optional[PriorityFrontier] = None
+) -> int:
+    """
+    Stream direct app URLs from the sitemap into the crawl queue.
+    
+    URLs are held in a priority frontier and handed to the crawl queue
+    best-first as it drains, with a share picked at random; crawling starts
+    without waiting for the whole sitemap. An untrained frontier with an
+    exploration share of 1.0 gives a plain random order. One None sentinel
+    per worker is queued at the end. With a snapshot, listings whose
+    <lastmod> has not changed since it was taken are skipped.
     
+    Returns:
+        Number of app URLs found in the sitemap
+    """
+    logger.info("Streaming sitemap")
+    frontier = frontier if frontier is not None else PriorityFrontier(explore_share=1.0)
+    streamed = asyncio.Event()
+    cancelled = False
+    
+    async def add_url(entry: SitemapEntry) -> None:
+        if snapshot and not snapshot.is_changed(entry):
+            return
+        frontier.add(entry.loc)
+    
+    drain = asyncio.ensure_future(drain_into(frontier, url_queue, streamed))
     try:
-        # Get app name - first try meta tags, then fallback to page title
-        app_name = None
-        
-        # Try meta og:title first
-        og_title = soup.find('meta', {'property': 'og:title'})
-        if og_title:
-            # Clean up the app name by removing common suffixes
-            app_name = og_title.get('content', '').split('|')[0].strip()
-            app_name = re.sub(r'\s*[-–—]\s*(?:Shopify App|Zipchat App|App).*$', '', app_name)
-            logger.info(f"Found app name from og:title: {app_name}")
-            
-        # If not found, try page title
-        if not app_name:
-            title_tag = soup.find('title')
-            if title_tag:
-                app_name = title_tag.text.split('|')[0].strip()
-                app_name = re.sub(r'\s*[-–—]\s*(?:Shopify App|Zipchat App|App).*$', '', app_name)
-                logger.info(f"Found app name from title tag: {app_name}")
-        
-        # If still not found, try heading tags
-        if not app_name:
-            heading = (
-                soup.find('h1', {'class': ['heading--1', 'app-title', 'title']}) or
-                soup.find('h2', {'class': ['heading--1', 'app-title', 'title']}) or
-                soup.find('div', {'class': ['heading--1', 'app-title', 'title']})
-            )
-            if heading:
-                app_name = heading.get_text().strip()
-                app_name = re.sub(r'\s*[-–—]\s*(?:Shopify App|Zipchat App|App).*$', '', app_name)
-                logger.info(f"Found app name from heading: {app_name}")
-        
-        if not app_name:
-            logger.warning(f"Could not find app name for {url}")
-            return None
-        
-        # Get description from meta tags first, then fallback to content
-        desc_elem = soup.find('meta', {'property': 'og:description'})
-        description = desc_elem.get('content', '').strip() if desc_elem else ''
-        
-        if not description:
-            desc_elem = (
-                soup.find('div', {'class': ['app-description', 'app-details-description', 'description']}) or
-                soup.find('meta', {'name': 'description'})
-            )
-            description = desc_elem.get_text().strip() if desc_elem else ''
-        
-        logger.info(f"Description length: {len(description)} characters")
-        
-        # Get submission date from meta tags or use current time
-        date_elem = soup.find('meta', {'property': 'article:published_time'})
-        submission_date = (
-            date_elem.get('content', '') if date_elem 
-            else datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S+00:00')
+        count = await stream_sitemap(
+            session, SITEMAP_URL, add_url,
+            url_filter=is_direct_app_url,
+            headers=get_random_headers(),
+            rate_controller=rate_controller,
+            cache=response_cache
         )
-        logger.info(f"Submission date: {submission_date}")
+        logger.info(f"Found {count} direct app URLs")
+        if snapshot:
+            logger.info(f"{snapshot.unchanged} listings unchanged since the last snapshot")
+        streamed.set()
+        frontier.notify()
+        await drain
+        return count
+    except asyncio.CancelledError:
+        cancelled = True
+        raise
+    finally:
+        drain.cancel()
+        # The queue is bounded and nothing drains it once the crawl is cancelled
+        if not cancelled:
+            for _ in range(num_workers):
+                await url_queue.put(None)
 
-        # Extract integrations from "Works with" section
-        integrations = []
-        
-        # Find the "Works with" section - it's typically a heading followed by a list
-        works_with_heading = soup.find(string=re.compile(r'^\s*Works with\s*$', re.IGNORECASE))
-        if works_with_heading:
-            logger.info("Found 'Works with' section")
-            # The integrations are typically listed right after the heading
-            parent = works_with_heading.parent
-            if parent:
-                # Look for list items or links after the heading
-                integration_elements = parent.find_next_siblings(['ul', 'div'])
-                for element in integration_elements:
-                    # Look for links or list items
-                    items = element.find_all(['a', 'li'])
-                    for item in items:
-                        integration = item.get_text().strip()
-                        if integration and len(integration) > 1:
-                            integrations.append(integration)
-                            logger.info(f"Found integration: {integration}")
-        
-        # Also look for integration mentions in the description
-        integration_keywords = ['integrates with', 'works with', 'compatible with', 'connects to', 'sync with']
-        desc_text = description.lower()
-        for keyword in integration_keywords:
-            if keyword in desc_text:
-                logger.info(f"Found keyword '{keyword}' in description")
-                # Find the sentence containing the keyword
-                sentences = re.split(r'[.!?]+', desc_text)
-                for sentence in sentences:
-                    if keyword in sentence and 'isn\'t compatible' not in sentence and 'not compatible' not in sentence:
-                        # Extract potential integration names
-                        after_keyword = sentence.split(keyword)[1]
-                        # Split by common separators and clean up
-                        potential_integrations = re.split(r'[,;&]', after_keyword)
-                        for integration in potential_integrations:
-                            integration = integration.strip(' and\t\n')
-                            if integration and len(integration) > 1:
-                                integrations.append(integration)
-                                logger.info(f"Found integration from description: {integration}")
-        
-        # Remove duplicates and standardize
-        integrations = list(set(integrations))
-        integrations = [i.strip(' ,.;') for i in integrations]
-        integrations = [i for i in integrations if len(i) > 1]  # Remove single characters
-        
-        # Additional cleaning of integrations
-        cleaned_integrations = []
-        for integration in integrations:
-            # Skip if it contains incompatible messages
-            if any(phrase in integration.lower() for phrase in [
-                "isn't compatible", 
-                "not compatible", 
-                "only compatible with stores that",
-                "this app isn't"
-            ]):
-                continue
-            # Skip if it's too long (likely a sentence rather than an integration name)
-            if len(integration.split()) > 5:
-                continue
-            cleaned_integrations.append(integration)
-        
-        logger.info(f"Total unique integrations found: {len(cleaned_integrations)}")
-        
-        return {
-            'api_key': str(random.randint(1000000, 9999999)),
-            'app_name': app_name,
-            'app_store_url': url,
-            'app_details': description,
-            'app_submission_created_at': submission_date,
-            'integrations': ','.join(cleaned_integrations) if cleaned_integrations else ''
-        }
-        
-    except Exception as e:
-        logger.error(f"Error parsing app page {url}: {str(e)}", exc_info=True)
-        return None
+class PageResult(NamedTuple):
+    """A listing URL on its way through the crawl pipeline."""
+    url: str
+    outcome: Optional[str] = None  # Set once the page's journal outcome is known
+    response: Optional[CachedResponse] = None
+    app_info: Optional[Dict] = None
+    fetched: bool = False  # False when the negative cache ruled the page out
+
+def known_dead_end(url: str) -> Optional[str]:
+    """Outcome the negative cache remembers for a URL, if it is a dead end that is still fresh."""
+    known = negative_cache.check(url)
+    if known:
+        registry.inc('negative_cache_skips_total', outcome=known)
+        logger.debug(f"Skipping known dead end ({known}): {url}")
+    return known
 
-async def collect_apps() -> List[Dict]:
-    """Collect apps until we have enough with integrations."""
-    all_apps = []
-    apps_with_integrations = 0
-    seen_urls = set()
+async def fetch_app_page(
+    session: aiohttp.ClientSession,
+    url: str,
+    use_negative_cache: bool = True
+) -> Tuple[Optional[str], Optional[CachedResponse]]:
+    """
+    Fetch an app page unless the negative cache already rules it out.
+    
+    URLs remembered in the negative cache as missing or without integrations
+    are not fetched at all unless `use_negative_cache` is False.
+    
+    Returns:
+        (outcome, None) if the page needs no parsing, or (None, response) for a page to parse
+    """
+    if use_negative_cache:
+        known = known_dead_end(url)
+        if known:
+            return known, None
+    
+    logger.info(f"Processing app: {url}")
+    response = await fetch_with_retry(session, url)
+    if not response:
+        return ERROR, None
+    if response.status == 404:
+        if not response_cache.offline:  # Offline, 404 only means not cached
+            negative_cache.record(url, NOT_FOUND)
+        return NOT_FOUND, None
+    if page_archive:
+        page_archive.add(url, response)
+    return None, response
+
+async def parse_app_page(
+    url: str,
+    response: CachedResponse,
+    executor: Optional[Executor] = None
+) -> Tuple[str, Optional[Dict]]:
+    """
+    Parse a fetched app page in `executor` if given, and update the negative cache.
+    
+    Returns:
+        (outcome, app_info) where outcome is one of the crawl journal outcomes
+    """
+    app_info = await run_parser(executor, parse_app_info_lxml, response.body, url, response.encoding)
+    if not app_info:
+        return ERROR, None
+    record_integration_result(bool(app_info['integrations']))
+    if app_info['integrations']:
+        negative_cache.forget(url)
+    else:
+        negative_cache.record(url, NO_INTEGRATIONS)
+    logger.info(f"Parsed {app_info['app_name']}: {len(app_info['integrations'].split(',')) if app_info['integrations'] else 0} integrations")
+    return (SUCCESS if app_info['integrations'] else NO_INTEGRATIONS), app_info
+
+async def extract_app_info(
+    session: aiohttp.ClientSession,
+    url: str,
+    executor: Optional[Executor] = None,
+    use_negative_cache: bool = True
+) -> Tuple[str, Optional[Dict]]:
+    """
+    Fetch and parse an app page, parsing it in `executor` if given.
+    
+    Returns:
+        (outcome, app_info) where outcome is one of the crawl journal outcomes
+    """
+    outcome, response = await fetch_app_page(session, url, use_negative_cache)
+    if outcome:
+        return outcome, None
+    return await parse_app_page(url, response, executor)
+
+def normalize_app_info(app_info: Dict) -> Dict:
+    """
+    Add the app's integration names standardized by the standardize_integrations rules.
+    
+    The scraped names are kept as they are in `integrations`; the standardized,
+    deduplicated ones go in `standardized_integrations`.
+    """
+    names = (standardize_integration_name(name) for name in app_info['integrations'].split(','))
+    return {**app_info, 'standardized_integrations': ','.join(dict.fromkeys(name for name in names if name))}
+
+async def collect_apps(
+    sink: CsvSink,
+    journal: Optional[CrawlJournal] = None,
+    resume_state: Optional[JournalState] = None,
+    snapshot: Optional[SitemapSnapshot] = None,
+    model: Optional[YieldModel] = None,
+    explore_share: float = EXPLORATION_SHARE
+) -> int:
+    """
+    Collect apps until we have enough with integrations.
+    
+    Listings flow through a pipeline of stages joined by bounded queues:
+    fetch (CONCURRENT_REQUESTS workers) -> parse (PARSE_WORKERS processes)
+    -> normalize -> write (batched). A slow stage holds back the ones before
+    it, down to the sitemap stream, and the pipeline logs each stage's
+    utilization. Apps are written to `sink` as they are found rather than
+    kept in memory.
+    
+    Args:
+        sink: Output every app with integrations is written to
+        journal: Optional journal every URL's outcome is appended to
+        resume_state: State loaded from an earlier run's journal; its finished
+            URLs are skipped and its apps count towards the target
+        snapshot: Incremental mode; only new or changed listings are fetched,
+            all of them rather than up to the target
+        model: Yield model ranking listings by their chance of having
+            integrations; listings are crawled in random order without one
+        explore_share: Share of listings picked at random rather than by score
+        
+    Returns:
+        Number of apps written to `sink`
+    """
+    app_count = 0
+    if resume_state:
+        sink.write_many(resume_state.records)
+        app_count = len(resume_state.records)
+        if snapshot:
+            # Their old rows must not be carried over next to the resumed ones
+            snapshot.refreshed.update(clean_url(url) for url in resume_state.done)
+    resumed_urls = set(resume_state.done) if resume_state else set()
+    seen_urls = set(resumed_urls)
+    processed = 0
+    target = None if snapshot else TARGET_APPS_WITH_INTEGRATIONS
+    target_reached = asyncio.Event()
+    frontier = PriorityFrontier(model, explore_share if model else 1.0)
+    if target and app_count >= target:
+        logger.info(f"Journal already holds {app_count} apps with integrations")
+        return app_count
     
     async with aiohttp.ClientSession() as session:
-        # Get app URLs
-        app_urls = await get_app_urls(session)
-        if not app_urls:
-            logger.error("No app URLs found")
-            return []
+        # Pages are parsed in worker processes so the event loop keeps
+        # fetching while the parser runs
+        with ProcessPoolExecutor(max_workers=PARSE_WORKERS) as executor, \
+                tqdm(total=target, initial=app_count,
+                     desc="Collecting apps with integrations") as pbar:
             
-        # Shuffle URLs to get a random sample
-        random.shuffle(app_urls)
-        
-        with tqdm(total=TARGET_APPS_WITH_INTEGRATIONS, desc="Collecting apps with integrations") as pbar:
-            for url in app_urls:
-                if apps_with_integrations >= TARGET_APPS_WITH_INTEGRATIONS:
-                    break
-                    
+            async def fetch(url: str) -> Optional[PageResult]:
+                # Pacing happens in fetch_with_retry via the shared rate limiter
                 if url in seen_urls:
-                    continue
+                    if snapshot and url in resumed_urls:
+                        # Finished before the interruption; adopt its new lastmod
+                        snapshot.mark_done(url)
+                    return None
+                seen_urls.add(url)
+                # A changed listing in an incremental run is refetched even if it was a dead end
+                known = known_dead_end(url) if snapshot is None else None
+                if known:
+                    return PageResult(url, known)
+                outcome, response = await fetch_app_page(session, url, use_negative_cache=False)
+                return PageResult(url, outcome, response, fetched=True)
+            
+            async def parse(page: PageResult) -> PageResult:
+                if page.outcome:
+                    return page
+                outcome, app_info = await parse_app_page(page.url, page.response, executor)
+                return page._replace(outcome=outcome, response=None, app_info=app_info)
+            
+            async def normalize(page: PageResult) -> PageResult:
+                if page.outcome == SUCCESS:
+                    return page._replace(app_info=normalize_app_info(page.app_info))
+                return page
+            
+            async def write(pages: List[PageResult]) -> None:
+                nonlocal app_count, processed
+                for page in pages:
+                    registry.inc('crawl_outcomes_total', outcome=page.outcome)
+                    if page.outcome in (SUCCESS, NO_INTEGRATIONS):
+                        frontier.record(page.url, page.fetched, page.outcome == SUCCESS)
+                    if journal:
+                        journal.record(page.url, page.outcome, page.app_info if page.outcome == SUCCESS else None)
+                    if snapshot and page.outcome != ERROR:
+                        snapshot.mark_done(page.url)
                     
-                app_info = await extract_app_info(session, url)
-                if app_info:
                     # Only keep apps that have integrations
-                    if app_info.get('integrations'):
-                        all_apps.append(app_info)
-                        apps_with_integrations += 1
+                    if page.outcome == SUCCESS and not target_reached.is_set():
+                        sink.write(page.app_info)
+                        app_count += 1
                         pbar.update(1)
-                        logger.info(f"Found app with integrations: {app_info['app_name']} ({apps_with_integrations}/{TARGET_APPS_WITH_INTEGRATIONS})")
+                        logger.info(f"Found app with integrations: {page.app_info['app_name']} ({app_count}/{target or '-'})")
+                        if target and app_count >= target:
+                            target_reached.set()
                     
-                    seen_urls.add(url)
-                
-                # Add delay between requests
-                await asyncio.sleep(random.uniform(MIN_DELAY, MAX_DELAY))
-                
-                # Log progress periodically
-                if len(seen_urls) % 50 == 0:
-                    logger.info(f"Processed {len(seen_urls)} URLs, found {apps_with_integrations} apps with integrations")
+                    # Log progress periodically
+                    processed += 1
+                    if processed % 50 == 0:
+                        logger.info(f"Processed {processed} URLs, found {app_count} apps with integrations")
+                        logger.info(f"Rate controller: {rate_controller.stats()['rates']}, throttle events: {rate_controller.throttle_count}")
+            
+            pipeline = Pipeline([
+                Stage('fetch', fetch, concurrency=CONCURRENT_REQUESTS),
+                Stage('parse', parse, concurrency=PARSE_WORKERS),
+                Stage('normalize', normalize),
+                Stage('write', write, queue_size=2 * WRITE_BATCH_SIZE, batch_size=WRITE_BATCH_SIZE),
+            ])
+            # Fetchers start on the first URLs while the rest of the sitemap is still streaming
+            producer = asyncio.ensure_future(
+                feed_app_urls(session, pipeline.input, CONCURRENT_REQUESTS, snapshot, frontier)
+            )
+            crawl = asyncio.ensure_future(pipeline.run())
+            target_waiter = asyncio.ensure_future(target_reached.wait())
+            try:
+                # Stop when either the target is reached or every URL made it through
+                await asyncio.wait([crawl, target_waiter], return_when=asyncio.FIRST_COMPLETED)
+                # A failed stage or sitemap stream must reach the caller so the
+                # sink aborts instead of committing a partial CSV
+                for task in (crawl, producer):
+                    if task.done() and not task.cancelled():
+                        task.result()
+            finally:
+                # Cancel in-flight fetches and wait for them to unwind
+                crawl.cancel()
+                target_waiter.cancel()
+                producer.cancel()
+                await asyncio.gather(crawl, target_waiter, producer, return_exceptions=True)
+        
+        if not seen_urls and not (snapshot and snapshot.unchanged):
+            logger.error("No app URLs found")
+            return 0
     
-    return all_apps
+    stats = rate_controller.stats()
+    logger.info(f"Final request rates: {stats['rates']}, throttle events: {stats['throttle_count']}")
+    logger.info(f"Response cache: {response_cache.stats()}")
+    logger.info(f"Negative cache: {negative_cache.stats()}")
+    if listing_body_limit:
+        logger.info(
+            f"Streamed listings: {registry.value('truncated_bodies_total'):.0f} cut short, "
+            f"{registry.value('http_bytes_saved_total'):.0f} bytes left unread"
+        )
+    if page_archive:
+        logger.info(f"Page archive: {page_archive.stats()}")
+    yield_stats = frontier.stats()
+    if yield_stats['fetches_per_hit']:
+        registry.set('fetches_per_hit', yield_stats['fetches_per_hit'])
+    logger.info(
+        f"Fetches per hit: {yield_stats['fetches_per_hit']} "
+        f"(prioritized {yield_stats['prioritized']['fetches_per_hit']}, "
+        f"explored {yield_stats['explored']['fetches_per_hit']}), from {yield_stats['fetches']} fetches"
+    )
+    return app_count
 
 async def main():
     """Main entry point."""
+    global listing_body_limit, page_archive, negative_cache, response_cache
+    parser = argparse.ArgumentParser(description='Collect apps with integrations from the app store sitemap')
+    parser.add_argument('--offline', action='store_true',
+                      help='Serve every request from the response cache without touching the network')
+    parser.add_argument('--resume', action='store_true',
+                      help=f'Continue an interrupted crawl from {JOURNAL_FILE}, skipping URLs already done')
+    parser.add_argument('--incremental', action='store_true',
+                      help=f'Refetch only listings new or changed since the last snapshot and merge them into {TOP_APPS_RAW}')
+    parser.add_argument('--recheck', action='store_true',
+                      help='Refetch listings remembered as missing or without integrations')
+    parser.add_argument('--explore-share', type=float, default=EXPLORATION_SHARE,
+                      help='Share of listings crawled in random order rather than by predicted yield; 1.0 disables prioritization')
+    parser.add_argument('--stream-listings', action='store_true',
+                      help='Stop reading listing pages at the reviews section; pages cut short are not cached')
+    parser.add_argument('--archive', metavar='DIR',
+                      help='Keep every listing page fetched in WARC files under DIR for reextract_pages.py')
+    parser.add_argument('--metrics-file', default=METRICS_FILE,
+                      help='File crawl metrics are written to periodically; .prom for Prometheus text, otherwise JSON')
+    parser.add_argument('--metrics-port', type=int,
+                      help='Also serve metrics on http://127.0.0.1:PORT/metrics while crawling')
+    args = parser.parse_args()
+    response_cache = ResponseCache(CACHE_DIR, offline=args.offline)
+    negative_cache = NegativeCache(NEGATIVE_CACHE_FILE)
+    negative_cache.consult = not args.recheck
+    listing_body_limit = LISTING_BODY_LIMIT if args.stream_listings else None
+    page_archive = PageArchive(args.archive) if args.archive else None
+    
     logger.info("Starting app collection from sitemap")
+    if args.offline:
+        logger.info(f"Offline mode: serving from {CACHE_DIR}")
     logger.info(f"Target: {TARGET_APPS_WITH_INTEGRATIONS} apps with integrations")
     
     try:
         # Create data directory if it doesn't exist
         os.makedirs(DATA_DIR, exist_ok=True)
         
-        # Collect apps
-        apps = await collect_apps()
-        logger.info(f"Successfully collected {len(apps)} apps with integrations")
-        
-        if not apps:
-            logger.error("No apps were collected")
-            sys.exit(1)
-        
-        # Convert to DataFrame and save
-        df = pd.DataFrame(apps)
-        df.to_csv(TOP_APPS_RAW, index=False)
-        logger.info(f"Saved {len(df)} apps to {TOP_APPS_RAW}")
+        # Collect apps, journaling every outcome so an interrupted crawl can resume
+        resume_state = load_journal(JOURNAL_FILE) if args.resume else None
+        snapshot = SitemapSnapshot(SNAPSHOT_FILE) if args.incremental else None
+        # Trained before the journal is reopened, which truncates it unless resuming
+        model = YieldModel.from_history(JOURNAL_FILE, TOP_APPS_RAW, negative_cache)
+        # Apps stream into TOP_APPS_RAW.partial, which replaces the CSV only
+        # once the run completes
+        try:
+            with CsvSink(TOP_APPS_RAW) as sink, CrawlJournal(JOURNAL_FILE, resume=args.resume) as journal:
+                async with MetricsReporter(registry, args.metrics_file, port=args.metrics_port):
+                    app_count = await collect_apps(
+                        sink, journal, resume_state, snapshot,
+                        model=model, explore_share=args.explore_share
+                    )
+                logger.info(f"Successfully collected {app_count} apps with integrations")
+                
+                if snapshot:
+                    app_count += copy_unchanged_apps(TOP_APPS_RAW, sink, snapshot.refreshed)
+                if not app_count:
+                    logger.error("No apps were collected")
+                    sys.exit(1)
+            # Only once the CSV holds the refreshed rows: a snapshot saved by a
+            # failed run would mark listings unchanged whose new records were lost.
+            # Progress of a failed run survives in the journal for --resume.
+            if snapshot:
+                snapshot.save()
+        finally:
+            if page_archive:
+                page_archive.close()
+        logger.info(f"Saved {app_count} apps to {TOP_APPS_RAW}")
         
         # Print summary
+        df = pd.read_csv(TOP_APPS_RAW, usecols=['integrations'], dtype=str)
         print("\nCollection Summary:")
         print(f"Total apps with integrations: {len(df)}")
+        if snapshot:
+            print(f"Listings refetched: {len(snapshot.refreshed)}, unchanged: {snapshot.unchanged}")
         print(f"Average integrations per app: {df['integrations'].str.count(',').mean() + 1:.2f}")
         print(f"Max integrations for an app: {df['integrations'].str.count(',').max() + 1}")
         
     except KeyboardInterrupt:
-        logger.info("Script interrupted by user")
+        logger.info(f"Script interrupted by user; rerun with --resume to continue from {JOURNAL_FILE}")
         sys.exit(0)
         
     except Exception as e:
@@ -366,5 +590,5 @@ if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        logger.info("Script interrupted by user")
+        logger.info(f"Script interrupted by user; rerun with --resume to continue from {JOURNAL_FILE}")
         sys.exit(0) 
\ No newline at end of file
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Sharded sitemap crawl across several processes or machines.
+
+The coordinator streams the sitemap into a SQLite frontier (see
+crawl_frontier.py), starts worker processes that lease URLs from it and run
+the usual fetch/extract pipeline of scrape_sitemap.py, and finally merges
+the apps they found into top_apps_raw.csv. Workers on other machines can
+join by running `sharded_crawl.py worker` against the same frontier file on
+a shared filesystem.
+
+    python src/sharded_crawl.py coordinate --workers 4
+    python src/sharded_crawl.py worker --frontier /shared/crawl_frontier.sqlite --shards 8
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import aiohttp
+import pandas as pd
+
+import scrape_sitemap
+from crawl_frontier import CrawlFrontier
+from crawl_journal import ERROR, SUCCESS
+from csv_sink import CsvSink
+from http_cache import ResponseCache
+from metrics import MetricsReporter, registry
+from negative_cache import NegativeCache
+from rate_limit import AdaptiveRateController
+from sitemap_stream import SitemapEntry, stream_sitemap
+from utils import is_direct_app_url
+
+logger = logging.getLogger(__name__)
+
+FRONTIER_FILE = os.path.join(scrape_sitemap.DATA_DIR, 'crawl_frontier.sqlite')
+WORKERS = 4  # Local worker processes started by the coordinator
+SEED_BATCH_SIZE = 500  # Sitemap URLs inserted per frontier transaction
+POLL_INTERVAL = 2.0  # Seconds between frontier checks when there is nothing to lease
+PROGRESS_INTERVAL = 30.0  # Seconds between coordinator progress reports
+SUCCESS_CHECK_COMPLETIONS = 20  # URLs a worker finishes between reads of the shared success count
+SUCCESS_CHECK_INTERVAL = 10.0  # Seconds after which a worker rereads the shared success count anyway
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+async def seed_frontier(frontier: CrawlFrontier) -> int:
+    """
+    Stream every direct app URL from the sitemap into the frontier and seal it.
+
+    Returns:
+        Number of URLs newly queued
+    """
+    added = 0
+    batch: List[str] = []
+
+    async def add_url(entry: SitemapEntry) -> None:
+        nonlocal added
+        batch.append(entry.loc)
+        if len(batch) >= SEED_BATCH_SIZE:
+            added += frontier.add(batch)
+            batch.clear()
+            # Let workers start on the first URLs while the sitemap streams
+            await asyncio.sleep(0)
+
+    async with aiohttp.ClientSession() as session:
+        count = await stream_sitemap(
+            session, scrape_sitemap.SITEMAP_URL, add_url,
+            url_filter=is_direct_app_url,
+            headers=scrape_sitemap.get_random_headers(),
+            rate_controller=scrape_sitemap.rate_controller,
+            cache=scrape_sitemap.response_cache
+        )
+    added += frontier.add(batch)
+    frontier.seal()
+    logger.info(f"Seeded frontier with {added} new of {count} direct app URLs")
+    return added
+
+
+async def run_worker(
+    frontier: CrawlFrontier,
+    worker_id: str,
+    shards: int = 1,
+    target: Optional[int] = None
+) -> int:
+    """
+    Lease URLs from the frontier and crawl them until it drains or the target is met.
+
+    The per-host rate is divided by `shards` so all workers together stay
+    within the single-process politeness limits.
+
+    Args:
+        frontier: Shared frontier to lease from
+        worker_id: Identifier leases are held under
+        shards: Total number of workers sharing the crawl
+        target: Stop once this many apps with integrations were found overall
+
+    Returns:
+        Number of URLs this worker finished
+    """
+    scrape_sitemap.rate_controller = AdaptiveRateController(
+        scrape_sitemap.REQUESTS_PER_SECOND / shards,
+        burst=scrape_sitemap.CONCURRENT_REQUESTS,
+        max_rate=scrape_sitemap.MAX_REQUESTS_PER_SECOND / shards
+    )
+    finished = 0
+    # The shared success count is a COUNT(*) over the frontier, so it is only
+    # reread every few completions; in between, the last count plus this
+    # worker's own successes is a lower bound that can already meet the target
+    shared_successes = 0
+    own_successes = completions = 0
+    checked_at = float('-inf')
+
+    def target_met() -> bool:
+        nonlocal shared_successes, own_successes, completions, checked_at
+        if not target:
+            return False
+        if shared_successes + own_successes >= target:
+            return True
+        if completions >= SUCCESS_CHECK_COMPLETIONS or time.monotonic() - checked_at >= SUCCESS_CHECK_INTERVAL:
+            shared_successes = frontier.success_count()
+            own_successes = completions = 0
+            checked_at = time.monotonic()
+        return shared_successes >= target
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(frontier.lease_seconds / 3)
+            frontier.renew(worker_id)
+
+    async with aiohttp.ClientSession() as session:
+        with ProcessPoolExecutor(max_workers=scrape_sitemap.PARSE_WORKERS) as executor:
+            async def crawl():
+                nonlocal finished, own_successes, completions
+                while not target_met():
+                    urls = frontier.lease(worker_id)
+                    if not urls:
+                        if frontier.is_drained():
+                            return
+                        await asyncio.sleep(POLL_INTERVAL)
+                        continue
+
+                    url = urls[0]
+                    outcome, app_info = await scrape_sitemap.extract_app_info(session, url, executor)
+                    if outcome == SUCCESS:
+                        app_info = scrape_sitemap.normalize_app_info(app_info)
+                    registry.inc('crawl_outcomes_total', outcome=outcome)
+                    if frontier.complete(url, worker_id, outcome, app_info if outcome == SUCCESS else None):
+                        finished += outcome != ERROR
+                        completions += 1
+                        if outcome == SUCCESS:
+                            own_successes += 1
+                            logger.info(f"Found app with integrations: {app_info['app_name']}")
+
+            renewer = asyncio.ensure_future(heartbeat())
+            try:
+                await asyncio.gather(*(crawl() for _ in range(scrape_sitemap.CONCURRENT_REQUESTS)))
+            finally:
+                renewer.cancel()
+                await asyncio.gather(renewer, return_exceptions=True)
+                # Hand unfinished URLs straight back rather than waiting for the leases to expire
+                released = frontier.release(worker_id)
+                if released:
+                    logger.info(f"Released {released} unfinished leases")
+
+    logger.info(f"Worker {worker_id} finished {finished} URLs")
+    return finished
+
+
+def start_workers(frontier_path: str, count: int, target: Optional[int]) -> List[subprocess.Popen]:
+    """Start `count` local worker processes on the frontier."""
+    host = socket.gethostname()
+    processes = []
+    for shard in range(count):
+        command = [
+            sys.executable, os.path.abspath(__file__), 'worker',
+            '--frontier', frontier_path,
+            '--worker-id', f"{host}-shard{shard}",
+            '--shards', str(count),
+            '--metrics-file', os.path.join(scrape_sitemap.DATA_DIR, f'shard{shard}_metrics.json'),
+        ]
+        if target:
+            command += ['--target', str(target)]
+        processes.append(subprocess.Popen(command))
+    logger.info(f"Started {count} worker processes")
+    return processes
+
+
+async def wait_for_crawl(frontier: CrawlFrontier, processes: List[subprocess.Popen], target: Optional[int]) -> None:
+    """Wait until the frontier drains, the target is met, or every local worker has exited."""
+    last_report = time.monotonic()
+    while True:
+        if frontier.is_drained() or (target and frontier.success_count() >= target):
+            break
+        if processes and all(process.poll() is not None for process in processes):
+            logger.warning("Every worker process exited before the frontier drained")
+            break
+        if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+            logger.info(f"Frontier: {frontier.counts()}")
+            last_report = time.monotonic()
+        await asyncio.sleep(POLL_INTERVAL)
+
+    for process in processes:
+        code = await asyncio.get_running_loop().run_in_executor(None, process.wait)
+        if code:
+            logger.warning(f"Worker process {process.pid} exited with status {code}; its leases expire back into the frontier")
+
+
+def merge_shards(frontier: CrawlFrontier, output_path: str, target: Optional[int] = None) -> int:
+    """
+    Write every worker's apps into one CSV.
+
+    Returns:
+        Number of apps written
+    """
+    with CsvSink(output_path) as sink:
+        sink.write_many(frontier.records(limit=target))
+    return sink.rows_written
+
+
+async def coordinate(args: argparse.Namespace) -> None:
+    target = args.target or None
+    scrape_sitemap.response_cache = ResponseCache(scrape_sitemap.CACHE_DIR)
+    if not args.resume:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.frontier + suffix):
+                os.remove(args.frontier + suffix)
+
+    with CrawlFrontier(args.frontier) as frontier:
+        processes = start_workers(args.frontier, args.workers, target) if args.workers else []
+        try:
+            if not frontier.sealed:
+                await seed_frontier(frontier)
+            await wait_for_crawl(frontier, processes, target)
+        finally:
+            for process in processes:
+                if process.poll() is None:
+                    process.terminate()
+
+        counts = frontier.counts()
+        logger.info(f"Frontier: {counts}")
+        app_count = merge_shards(frontier, scrape_sitemap.TOP_APPS_RAW, target)
+
+    if not app_count:
+        logger.error("No apps were collected")
+        sys.exit(1)
+    logger.info(f"Saved {app_count} apps to {scrape_sitemap.TOP_APPS_RAW}")
+
+    df = pd.read_csv(scrape_sitemap.TOP_APPS_RAW, usecols=['integrations'], dtype=str)
+    print("\nCollection Summary:")
+    print(f"Total apps with integrations: {len(df)}")
+    print(f"URLs done: {counts['done']}, pending: {counts['pending']}, leased: {counts['leased']}")
+    print(f"Average integrations per app: {df['integrations'].str.count(',').mean() + 1:.2f}")
+
+
+async def work(args: argparse.Namespace) -> None:
+    scrape_sitemap.response_cache = ResponseCache(scrape_sitemap.CACHE_DIR)
+    scrape_sitemap.negative_cache = NegativeCache(scrape_sitemap.NEGATIVE_CACHE_FILE)
+    with CrawlFrontier(args.frontier) as frontier:
+        async with MetricsReporter(registry, args.metrics_file):
+            await run_worker(frontier, args.worker_id, args.shards, args.target or None)
+
+
+async def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description='Crawl the app store sitemap with several worker processes')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    coordinate_parser = commands.add_parser('coordinate', help='Seed the frontier, run local workers and merge their apps')
+    coordinate_parser.add_argument('--workers', type=int, default=WORKERS,
+                                   help='Local worker processes to start; 0 to rely on workers started elsewhere')
+    coordinate_parser.add_argument('--resume', action='store_true',
+                                   help='Keep the existing frontier and continue where it left off')
+
+    worker_parser = commands.add_parser('worker', help='Crawl URLs leased from a shared frontier')
+    worker_parser.add_argument('--worker-id', default=default_worker_id(), help='Name leases are held under')
+    worker_parser.add_argument('--shards', type=int, default=1,
+                               help='Total workers sharing the crawl; divides the request rate')
+    worker_parser.add_argument('--metrics-file', help='File to write this worker\'s metrics to')
+
+    for command_parser in (coordinate_parser, worker_parser):
+        command_parser.add_argument('--frontier', default=FRONTIER_FILE, help='Shared frontier database')
+        command_parser.add_argument('--target', type=int, default=scrape_sitemap.TARGET_APPS_WITH_INTEGRATIONS,
+                                    help='Apps with integrations to stop at; 0 crawls the whole sitemap')
+
+    args = parser.parse_args()
+    os.makedirs(scrape_sitemap.DATA_DIR, exist_ok=True)
+    if args.command == 'coordinate':
+        await coordinate(args)
+    else:
+        await work(args)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Interrupted; rerun the coordinator with --resume to continue from the frontier")
+        sys.exit(0)
@@ -0,0 +1,76 @@
+"""
+Coalescing of concurrent identical requests.
+
+When several tasks ask for the same key while a call for it is still
+running, they all wait for that one call and share its result instead of
+starting their own. Nothing is remembered once the call finishes; repeated
+requests later on are left to the response and negative caches.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    """A running call and the number of callers waiting for it."""
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and shares its result with every concurrent caller."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0  # Calls actually started
+        self.shared = 0  # Callers served by a call another caller started
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether a call for `key` is running."""
+        return key in self._calls
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await the call for `key`, starting it with `factory()` unless one is already running.
+
+        The call is cancelled only once every caller waiting for it has been
+        cancelled, so one caller giving up does not fail the others.
+
+        Args:
+            key: Identity of the request, e.g. a canonical URL
+            factory: Creates the coroutine to run if no call for `key` is running
+
+        Returns:
+            The call's result; its exception is raised to every caller
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.calls += 1
+        else:
+            self.shared += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if not call.waiters and not call.task.done():
+                # Every caller gave up; later callers start afresh rather than
+                # joining a call that is being cancelled
+                self._forget(key, call)
+                call.task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        """Calls started, callers that shared another's call, and calls in flight."""
+        return {'calls': self.calls, 'shared': self.shared, 'in_flight': len(self._calls)}
@@ -0,0 +1,108 @@
+"""
+Sitemap snapshot for incremental recrawls.
+
+Remembers the <lastmod> last seen for every listing URL so an incremental
+run only refetches listings that are new or have changed since, and merges
+the refreshed apps with the existing dataset by their stable slug key.
+"""
+import json
+import logging
+import os
+from typing import Dict, Optional, Set
+
+import pandas as pd
+
+from csv_sink import CsvSink
+from sitemap_stream import SitemapEntry
+from utils import app_slug, clean_url
+
+logger = logging.getLogger(__name__)
+
+
+class SitemapSnapshot:
+    """Last-seen <lastmod> per canonical listing URL."""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: JSON file the snapshot is loaded from and saved to
+        """
+        self.path = path
+        self.lastmods: Dict[str, Optional[str]] = {}
+        self.refreshed: Set[str] = set()  # URLs refetched this run with a final outcome
+        self.unchanged = 0
+        self._pending: Dict[str, Optional[str]] = {}  # Current lastmod of URLs queued this run
+
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.lastmods = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read sitemap snapshot {path}, treating every listing as new: {str(e)}")
+        logger.info(f"Loaded sitemap snapshot with {len(self.lastmods)} listings")
+
+    def is_changed(self, entry: SitemapEntry) -> bool:
+        """
+        Check whether a sitemap entry is new or modified since the last snapshot.
+
+        Entries without a <lastmod> are always treated as changed; the
+        response cache still turns an unchanged page into a cheap 304.
+        """
+        url = clean_url(entry.loc)
+        if entry.lastmod is not None and url in self.lastmods and self.lastmods[url] == entry.lastmod:
+            self.unchanged += 1
+            return False
+        self._pending[url] = entry.lastmod
+        return True
+
+    def mark_done(self, url: str) -> None:
+        """Record that a changed URL was refetched, adopting its new lastmod."""
+        url = clean_url(url)
+        self.lastmods[url] = self._pending.pop(url, None)
+        self.refreshed.add(url)
+
+    def save(self) -> None:
+        """Atomically write the snapshot."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.lastmods, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def copy_unchanged_apps(existing_path: str, sink: CsvSink, refreshed: Set[str], chunk_size: int = 1000) -> int:
+    """
+    Carry apps from the existing dataset over into a new one, keyed by slug.
+
+    Apps whose URL was refreshed this run are left out; their new record (if
+    the listing still has integrations) has already been written to `sink`.
+    Rows from older snapshots with random numeric api_keys are rekeyed by
+    their URL's slug. The dataset is streamed in chunks, never loaded whole.
+
+    Args:
+        existing_path: Previously saved apps CSV
+        sink: Output the refreshed apps were written to
+        refreshed: Canonical URLs refetched in this run
+        chunk_size: Rows read at a time
+
+    Returns:
+        Number of apps carried over
+    """
+    if not os.path.exists(existing_path):
+        return 0
+
+    refreshed_keys = {app_slug(url) for url in refreshed}
+    kept = dropped = 0
+    try:
+        chunks = pd.read_csv(existing_path, dtype=str, keep_default_na=False, chunksize=chunk_size)
+    except pd.errors.EmptyDataError:
+        return 0
+    for chunk in chunks:
+        chunk['api_key'] = [
+            app_slug(url) or key for url, key in zip(chunk['app_store_url'], chunk['api_key'])
+        ]
+        unchanged = chunk[~chunk['api_key'].isin(refreshed_keys)]
+        sink.write_many(unchanged.to_dict('records'))
+        kept += len(unchanged)
+        dropped += len(chunk) - len(unchanged)
+    logger.info(f"Merged snapshot: {kept} unchanged apps kept, {dropped} replaced or dropped")
+    return kept
@@ -0,0 +1,208 @@
+"""
+Incremental sitemap reader.
+
+Parses <loc>/<lastmod> entries while the response body is still arriving,
+follows sitemap-index files to their child sitemaps concurrently and
+transparently decompresses gzipped (.xml.gz) sitemaps.
+"""
+import asyncio
+import logging
+import zlib
+from typing import Awaitable, Callable, Dict, Iterator, List, NamedTuple, Optional, Set
+
+import aiohttp
+from lxml import etree
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+MAX_CONCURRENT_SITEMAPS = 4
+MAX_RETRIES = 3
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class SitemapEntry(NamedTuple):
+    """A single <url> or <sitemap> entry."""
+    loc: str
+    lastmod: Optional[str] = None
+
+
+def _localname(elem) -> str:
+    return etree.QName(elem).localname if isinstance(elem.tag, str) else ''
+
+
+class SitemapParser:
+    """Push parser that yields entries as soon as each one has been read."""
+
+    def __init__(self):
+        self._parser = etree.XMLPullParser(events=('end',), resolve_entities=False, huge_tree=True)
+        self._decompressor = None
+        self._sniffed = False
+        self.is_index = False
+
+    def feed(self, chunk: bytes) -> Iterator[SitemapEntry]:
+        """Feed raw (possibly gzipped) bytes and yield the entries they complete."""
+        if not self._sniffed:
+            # Gzipped sitemaps are usually served without Content-Encoding,
+            # so look at the payload itself rather than trusting headers
+            if chunk.startswith(GZIP_MAGIC):
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            self._sniffed = True
+        if self._decompressor:
+            chunk = self._decompressor.decompress(chunk)
+        self._parser.feed(chunk)
+        yield from self._read_events()
+
+    def close(self) -> Iterator[SitemapEntry]:
+        """Flush any buffered input and yield the remaining entries."""
+        if self._decompressor:
+            self._parser.feed(self._decompressor.flush())
+        self._parser.close()
+        yield from self._read_events()
+
+    def _read_events(self) -> Iterator[SitemapEntry]:
+        for _, elem in self._parser.read_events():
+            tag = _localname(elem)
+            if tag not in ('url', 'sitemap'):
+                continue
+            if tag == 'sitemap':
+                self.is_index = True
+
+            loc = lastmod = None
+            for child in elem:
+                name = _localname(child)
+                if name == 'loc':
+                    loc = (child.text or '').strip()
+                elif name == 'lastmod':
+                    lastmod = (child.text or '').strip() or None
+
+            # Drop finished entries so memory stays flat on huge sitemaps
+            elem.clear()
+            parent = elem.getparent()
+            if parent is not None:
+                while elem.getprevious() is not None:
+                    del parent[0]
+
+            if loc:
+                yield SitemapEntry(loc, lastmod)
+
+
+async def stream_sitemap(
+    session: aiohttp.ClientSession,
+    url: str,
+    on_entry: Callable[[SitemapEntry], Awaitable[None]],
+    url_filter: Optional[Callable[[str], bool]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    rate_controller=None,
+    cache=None,
+    max_concurrent_sitemaps: int = MAX_CONCURRENT_SITEMAPS
+) -> int:
+    """
+    Stream a sitemap (or sitemap index) and hand every page entry to `on_entry`.
+
+    Args:
+        session: aiohttp session to fetch with
+        url: Sitemap or sitemap-index URL
+        on_entry: Coroutine function awaited for each page entry, e.g. a queue's put
+        url_filter: Optional predicate; entries whose loc fails it are skipped
+        headers: Optional request headers
+        rate_controller: Optional AdaptiveRateController to pace requests through
+        cache: Optional ResponseCache; sitemaps are revalidated against it and
+            served from it entirely when it is offline
+        max_concurrent_sitemaps: How many child sitemaps to stream at once
+
+    Returns:
+        Number of entries passed to `on_entry`; each loc is passed once per
+        sitemap, however many attempts reading it took
+    """
+    semaphore = asyncio.Semaphore(max_concurrent_sitemaps)
+    emitted = 0
+
+    async def dispatch(parser: SitemapParser, entries: Iterator[SitemapEntry], children: List[str], seen: Set[str]) -> None:
+        nonlocal emitted
+        for entry in entries:
+            if parser.is_index:
+                children.append(entry.loc)
+            elif entry.loc not in seen and (url_filter is None or url_filter(entry.loc)):
+                seen.add(entry.loc)
+                emitted += 1
+                await on_entry(entry)
+
+    async def read_cached(entry, children: List[str], seen: Set[str]) -> None:
+        parser = SitemapParser()
+        with open(entry.path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                await dispatch(parser, parser.feed(chunk), children, seen)
+        await dispatch(parser, parser.close(), children, seen)
+
+    async def read(sitemap_url: str) -> None:
+        children: List[str] = []
+        # Locs this sitemap has handed out, so a retry after a partial body
+        # only passes on the entries the failed attempt did not reach
+        seen: Set[str] = set()
+        cached = cache.get(sitemap_url) if cache else None
+
+        async with semaphore:
+            if cache and cache.offline:
+                if cached:
+                    await read_cached(cached, children, seen)
+                else:
+                    logger.warning(f"Sitemap not in cache (offline): {sitemap_url}")
+
+            for attempt in range(0 if cache and cache.offline else MAX_RETRIES):
+                children.clear()
+                request_headers = dict(headers or {})
+                if cache:
+                    request_headers.update(cache.conditional_headers(cached))
+                if rate_controller:
+                    await rate_controller.acquire(sitemap_url)
+                writer = None
+                try:
+                    async with session.get(sitemap_url, headers=request_headers) as response:
+                        if rate_controller:
+                            rate_controller.record(sitemap_url, response.status, response.headers.get('Retry-After'))
+                        registry.inc('http_requests_total', method='GET', status=response.status)
+                        if response.status == 304 and cached:
+                            logger.info(f"Sitemap unchanged, reading from cache: {sitemap_url}")
+                            await read_cached(cached, children, seen)
+                            break
+                        if response.status == 429 or response.status >= 500:
+                            logger.warning(f"Got status {response.status} for sitemap {sitemap_url} (attempt {attempt + 1}/{MAX_RETRIES})")
+                            continue
+                        if response.status != 200:
+                            logger.warning(f"Got status {response.status} for sitemap {sitemap_url}")
+                            return
+
+                        # Tee the raw bytes into the cache while parsing them
+                        writer = cache.open_writer(sitemap_url) if cache else None
+                        parser = SitemapParser()
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            if writer:
+                                writer.write(chunk)
+                            registry.inc('http_response_bytes_total', len(chunk))
+                            await dispatch(parser, parser.feed(chunk), children, seen)
+                        await dispatch(parser, parser.close(), children, seen)
+                        if writer:
+                            writer.commit(response.headers)
+                        break
+                except (aiohttp.ClientError, asyncio.TimeoutError, etree.XMLSyntaxError, zlib.error) as e:
+                    if rate_controller:
+                        rate_controller.record(sitemap_url, None)
+                    registry.inc('sitemap_errors_total')
+                    logger.warning(f"Error reading sitemap {sitemap_url}: {str(e)} (attempt {attempt + 1}/{MAX_RETRIES})")
+                    continue
+                finally:
+                    # No-op once committed; otherwise drops the partial body
+                    if writer:
+                        writer.abort()
+
+        if children:
+            logger.info(f"Sitemap index {sitemap_url} lists {len(children)} child sitemaps")
+            # Children are read outside the parent's semaphore slot so nested
+            # indexes cannot deadlock the pool
+            await asyncio.gather(*(read(child) for child in children))
+
+    await read(url)
+    return emitted
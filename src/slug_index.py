@@ -0,0 +1,179 @@
+"""
+Local index of listing slugs from the app store sitemap.
+
+Resolves an app name to its most likely listing URL without any HTTP, using
+an exact slug match first and then a fuzzy match on shared slug tokens and
+edit distance.
+"""
+import logging
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+from urllib.parse import urlparse
+
+import aiohttp
+
+from sitemap_stream import SitemapEntry, stream_sitemap
+from utils import clean_url, is_direct_app_url
+
+logger = logging.getLogger(__name__)
+
+MIN_FUZZY_SCORE = 0.6
+COMMON_TOKEN_LIMIT = 300  # Tokens shared by more slugs than this are too generic to find candidates by
+
+# Separators between an app's name and its tagline, e.g. "GDPR ‑ Customer Accounts"
+NAME_TAGLINE_SPLIT = re.compile(r'\s+[-‑–—|:]\s+')
+
+
+def slugify(text: str) -> str:
+    """Turn an app name into the slug form used by listing URLs."""
+    text = re.sub(r'[^\w\s-]', '', text.lower())
+    return re.sub(r'[-_\s]+', '-', text).strip('-')
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance between two strings."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,  # Deletion
+                current[j - 1] + 1,  # Insertion
+                previous[j - 1] + (char_a != char_b)  # Substitution
+            ))
+        previous = current
+    return previous[-1]
+
+
+class SlugIndex:
+    """Set of known listing URLs with exact and fuzzy lookup by app name."""
+
+    def __init__(self, urls: Iterable[str] = ()):
+        self._urls: Dict[str, str] = {}
+        self._by_token: Dict[str, Set[str]] = defaultdict(set)
+        for url in urls:
+            self.add(url)
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+    def __contains__(self, url: str) -> bool:
+        canonical = clean_url(url)
+        return bool(canonical) and urlparse(canonical).path.strip('/') in self._urls
+
+    def add(self, url: str) -> None:
+        """Add a direct listing URL to the index."""
+        canonical = clean_url(url)
+        if not canonical:
+            return
+        slug = urlparse(canonical).path.strip('/')
+        self._urls[slug] = canonical
+        for token in slug.split('-'):
+            self._by_token[token].add(slug)
+
+    def _is_generic(self, candidate: str) -> bool:
+        """Whether a listing slug is a single word that other listing slugs use too, like "google"."""
+        return '-' not in candidate and len(self._by_token.get(candidate, ())) > 1
+
+    def _score(self, slug: str, candidate: str) -> float:
+        """Similarity between a name slug and a listing slug, from 0 to 1."""
+        compact, candidate_compact = slug.replace('-', ''), candidate.replace('-', '')
+        shorter, longer = sorted((len(compact), len(candidate_compact)))
+        if compact == candidate_compact:
+            return 0.95
+
+        # A generic word in the name ("PixelPro: Google Analytics") says
+        # nothing about which listing it is, so it only matches exactly
+        generic = self._is_generic(candidate)
+
+        # Listing slugs often extend the name ("autoschema-google-structures")
+        # or drop its tail ("deckcommerce" for "Deck Commerce Order Management")
+        if not generic and (candidate_compact.startswith(compact) or compact.startswith(candidate_compact)):
+            return 0.7 + 0.2 * shorter / longer
+
+        # Or keep a subset of its words ("pimcore-connector-by-hamari")
+        tokens, candidate_tokens = set(slug.split('-')), set(candidate.split('-'))
+        if not generic and candidate_tokens <= tokens:
+            return 0.75 + 0.15 * len(candidate_tokens) / len(tokens)
+
+        # Edit distance is only meaningful between slugs of similar length
+        if shorter / longer < 0.6:
+            return 0.0
+        overlap = len(tokens & candidate_tokens) / len(tokens | candidate_tokens)
+        similarity = 1 - edit_distance(slug, candidate) / max(len(slug), len(candidate))
+        return (overlap + similarity) / 2
+
+    def _fuzzy(self, slug: str) -> Optional[str]:
+        tokens = [t for t in slug.split('-') if t]
+        specific = [t for t in tokens if len(self._by_token.get(t, ())) <= COMMON_TOKEN_LIMIT]
+        candidates: Set[str] = set()
+        for token in specific or tokens:
+            candidates |= self._by_token.get(token, set())
+        if not candidates:
+            return None
+
+        # Ties go to the shorter slug, which is usually the app's own listing
+        best_score, _, best = max((self._score(slug, c), -len(c), c) for c in candidates)
+        return best if best_score >= MIN_FUZZY_SCORE else None
+
+    def lookup(self, app_name: str) -> Optional[str]:
+        """
+        Find the most likely listing URL for an app name.
+
+        Args:
+            app_name: App name as it appears in the app data
+
+        Returns:
+            Listing URL, or None if nothing is a close enough match
+        """
+        if not app_name or not isinstance(app_name, str):
+            return None
+
+        # Try the part before any tagline first, then the full name
+        variations = [NAME_TAGLINE_SPLIT.split(app_name.strip())[0], app_name.strip()]
+
+        slugs = list(dict.fromkeys(slugify(v) for v in variations if slugify(v)))
+        for slug in slugs:
+            if slug in self._urls:
+                return self._urls[slug]
+        for slug in slugs:
+            match = self._fuzzy(slug)
+            if match:
+                return self._urls[match]
+        return None
+
+    def filter_existing(self, urls: List[str]) -> List[str]:
+        """Keep only the URLs that are known listings."""
+        return [url for url in urls if url in self]
+
+
+async def build_slug_index(
+    session: aiohttp.ClientSession,
+    sitemap_url: str,
+    headers: Optional[Dict[str, str]] = None,
+    rate_controller=None,
+    cache=None
+) -> SlugIndex:
+    """
+    Build a slug index from the direct app URLs in the sitemap.
+
+    With a response cache the sitemap is only revalidated, and in offline
+    mode it is read from the cache alone.
+    """
+    index = SlugIndex()
+
+    async def add_url(entry: SitemapEntry) -> None:
+        index.add(entry.loc)
+
+    await stream_sitemap(
+        session, sitemap_url, add_url,
+        url_filter=is_direct_app_url,
+        headers=headers,
+        rate_controller=rate_controller,
+        cache=cache
+    )
+    logger.info(f"Built slug index with {len(index)} listings")
+    return index
@@ -1,6 +1,11 @@
+import argparse
 import pandas as pd
 import re
 
+from fingerprints import (
+    FINGERPRINT_COLUMN, fingerprint_rows, load_previous, log_reuse, previous_values, read_list_cell, unchanged_rows
+)
+
 def standardize_integration_name(name: str) -> str:
     """Standardize a single integration name"""
     if not name:
@@ -108,12 +113,19 @@ def standardize_integration_name(name: str) -> str:
     
     return ' '.join(capitalized_words)
 
-def standardize_integrations(csv_path: str, output_path: str):
+def standardize_integrations(csv_path: str, output_path: str, full: bool = False):
     """
     Read CSV file, standardize integration names, and save to new file
+    
+    Rows whose content fingerprint matches their app's row in the existing
+    output keep its standardized integrations unless `full` is set.
     """
     # Read the CSV file
     df = pd.read_csv(csv_path)
+    df[FINGERPRINT_COLUMN] = fingerprint_rows(df)
+    previous = None if full else load_previous(output_path)
+    unchanged = unchanged_rows(df, previous)
+    log_reuse("Standardization", unchanged)
     
     # Process integrations column
     def process_integration_list(integrations):
@@ -135,8 +147,12 @@ def standardize_integrations(csv_path: str, output_path: str):
             return sorted(list(set(cleaned)))  # Remove duplicates and sort
         return []
     
-    # Apply standardization
-    df['integrations'] = df['integrations'].apply(process_integration_list)
+    # Apply standardization to changed rows
+    carried = previous_values(df, previous, unchanged, 'integrations')
+    df['integrations'] = [
+        read_list_cell(carried[idx]) if unchanged[idx] else process_integration_list(integrations)
+        for idx, integrations in df['integrations'].items()
+    ]
     
     # Save to new file
     df.to_csv(output_path, index=False)
@@ -153,8 +169,13 @@ def standardize_integrations(csv_path: str, output_path: str):
     print(f"Apps with integrations: {apps_with_integrations}")
     print(f"Total integration mentions: {total_integrations}")
     print(f"Unique integrations: {unique_integrations}")
+    print(f"Unchanged since the last run: {int(unchanged.sum())}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Standardize integration names')
+    parser.add_argument('--full', action='store_true',
+                        help='Restandardize every row, not only those changed since the last run; needed after changing the mappings')
+    args = parser.parse_args()
     input_file = "data/apps_for_analysis.csv"
     output_file = "data/standardized_apps.csv"
-    standardize_integrations(input_file, output_file) 
\ No newline at end of file
+    standardize_integrations(input_file, output_file, full=args.full) 
\ No newline at end of file
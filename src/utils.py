@@ -2,8 +2,11 @@
 Utility functions for the app integration analysis project.
 """
 import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Union, Dict, Any
+from typing import Union, Dict, Any, Iterable, List, Optional
+from urllib.parse import urlparse
 
 # Set up logging
 def setup_logging(log_file: Union[str, Path] = None, level: int = logging.INFO) -> None:
@@ -32,6 +35,10 @@ def safe_request(url: str, headers: Dict[str, str] = None, timeout: int = 30) ->
     """
     Make a safe HTTP request with proper error handling.
     
+    Requests share the pooled client in http_client.py: connections are kept
+    alive per host, host names are resolved through a DNS cache, and 429s
+    and 5xx responses are retried with backoff before being reported.
+    
     Args:
         url: URL to request
         headers: Optional request headers
@@ -40,11 +47,12 @@ def safe_request(url: str, headers: Dict[str, str] = None, timeout: int = 30) ->
     Returns:
         Dictionary containing response data or error information
     """
-    import requests
     from requests.exceptions import RequestException
     
+    from http_client import get_session
+    
     try:
-        response = requests.get(url, headers=headers, timeout=timeout)
+        response = get_session().get(url, headers=headers, timeout=timeout)
         response.raise_for_status()
         return {
             'success': True,
@@ -58,6 +66,72 @@ def safe_request(url: str, headers: Dict[str, str] = None, timeout: int = 30) ->
             'status_code': getattr(e.response, 'status_code', None) if hasattr(e, 'response') else None
         }
 
+def safe_request_many(
+    urls: Iterable[str],
+    headers: Dict[str, str] = None,
+    timeout: int = 30,
+    max_workers: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Make safe_request calls for several URLs concurrently.
+    
+    Args:
+        urls: URLs to request
+        headers: Optional request headers, sent with every request
+        timeout: Request timeout in seconds
+        max_workers: Requests in flight at once; defaults to the client's
+            per-host pool size, which caps requests to any one host anyway
+        
+    Returns:
+        One safe_request result per URL, in the order of `urls`
+    """
+    from http_client import current_pool_size
+    
+    with ThreadPoolExecutor(max_workers=max_workers or current_pool_size()) as executor:
+        return list(executor.map(lambda url: safe_request(url, headers, timeout), urls))
+
+def clean_url(url: str) -> str:
+    """Clean and normalize a Shopify app store URL."""
+    if not url:
+        return ''
+    
+    # Remove query parameters and hash fragments
+    url = re.sub(r'[?#].*$', '', url.strip())
+    
+    # Remove trailing slash
+    url = url.rstrip('/')
+    
+    # Extract app name/slug from URL
+    match = re.search(r'apps\.shopify\.com/([^/]+)', url)
+    if not match:
+        return ''
+    
+    app_slug = match.group(1)
+    
+    # Basic validation
+    if not app_slug or len(app_slug) < 2:
+        return ''
+    
+    # Construct clean URL
+    return f'https://apps.shopify.com/{app_slug}'
+
+def app_slug(url: str) -> str:
+    """Stable key for an app: the slug of its canonical listing URL, or '' if there is none."""
+    canonical = clean_url(url)
+    return canonical.rsplit('/', 1)[-1] if canonical else ''
+
+def is_direct_app_url(url: str) -> bool:
+    """Check if URL is a direct app listing (no subdirectories)."""
+    parsed = urlparse(url)
+    path = parsed.path.strip('/')
+    return (
+        parsed.netloc == 'apps.shopify.com' and
+        path and  # Not empty
+        '/' not in path and  # No subdirectories
+        path not in {'categories', 'collections', 'stories', 'partners', 'built-in-features'} and
+        not path.startswith(('categories/', 'collections/', 'stories/', 'partners/', 'built-in-features/'))
+    )
+
 def ensure_dir(path: Union[str, Path]) -> Path:
     """
     Ensure a directory exists, creating it if necessary.